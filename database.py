@@ -5,35 +5,68 @@ Relación con el resto del proyecto:
 - `models.py` define las entidades ORM y hereda de `Base` definida aquí.
 - Los routers usan `get_db()` (Dependency Injection de FastAPI) para obtener
     una sesión de base de datos por request.
-- `init_db()` crea las tablas a partir de los modelos y se invoca desde `main.py`
-    al iniciar la aplicación.
+- `init_db()` crea las tablas a partir de los modelos y se invoca desde el
+    `lifespan` de `main.py` al arrancar el servidor (no al importar).
+
+Arranque perezoso:
+- Importar este módulo no abre conexiones: el `engine` y `SessionLocal` se
+    construyen en el primer acceso (`get_engine()` / `get_sessionmaker()`), de
+    modo que tests, scripts y workers no pagan el coste si no usan la BD.
+- `init_db()` guarda `SCHEMA_VERSION` en la tabla `schema_version` y recuerda
+    por proceso los engines ya verificados; si la versión almacenada coincide
+    se omite `create_all` (que inspecciona cada tabla).
 
 Selección del motor de base de datos:
 - En tiempo de importación resolvemos `DATABASE_URL` usando esta prioridad:
     1) `POSTGRES_DSN` (DSN explícito) > 2) `DATABASE_URL` > 3) fallback SQLite.
     Esto evita que, en entornos de prueba, se "autoconstruya" un DSN Postgres
     inesperado cuando no hay `DATABASE_URL`.
+- Con `DB_PROFILE=1` cada engine creado aquí se instrumenta con
+    `services.profiling` (tiempos por sentencia y ruta, EXPLAIN de las
+    consultas lentas; ver `GET /debug/slow-queries`).
 - Para conexiones directas (diagnóstico) `get_connection()` sí permite construir
     un DSN a partir de `POSTGRES_*` si es necesario.
+
+Réplica de lectura:
+- Con `DATABASE_READ_URL` se crea un segundo engine (`get_read_engine()`) y
+    `get_read_db()` entrega sesiones sobre él a los endpoints de analítica y
+    dashboard; la ingesta sigue usando `get_db()` (escritor).
+- Antes de usar la réplica se mide su retraso (`replica_lag_seconds()`, en
+    caché `REPLICA_LAG_CHECK_SECONDS`): si supera `REPLICA_MAX_LAG_SECONDS` o
+    no responde, la lectura va al escritor.
+- Sin `DATABASE_READ_URL`, `get_read_db()` equivale a `get_db()`.
+    `read_session()` es lo mismo como context manager.
 """
 import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from typing import Generator
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, Column, Integer, Table, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 from sqlalchemy.engine.url import make_url
 
+from services.metrics import register_source
+
+PROJECT_DIR = os.path.dirname(__file__)
+
 # Optional: load environment variables from a local .env file if python-dotenv is
 # installed. This makes it easy to put POSTGRES_* or DATABASE_URL into a
 # non-committed `.env` during local development without changing system env.
+# We point at the project's `.env` directly instead of letting `find_dotenv()`
+# walk the call stack and parent directories on every import.
 try:
     from dotenv import load_dotenv
 
-    load_dotenv()
+    load_dotenv(os.path.join(PROJECT_DIR, ".env"))
 except Exception:
     # dotenv is optional; if not present we simply rely on existing env vars
     pass
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "agrosense.db")
+DB_PATH = os.path.join(PROJECT_DIR, "agrosense.db")
 
 def build_postgres_dsn_from_parts() -> str | None:
     """Build a Postgres DSN from individual POSTGRES_* env vars if they exist.
@@ -83,33 +116,292 @@ except Exception:
 # Para Postgres no se requieren `connect_args` especiales.
 connect_args = {"check_same_thread": False} if _backend == "sqlite" else {}
 
-# Crear el engine (conexión pool) y la factoría de sesiones.
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+# Réplica de lectura opcional (ver `get_read_db`).
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "2"))
+
+# Modo de perfilado (ver `services/profiling.py`); desactivado por defecto.
+DB_PROFILE = os.getenv("DB_PROFILE", "").lower() in ("1", "true", "yes")
+
 Base = declarative_base()
 
+# Versión del esquema declarado en `models.py`. Incrementar cuando cambien las
+# tablas para que `init_db()` vuelva a ejecutar `create_all` en BDs existentes.
+SCHEMA_VERSION = 6
+
+schema_version_table = Table(
+    "schema_version",
+    Base.metadata,
+    Column("version", Integer, nullable=False),
+)
+
+# `engine` y `SessionLocal` se crean bajo demanda (ver `__getattr__`). El lock
+# evita construir dos pools si varios hilos piden el engine a la vez.
+_engine_lock = threading.Lock()
+# Engines cuyo esquema ya se verificó en este proceso.
+_verified_engines: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+
+def _build_engine(url: str) -> Engine:
+    try:
+        backend = make_url(url).get_backend_name()
+    except Exception:
+        backend = None
+    engine = create_engine(url, connect_args={"check_same_thread": False} if backend == "sqlite" else {})
+    if DB_PROFILE:
+        from services.profiling import instrument_engine
+
+        instrument_engine(engine)
+    return engine
+
+
+def _lazy_global(name: str, factory) -> Engine:
+    # Crea `globals()[name]` una sola vez; respeta valores puestos con monkeypatch.
+    value = globals().get(name)
+    if value is None:
+        with _engine_lock:
+            value = globals().get(name)
+            if value is None:
+                value = globals()[name] = factory()
+    return value
+
 
-def init_db() -> None:
+def get_engine() -> Engine:
+    """Devuelve el engine global (escritor), creándolo en el primer uso.
+
+    Si un test sustituye `database.engine` (monkeypatch), se respeta ese valor.
+    """
+    return _lazy_global("engine", lambda: _build_engine(DATABASE_URL))
+
+
+def get_read_engine() -> Engine:
+    """Engine de la réplica de lectura; el escritor si no hay `DATABASE_READ_URL`."""
+    if globals().get("read_engine") is None and not DATABASE_READ_URL:
+        return get_engine()
+    return _lazy_global("read_engine", lambda: _build_engine(DATABASE_READ_URL))
+
+
+def get_sessionmaker() -> sessionmaker:
+    """Devuelve la factoría `SessionLocal`, ligada al engine global."""
+    factory = globals().get("SessionLocal")
+    if factory is None:
+        engine = get_engine()
+        with _engine_lock:
+            factory = globals().get("SessionLocal")
+            if factory is None:
+                factory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+                globals()["SessionLocal"] = factory
+    return factory
+
+
+def __getattr__(name: str):
+    # PEP 562: `database.engine` / `database.SessionLocal` siguen funcionando
+    # para scripts y tests, pero solo se construyen al accederlos.
+    if name == "engine":
+        return get_engine()
+    if name == "read_engine":
+        return get_read_engine()
+    if name == "SessionLocal":
+        return get_sessionmaker()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _stored_schema_version(engine: Engine) -> int | None:
+    """Lee la versión de esquema guardada o None si la tabla no existe."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(schema_version_table.c.version)).scalar()
+    except DBAPIError:
+        return None
+
+
+def init_db(engine: Engine | None = None) -> None:
     """Crea las tablas a partir de los modelos declarados en `models.py`.
 
     Importamos dentro de la función para registrar los modelos en `Base`
-    antes de ejecutar `create_all`.
+    antes de ejecutar `create_all`. Si la BD ya declara `SCHEMA_VERSION`
+    solo se hace un SELECT, y en llamadas posteriores del mismo proceso ni eso.
+    Si la versión es anterior se aplican las migraciones de `migrations.py`.
+    `engine` permite preparar otra base (p. ej. un shard); por defecto el global.
     """
     # Import models here to ensure they are registered on Base before create_all
     from models import Sensor  # noqa: F401
+    from migrations import apply_migrations
+
+    engine = engine or get_engine()
+    if engine in _verified_engines:
+        return
+    stored = _stored_schema_version(engine)
+    if stored != SCHEMA_VERSION:
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            # Tablas existentes de versiones anteriores: ALTER/UPDATE de datos
+            apply_migrations(conn, stored or 0)
+            conn.execute(schema_version_table.delete())
+            conn.execute(schema_version_table.insert().values(version=SCHEMA_VERSION))
+    _verified_engines.add(engine)
 
-    Base.metadata.create_all(bind=engine)
+
+def dialect_insert(table, bind):
+    """`INSERT` del dialecto activo, con soporte de `ON CONFLICT` (Postgres/SQLite).
+
+    `bind` puede ser una sesión, conexión o engine.
+    """
+    name = bind.get_bind().dialect.name if isinstance(bind, Session) else bind.dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"ON CONFLICT not supported for dialect {name!r}")
+    return insert(table)
 
 
 def get_db() -> Generator[Session, None, None]:
     """Dependency de FastAPI: abre una sesión por request y la cierra al final."""
-    db = SessionLocal()
+    db = get_sessionmaker()()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+_PG_REPLICA_LAG = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    # Réplica al día (todo lo recibido está aplicado): sin retraso aunque el
+    # primario lleve rato sin escribir
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def _latest_reading(engine: Engine):
+    from models import Sensor
+
+    with engine.connect() as conn:
+        return conn.execute(select(func.max(Sensor.timestamp))).scalar()
+
+
+def replica_lag_seconds(read_engine: Engine, write_engine: Engine) -> float:
+    """Retraso estimado de la réplica en segundos (`inf` si no responde).
+
+    En Postgres con replicación física se pregunta a la propia réplica. Para
+    otros montajes (p. ej. dos ficheros SQLite sincronizados por un proceso
+    externo) se compara la lectura más reciente de cada base; el índice
+    `ix_sensor_data_timestamp` hace de `max(timestamp)` una búsqueda, no un
+    recorrido de la tabla.
+    """
+    try:
+        if read_engine.dialect.name == "postgresql":
+            with read_engine.connect() as conn:
+                return max(0.0, float(conn.exec_driver_sql(_PG_REPLICA_LAG).scalar() or 0))
+        newest_write = _latest_reading(write_engine)
+        newest_read = _latest_reading(read_engine)
+    except DBAPIError:
+        return float("inf")
+    if newest_write is None:
+        return 0.0
+    if newest_read is None:
+        return float("inf")
+    return max(0.0, (newest_write - newest_read).total_seconds())
+
+
+class _ReadRouting:
+    """Caché del último sondeo de retraso y contadores de enrutado.
+
+    Un solo sondeo a la vez (`probe_lock`): cuando caduca `checked_at`, la
+    primera petición mide y las demás siguen con el último retraso conocido;
+    solo esperan si todavía no hay ninguno.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.probe_lock = threading.Lock()
+        self.checked_at = None
+        self.lag = None
+        self.probes = 0
+        self.replica_reads = 0
+        self.writer_fallbacks = 0
+
+    def _probe(self, read_engine: Engine, write_engine: Engine, since: float, last):
+        if not self.probe_lock.acquire(blocking=last is None):
+            return last
+        try:
+            with self.lock:
+                # Otra petición midió mientras esperábamos el lock
+                if self.checked_at is not None and self.checked_at >= since:
+                    return self.lag
+            lag = replica_lag_seconds(read_engine, write_engine)
+            with self.lock:
+                self.checked_at, self.lag = time.monotonic(), lag
+                self.probes += 1
+            return lag
+        finally:
+            self.probe_lock.release()
+
+    def replica_usable(self, read_engine: Engine, write_engine: Engine) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            fresh = self.checked_at is not None and now - self.checked_at < REPLICA_LAG_CHECK_SECONDS
+            lag = self.lag
+        if not fresh:
+            lag = self._probe(read_engine, write_engine, now, lag)
+        usable = lag <= REPLICA_MAX_LAG_SECONDS
+        with self.lock:
+            if usable:
+                self.replica_reads += 1
+            else:
+                self.writer_fallbacks += 1
+        return usable
+
+    def reset(self) -> None:
+        with self.lock:
+            self.checked_at = self.lag = None
+            self.probes = 0
+            self.replica_reads = self.writer_fallbacks = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "replica_configured": bool(DATABASE_READ_URL) or globals().get("read_engine") is not None,
+                "max_lag_seconds": REPLICA_MAX_LAG_SECONDS,
+                "last_lag_seconds": self.lag,
+                "lag_probes": self.probes,
+                "replica_reads": self.replica_reads,
+                "writer_fallbacks": self.writer_fallbacks,
+            }
+
+
+read_routing = _ReadRouting()
+
+register_source("read_routing", read_routing.stats)
+
+
+def get_read_db() -> Generator[Session, None, None]:
+    """Dependency de FastAPI para endpoints de solo lectura.
+
+    Usa la réplica si existe y está al día; si no, el escritor (`get_db`).
+    """
+    read_engine = get_read_engine()
+    write_engine = get_engine()
+    if read_engine is write_engine or not read_routing.replica_usable(read_engine, write_engine):
+        yield from get_db()
+        return
+    db = Session(bind=read_engine, autoflush=False)
     try:
         yield db
     finally:
         db.close()
 
 
+@contextmanager
+def read_session() -> Generator[Session, None, None]:
+    """`get_read_db` como context manager, para trabajo fuera del ciclo de la
+    petición (respuestas en streaming, cálculos compartidos entre peticiones)."""
+    yield from get_read_db()
+
+
 def get_connection():
     """Return a direct psycopg2 connection to Postgres.
 
@@ -2,41 +2,94 @@
 Punto de entrada de la aplicación FastAPI.
 
 Relación con otros módulos:
-- Llama a `init_db()` (database.py) para crear tablas si no existen.
-- Registra routers: `sensors`, `analytics`, `dashboard`, `dashboard_html`.
+- Llama a `init_db()` (database.py) desde el `lifespan`, es decir, cuando el
+    servidor arranca y no al importar este módulo. Importar `main` (tests,
+    scripts, workers) no abre conexiones a la base de datos.
+- Registra routers: `sensors`, `analytics`, `dashboard`, `dashboard_html` y
+    `assets` (Plotly vendorizado con caché inmutable) y `metrics`.
+- Instala `CompressionMiddleware` (brotli/gzip) para HTML y JSON.
+- Con `DB_PROFILE=1` añade `ProfilingMiddleware` y el router `debug`
+    (consultas lentas con EXPLAIN y perfiles cProfile).
 - Redirige la raíz `/` hacia la vista HTML del dashboard.
+
+`create_app()` es una factoría: cada llamada devuelve una app nueva. Para
+uvicorn se expone `app` (equivalente a `uvicorn main:create_app --factory`).
 """
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import RedirectResponse
+import database
 from database import init_db
-from routers import sensors, dashboard, analytics, dashboard_html
+from routers import sensors, dashboard, analytics, dashboard_html, assets, debug, metrics
+from services.executor import analytics_executor
+from services.http_cache import CompressionMiddleware
+from services.ring_buffer import ring_store
+from services.sensor_summary import summary_refresher
+from services.sharding import init_shards, session_factories, write_engines
+from services.shared_aggregates import shared_aggregates
+from services.trend import trend_store
+from services.profiling import ProfilingMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicializa la BD antes de servir la primera petición.
 
+    `init_db()` es síncrono (hace I/O), así que se ejecuta en el threadpool
+    para no bloquear el event loop durante el arranque (también en cada shard
+    de `SHARD_URLS`, ver `services.sharding`); después se precargan
+    los rings de lecturas recientes (`services.ring_buffer`) y el estado de
+    tendencia por sensor (`services.trend`) y, si está activo, se abre y
+    reconstruye el segmento de agregados compartido entre workers
+    (`services.shared_aggregates`). Al apagar se cierra el
+    pool de procesos de analítica (`services.executor`). Mientras tanto, una
+    tarea de fondo refresca el resumen por sensor (`services.sensor_summary`).
+    """
+    await run_in_threadpool(init_db)
+    await run_in_threadpool(init_shards)
+    await run_in_threadpool(shared_aggregates.start, session_factories)
+    for i, factory in enumerate(session_factories()):
+        # Con shards, cada uno aporta sus lecturas; solo el primero vacía el estado
+        await run_in_threadpool(ring_store.warm, factory, clear=i == 0)
+        await run_in_threadpool(trend_store.backfill, factory, clear=i == 0)
+    refresher = asyncio.create_task(summary_refresher.run_periodically(write_engines))
+    yield
+    refresher.cancel()
+    analytics_executor.shutdown()
+    shared_aggregates.close()
 
-app = FastAPI(title="AgroSense Tech API")
+
+async def root():
+    """Redirige la raíz a la vista HTML del dashboard (/dashboard/view)."""
+    return RedirectResponse(url="/dashboard/view")
 
 
 def create_app() -> FastAPI:
-    # Inicializa la BD y registra las rutas de la API y la vista HTML.
-    init_db()
+    # Registra las rutas de la API y la vista HTML; la BD se prepara en `lifespan`.
+    app = FastAPI(title="AgroSense Tech API", lifespan=lifespan)
     app.include_router(sensors.router)
     app.include_router(dashboard.router)
     app.include_router(analytics.router)
     app.include_router(dashboard_html.router)
+    app.include_router(assets.router)
+    app.include_router(metrics.router)
+    app.add_middleware(CompressionMiddleware)
+    if database.DB_PROFILE:
+        app.include_router(debug.router)
+        # Último en añadirse = más externo: el contexto cubre toda la petición
+        app.add_middleware(ProfilingMiddleware)
+    app.add_api_route("/", root, methods=["GET"])
     return app
 
 
 app = create_app()
 
 
-@app.get("/")
-async def root():
-    """Redirige la raíz a la vista HTML del dashboard (/dashboard/view)."""
-    return RedirectResponse(url="/dashboard/view")
-
-
 if __name__ == "__main__":
     import uvicorn
 
     # Arranque de desarrollo con recarga automática
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
-
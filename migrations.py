@@ -0,0 +1,123 @@
+"""
+Migraciones de datos entre versiones de esquema.
+
+Relación con otros módulos:
+- `database.init_db()` ejecuta `create_all` (tablas nuevas) y después
+    `apply_migrations()` con la versión almacenada en `schema_version`.
+- Cada migración es idempotente: inspecciona el esquema real antes de tocarlo,
+    así que sobre una BD nueva (creada ya con el esquema actual) no hace nada.
+
+Mientras el proyecto no use Alembic, este módulo cubre los cambios que
+`create_all` no sabe aplicar sobre tablas existentes (ALTER/UPDATE).
+"""
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+
+# Vista de `scripts/seed_data.sql`, ya sobre la dimensión `sensors`
+SENSOR_METRICS_VIEW = """
+CREATE VIEW sensor_metrics AS
+SELECT
+    s.code AS sensor_id,
+    ROUND(AVG(temperature), 2) AS avg_temp,
+    ROUND(AVG(humidity), 2) AS avg_humidity,
+    ROUND(AVG(ph), 2) AS avg_ph,
+    ROUND(AVG(light), 2) AS avg_light,
+    MAX(temperature) AS max_temp,
+    MIN(temperature) AS min_temp,
+    MAX(humidity) AS max_humidity,
+    MIN(humidity) AS min_humidity,
+    MAX(light) AS max_light,
+    MIN(light) AS min_light
+FROM sensor_data d
+JOIN sensors s ON s.id = d.sensor_key
+GROUP BY s.code
+"""
+
+
+def migrate_v2_sensor_dimension(conn: Connection) -> None:
+    """`sensor_data.sensor_id` (texto) -> `sensor_data.sensor_key` (FK a `sensors`).
+
+    Pasos: registrar cada código distinto en `sensors`, rellenar la FK entera,
+    indexarla y eliminar la columna de texto. La vista `sensor_metrics` del
+    seed original depende de `sensor_id` (Postgres no deja borrar la columna):
+    se elimina antes y se vuelve a crear sobre `sensors.code`.
+    """
+    insp = inspect(conn)
+    if "sensor_data" not in insp.get_table_names():
+        return
+    columns = {c["name"] for c in insp.get_columns("sensor_data")}
+    if "sensor_id" not in columns:
+        return
+    if "sensor_key" not in columns:
+        conn.exec_driver_sql("ALTER TABLE sensor_data ADD COLUMN sensor_key INTEGER REFERENCES sensors(id)")
+    conn.exec_driver_sql(
+        "INSERT INTO sensors (code) "
+        "SELECT DISTINCT sensor_id FROM sensor_data "
+        "WHERE sensor_id IS NOT NULL AND sensor_id NOT IN (SELECT code FROM sensors)"
+    )
+    conn.exec_driver_sql(
+        "UPDATE sensor_data SET sensor_key = "
+        "(SELECT id FROM sensors WHERE sensors.code = sensor_data.sensor_id) "
+        "WHERE sensor_id IS NOT NULL"
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_sensor_data_sensor_key ON sensor_data (sensor_key)")
+    had_view = "sensor_metrics" in insp.get_view_names()
+    conn.exec_driver_sql("DROP VIEW IF EXISTS sensor_metrics")
+    conn.exec_driver_sql("ALTER TABLE sensor_data DROP COLUMN sensor_id")
+    if had_view:
+        conn.exec_driver_sql(SENSOR_METRICS_VIEW)
+
+
+def migrate_v4_unique_readings(conn: Connection) -> None:
+    """Índice único (sensor_key, timestamp), eliminando antes los duplicados.
+
+    De cada grupo duplicado se conserva la lectura más antigua (menor `id`).
+    Las filas con clave o timestamp NULL nunca colisionan en un índice único.
+    """
+    insp = inspect(conn)
+    if "sensor_data" not in insp.get_table_names():
+        return
+    if any(ix["name"] == "uq_sensor_reading" for ix in insp.get_indexes("sensor_data")):
+        return
+    conn.exec_driver_sql(
+        "DELETE FROM sensor_data WHERE sensor_key IS NOT NULL AND timestamp IS NOT NULL AND id NOT IN ("
+        "SELECT MIN(id) FROM sensor_data WHERE sensor_key IS NOT NULL AND timestamp IS NOT NULL "
+        "GROUP BY sensor_key, timestamp)"
+    )
+    conn.exec_driver_sql("CREATE UNIQUE INDEX uq_sensor_reading ON sensor_data (sensor_key, timestamp)")
+
+
+def migrate_v5_sensor_summary(conn: Connection) -> None:
+    """Vista materializada (Postgres) o tabla (SQLite) `sensor_summary`."""
+    from services.sensor_summary import ensure_storage
+
+    insp = inspect(conn)
+    if "sensor_data" not in insp.get_table_names():
+        return
+    ensure_storage(conn)
+
+
+def migrate_v6_timestamp_index(conn: Connection) -> None:
+    """Índice sobre `sensor_data.timestamp` (ningún otro empieza por esa columna)."""
+    insp = inspect(conn)
+    if "sensor_data" not in insp.get_table_names():
+        return
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_sensor_data_timestamp ON sensor_data (timestamp)")
+
+
+# (versión destino, función). Mantener en orden ascendente.
+MIGRATIONS: List[Tuple[int, Callable[[Connection], None]]] = [
+    (2, migrate_v2_sensor_dimension),
+    (4, migrate_v4_unique_readings),
+    (5, migrate_v5_sensor_summary),
+    (6, migrate_v6_timestamp_index),
+]
+
+
+def apply_migrations(conn: Connection, from_version: int) -> None:
+    """Aplica, dentro de la transacción de `conn`, las migraciones pendientes."""
+    for version, migrate in MIGRATIONS:
+        if version > from_version:
+            migrate(conn)
@@ -4,32 +4,98 @@ Modelos de datos y esquemas (SQLAlchemy + Pydantic).
 Relación con otros módulos:
 - `database.Base` se usa como clase base para los modelos ORM.
 - Los routers crean/consultan instancias de `Sensor` mediante sesiones de `database.get_db`.
+- `SensorDevice` (tabla `sensors`) es la dimensión de dispositivos: cada lectura
+  guarda solo la clave entera `sensor_key`; el código externo (`sensor_id` en la
+  API) se resuelve con `services.sensor_registry`.
+- `SensorBlock` guarda lecturas antiguas compactadas (un bloque por sensor y
+  día); `services.readings` combina filas "calientes" y bloques al consultar.
 - Los esquemas Pydantic (`SensorCreate`, `SensorOut`) definen el shape de entrada/salida
   en los endpoints, validando y serializando datos.
 """
 from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from typing import List, Literal, Optional
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, ForeignKey, LargeBinary, UniqueConstraint, Index
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from database import Base
 
 
+class SensorDevice(Base):
+    """Dimensión de sensores: un registro por dispositivo físico.
+
+    `code` es el identificador externo que envían los gateways (p. ej. `S-101`);
+    `id` es la clave entera compacta que referencian las lecturas.
+    """
+    __tablename__ = "sensors"
+    id = Column(Integer, primary_key=True)
+    code = Column(String(64), nullable=False, unique=True)
+    name = Column(String, nullable=True)
+    location = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class Sensor(Base):
     """Entidad persistente para lecturas de sensores.
 
     Cada fila representa una lectura (temperatura, humedad, pH y luz), con un
     timestamp de creación en servidor. Este modelo mapea a la tabla `sensor_data`.
+    El dispositivo se referencia por `sensor_key` (FK a `sensors.id`). Una
+    lectura es única por (sensor, timestamp): los reintentos de los gateways se
+    descartan con `ON CONFLICT` (ver `services.ingest`). `timestamp` tiene
+    índice propio para `max(timestamp)` y las ventanas sin filtro de sensor
+    (sondeo de la réplica en `database.replica_lag_seconds`).
     """
     __tablename__ = "sensor_data"
+    __table_args__ = (Index("uq_sensor_reading", "sensor_key", "timestamp", unique=True),)
     id = Column(Integer, primary_key=True, index=True)
-    sensor_id = Column(String, nullable=True)
+    sensor_key = Column(Integer, ForeignKey("sensors.id"), nullable=True, index=True)
     temperature = Column(Float, nullable=False)
     humidity = Column(Float, nullable=False)
     ph = Column(Float, nullable=False)
     light = Column(Float, nullable=False)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    device = relationship(SensorDevice)
+
+    @property
+    def sensor_id(self) -> Optional[str]:
+        """Código externo del sensor (lo que la API expone como `sensor_id`)."""
+        return self.device.code if self.device is not None else None
+
+
+class SensorBlock(Base):
+    """Lecturas de un sensor y un día empaquetadas en columnas comprimidas.
+
+    Los blobs usan el formato de `services.columnar`. Las columnas `*_sum`,
+    `*_min` y `*_max` permiten agregar bloques completos sin descomprimirlos.
+    """
+    __tablename__ = "sensor_data_blocks"
+    __table_args__ = (UniqueConstraint("sensor_key", "day", name="uq_sensor_block_day"),)
+    id = Column(Integer, primary_key=True)
+    sensor_key = Column(Integer, ForeignKey("sensors.id"), nullable=True, index=True)
+    day = Column(Date, nullable=False, index=True)
+    count = Column(Integer, nullable=False)
+    ts_start = Column(DateTime(timezone=True), nullable=False)
+    ts_end = Column(DateTime(timezone=True), nullable=False)
+    timestamps = Column(LargeBinary, nullable=False)
+    temperature = Column(LargeBinary, nullable=False)
+    humidity = Column(LargeBinary, nullable=False)
+    ph = Column(LargeBinary, nullable=False)
+    light = Column(LargeBinary, nullable=False)
+    temperature_sum = Column(Float, nullable=False)
+    temperature_min = Column(Float, nullable=False)
+    temperature_max = Column(Float, nullable=False)
+    humidity_sum = Column(Float, nullable=False)
+    humidity_min = Column(Float, nullable=False)
+    humidity_max = Column(Float, nullable=False)
+    ph_sum = Column(Float, nullable=False)
+    ph_min = Column(Float, nullable=False)
+    ph_max = Column(Float, nullable=False)
+    light_sum = Column(Float, nullable=False)
+    light_min = Column(Float, nullable=False)
+    light_max = Column(Float, nullable=False)
 
 
 class SensorCreate(BaseModel):
@@ -42,6 +108,18 @@ class SensorCreate(BaseModel):
     timestamp: Optional[datetime] = None
 
 
+class SensorBatch(BaseModel):
+    """Esquema de entrada de `POST /sensor-data/batch`.
+
+    `idempotency_key` identifica el lote: si el cliente lo reenvía (timeout),
+    se devuelve el resultado original sin volver a escribir.
+    `on_conflict="update"` sobrescribe las lecturas ya existentes.
+    """
+    readings: List[SensorCreate]
+    idempotency_key: Optional[str] = None
+    on_conflict: Literal["ignore", "update"] = "ignore"
+
+
 class SensorOut(BaseModel):
     """Esquema de salida típico al devolver lecturas persistidas."""
     id: int
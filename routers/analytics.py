@@ -2,16 +2,49 @@
 Endpoints y lógica de análisis: agrega métricas a partir de lecturas almacenadas.
 
 Relación con otros módulos:
-- Lee `models.Sensor` mediante una sesión de DB inyectada (`get_db`).
-- La función `process_data` es utilizada también por `dashboard.py` y
-    `dashboard_html.py` para unificar el cálculo de métricas.
+- Lee las métricas mediante una sesión de solo lectura (`get_read_db`: la
+    réplica si está configurada y al día, si no el escritor) y
+    `services.readings`, que agrega en SQL filas calientes y bloques compactados.
+- `process_data` es la versión en memoria (lista de dicts) del mismo cálculo;
+    `services.readings.summarize` devuelve exactamente el mismo formato.
+- Los cálculos pesados (percentiles...) no se hacen en el handler: se cargan
+    las columnas en el threadpool y el kernel de `services.kernels` se ejecuta
+    en `services.executor.analytics_executor` (pool de procesos).
+- Las ventanas recientes (`window_minutes`, `start`...) se responden desde
+    los rings en memoria de `services.ring_buffer` cuando los cubren.
+- `GET /analytics/series` devuelve las series temporales reducidas con LTTB
+    (`services.kernels.lttb_series`) para las gráficas del dashboard.
+- `GET /analytics/correlation` calcula la matriz de Pearson entre series
+    sensor×métrica alineadas en una rejilla temporal (`services.kernels`).
+- `GET /analytics/trend` devuelve pendiente, media móvil y previsión de un
+    sensor desde el estado incremental de `services.trend` (sin consultar
+    lecturas).
+- Con `SHARD_URLS` las agregaciones y cargas de columnas recorren todos los
+    shards en paralelo (`services.sharding`); los handlers no cambian.
+- `/analytics` sin ventana y `/analytics/sensors` se responden desde el
+    segmento compartido entre workers de `services.shared_aggregates` si
+    está activo (`SHARED_AGGREGATES_NAME`).
+- `GET /analytics/sensors` lee el resumen por sensor precalculado de
+    `services.sensor_summary` (vista materializada en Postgres).
 """
+from datetime import datetime, timedelta, timezone
 from statistics import mean
-from typing import List, Dict
-from fastapi import APIRouter, Depends
+from typing import List, Dict, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from database import get_db
-from models import Sensor
+from database import get_read_db, read_session
+from services import kernels
+from services.executor import AnalyticsTimeout, analytics_executor
+from services.cache import FragmentCache, data_generation
+from services.readings import METRICS, summarize, to_micros
+from services.sensor_summary import read_summary, summary_refresher
+from services.ring_buffer import ring_store
+from services.sensor_registry import registry
+from services.sharding import aggregate, load_columns, read_summaries, write_engines
+from services.shared_aggregates import shared_aggregates
+from services.singleflight import singleflight
+from services.trend import trend_store
 
 router = APIRouter()
 
@@ -63,20 +96,54 @@ def process_data(sensor_data: List[Dict]) -> Dict:
     return metrics
 
 
+def resolve_window(window_minutes: Optional[int], start: Optional[datetime],
+                   end: Optional[datetime]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """`window_minutes` = últimos N minutos hasta ahora; si no, `[start, end)`."""
+    if window_minutes is not None:
+        return datetime.now(timezone.utc) - timedelta(minutes=window_minutes), None
+    return start, end
+
+
+def _aggregate(start, end, sensor_key):
+    # Sesión propia: el cálculo puede sobrevivir a la petición que lo lanzó
+    with read_session() as db:
+        return aggregate(db, start, end, sensor_key)
+
+
 @router.get("/analytics")
-async def get_analytics(db: Session = Depends(get_db)):
-    """Devuelve métricas calculadas para todas las lecturas almacenadas.
+async def get_analytics(
+    window_minutes: Optional[int] = Query(None, gt=0),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    sensor_id: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Devuelve métricas calculadas para las lecturas almacenadas.
+
+    Sin parámetros agrega todo el histórico; `window_minutes` o `start`/`end`
+    acotan la ventana y `sensor_id` filtra un sensor.
 
-    Relación con el bloque siguiente: primero leemos todas las filas `Sensor`,
-    transformamos a una lista de dicts simples y llamamos a `process_data`.
-    Si no hay datos, devolvemos shapes vacíos para que el dashboard no falle.
+    Relación con el bloque siguiente: las ventanas recientes se responden
+    desde `services.ring_buffer` y el histórico completo desde el segmento
+    compartido de `services.shared_aggregates` (si está activo), sin consultar
+    la BD; el resto lo agrega la BD
+    (filas y bloques compactados) en el threadpool, una sola vez para todas las
+    peticiones idénticas simultáneas (`services.singleflight`). `summarize` da el mismo formato que
+    `process_data`. Si no hay datos, devolvemos shapes vacíos para que el
+    dashboard no falle.
     """
-    sensors = db.query(Sensor).all()
-    readings = [
-        {"temperature": s.temperature, "humidity": s.humidity, "ph": s.ph, "light": s.light}
-        for s in sensors
-    ]
-    if not readings:
+    # Clave con los parámetros tal como llegan: `window_minutes` se resuelve
+    # a un `start` distinto en cada petición y no coalescería nunca
+    key = ("analytics", window_minutes, start, end, sensor_id, data_generation())
+    start, end = resolve_window(window_minutes, start, end)
+    sensor_key = resolve_sensor_filter(db, sensor_id)
+    partials = ring_store.aggregate(start, end, sensor_key)
+    if partials is None and start is None and end is None:
+        partials = shared_aggregates.totals(sensor_key)
+    if partials is None:
+        partials = await singleflight.do(key, lambda: _aggregate(start, end, sensor_key))
+    processed = summarize(partials)
+    if not processed:
         # return empty metric shapes
         return {
             "temperature": {},
@@ -84,6 +151,203 @@ async def get_analytics(db: Session = Depends(get_db)):
             "ph": {},
             "light": {},
         }
-    processed = process_data(readings)
-    # process_data returns a 'metrics' nested dict with temperature/humidity/light
+    # summarize returns a 'metrics' nested dict with temperature/humidity/light
     return processed.get("metrics", {})
+
+
+def resolve_sensor_filter(db: Session, sensor_id: Optional[str]) -> Optional[int]:
+    """`sensor_key` del filtro `sensor_id` (None = todos); 404 si no existe."""
+    if sensor_id is None:
+        return None
+    key = registry.lookup(db, sensor_id)
+    if key is None:
+        raise HTTPException(status_code=404, detail=f"Unknown sensor_id {sensor_id!r}")
+    return key
+
+
+async def run_heavy(kernel, columns, params: Dict):
+    """Despacha un kernel al pool de procesos; 504 si vence el timeout y 422
+    si el kernel rechaza la entrada (`KernelInputError`)."""
+    try:
+        return await analytics_executor.run(kernel, columns, params)
+    except AnalyticsTimeout as exc:
+        raise HTTPException(status_code=504, detail=str(exc))
+    except kernels.KernelInputError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
+@router.get("/analytics/percentiles")
+async def get_percentiles(
+    q: str = "50,90,99",
+    metric: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    sensor_id: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Percentiles por métrica en la ventana `[start, end)` (todas por defecto).
+
+    Relación con el bloque siguiente: la lectura de filas y bloques es I/O y va
+    al threadpool; el cálculo numpy va al pool de procesos, así que el event
+    loop sigue atendiendo la ingesta mientras tanto.
+    """
+    try:
+        qs = [float(v) for v in q.split(",") if v.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="q must be a comma-separated list of numbers")
+    if not qs or any(not 0 <= v <= 100 for v in qs):
+        raise HTTPException(status_code=422, detail="percentiles must be between 0 and 100")
+    metrics = list(METRICS) if metric is None else [metric]
+    if any(m not in METRICS for m in metrics):
+        raise HTTPException(status_code=422, detail=f"metric must be one of {', '.join(METRICS)}")
+
+    sensor_key = resolve_sensor_filter(db, sensor_id)
+    columns = ring_store.columns(start, end, sensor_key)
+    if columns is None:
+        columns = await run_in_threadpool(load_columns, db, start, end, sensor_key)
+    return await run_heavy(kernels.percentiles, columns, {"q": qs, "metrics": metrics})
+
+
+SERIES_MAX_POINTS = 5000
+# Resultados de correlación por ventana y generación de datos (ver `get_correlation`).
+correlation_cache = FragmentCache(maxsize=32)
+
+
+@router.get("/analytics/correlation")
+async def get_correlation(
+    window_minutes: Optional[int] = Query(None, gt=0),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: int = Query(300, gt=0, description="segundos por intervalo de la rejilla"),
+    metric: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Correlación de Pearson entre todas las series sensor×métrica de la ventana.
+
+    Relación con el bloque siguiente: las lecturas se alinean en intervalos de
+    `resolution` segundos (media por intervalo) y la matriz completa se calcula
+    en el pool de procesos (`services.kernels.correlation`). `metric` acepta
+    una lista separada por comas para limitar las series. El resultado se
+    guarda por ventana y generación de datos: repetir la consulta sin
+    escrituras nuevas no recalcula nada.
+    """
+    metrics = list(METRICS) if metric is None else [m.strip() for m in metric.split(",") if m.strip()]
+    if not metrics or any(m not in METRICS for m in metrics):
+        raise HTTPException(status_code=422, detail=f"metric must be one of {', '.join(METRICS)}")
+    key = ("correlation", window_minutes, start, end, resolution, tuple(metrics), data_generation())
+    cached = correlation_cache.get(key)
+    if cached is not None:
+        return cached
+
+    start, end = resolve_window(window_minutes, start, end)
+    columns = ring_store.columns(start, end)
+    if columns is None:
+        columns = await run_in_threadpool(load_columns, db, start, end)
+    params = {
+        "metrics": metrics,
+        "resolution_us": resolution * 1_000_000,
+        "start_us": to_micros(start) if start is not None else None,
+    }
+    result = await run_heavy(kernels.correlation, columns, params)
+    codes = registry.codes_for(db, result["keys"])
+    response = {
+        "resolution_seconds": resolution,
+        "bins": result["bins"],
+        "series": [
+            {"sensor_id": codes.get(k, "unassigned"), "metric": m} for k in result["keys"] for m in result["metrics"]
+        ],
+        "matrix": result["matrix"],
+        "overlap": result["overlap"],
+    }
+    return correlation_cache.put(key, response)
+
+
+@router.get("/analytics/series")
+async def get_series(
+    window_minutes: Optional[int] = Query(None, gt=0),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    sensor_id: Optional[str] = None,
+    metric: Optional[str] = None,
+    points: int = Query(500, ge=3, le=SERIES_MAX_POINTS),
+    db: Session = Depends(get_read_db),
+):
+    """Serie temporal por sensor y métrica, reducida a `points` puntos con LTTB.
+
+    Relación con el bloque siguiente: las columnas salen del ring (ventanas
+    recientes) o de la BD en el threadpool; la reducción se hace en el pool de
+    procesos. Cada serie trae `t` (epoch en ms) y `v`; el tamaño de la
+    respuesta depende de `points`, no del rango de tiempo.
+    """
+    metrics = list(METRICS) if metric is None else [metric]
+    if any(m not in METRICS for m in metrics):
+        raise HTTPException(status_code=422, detail=f"metric must be one of {', '.join(METRICS)}")
+    start, end = resolve_window(window_minutes, start, end)
+    sensor_key = resolve_sensor_filter(db, sensor_id)
+    columns = ring_store.columns(start, end, sensor_key)
+    if columns is None:
+        columns = await run_in_threadpool(load_columns, db, start, end, sensor_key)
+    result = await run_heavy(kernels.lttb_series, columns, {"points": points, "metrics": metrics})
+    codes = registry.codes_for(db, result["series"])
+    return {
+        "count": result["count"],
+        "points": points,
+        "series": {codes.get(key, "unassigned"): data for key, data in result["series"].items()},
+    }
+
+
+@router.get("/analytics/trend")
+async def get_trend(
+    sensor_id: str,
+    metric: str = "temperature",
+    horizon_minutes: int = Query(60, gt=0, le=7 * 24 * 60),
+    db: Session = Depends(get_read_db),
+):
+    """Tendencia de `metric` para un sensor: pendiente por hora, media móvil y previsión.
+
+    Relación con el bloque siguiente: la BD solo se usa para validar el
+    sensor; el resultado sale de las sumas que mantiene la ingesta, así que
+    el coste no depende del tamaño del histórico. Sin `TREND_ENABLED` no hay
+    estado que consultar: 501.
+    """
+    if not trend_store.enabled:
+        raise HTTPException(status_code=501, detail="trend disabled (set TREND_ENABLED=1, single writer only)")
+    if metric not in METRICS:
+        raise HTTPException(status_code=422, detail=f"metric must be one of {', '.join(METRICS)}")
+    sensor_key = resolve_sensor_filter(db, sensor_id)
+    return {
+        "sensor_id": sensor_id,
+        "metric": metric,
+        "half_life_seconds": trend_store.half_life_seconds,
+        "horizon_minutes": horizon_minutes,
+        **trend_store.trend(sensor_key, metric, horizon_minutes / 60),
+    }
+
+
+@router.get("/analytics/sensors")
+async def get_sensor_metrics(db: Session = Depends(get_read_db)):
+    """avg/min/max por sensor y métrica desde `sensor_summary`.
+
+    Relación con el bloque siguiente: normalmente el resumen lo refresca el
+    bucle del `lifespan`; si aquí ya toca (primer uso, escrituras o antigüedad)
+    se refresca antes de leer. `refreshed_at` indica la frescura de los datos.
+    El refresco escribe, así que va siempre al escritor aunque `db` sea la réplica.
+    Con el segmento de `services.shared_aggregates` activo los valores salen
+    de memoria, al día y sin refresco (`refreshed_at` = ahora).
+    """
+    live = shared_aggregates.per_sensor()
+    if live is not None:
+        data = {"refreshed_at": datetime.now(timezone.utc), "sensors": {}}
+        for key, partials in live.items():
+            summary = summarize(partials)
+            data["sensors"][key] = {"count": summary["count"], **summary["metrics"]}
+    else:
+        await run_in_threadpool(summary_refresher.refresh_if_due, *write_engines())
+        data = await run_in_threadpool(read_summaries, db, read_summary)
+    codes = registry.codes_for(db, data["sensors"])
+    sensors = {codes.get(key, str(key)): metrics for key, metrics in data["sensors"].items()}
+    refreshed_at = data["refreshed_at"] or summary_refresher.refreshed_at
+    return {
+        "refreshed_at": refreshed_at.isoformat() if refreshed_at else None,
+        "sensors": dict(sorted(sensors.items())),
+    }
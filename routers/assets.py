@@ -0,0 +1,61 @@
+"""
+Assets estáticos versionados (fingerprint) con caché inmutable.
+
+Relación con otros módulos:
+- `templates/dashboard.html` carga Plotly desde `asset_url("plotly.min.js")`
+    en lugar del CDN; `dashboard_html.py` pasa esa URL a la plantilla.
+- Usa `services.http_cache` para servir variantes gzip/brotli precomputadas.
+
+La URL incluye un hash del contenido (`plotly-2.35.2.min.<hash>.js`), por lo que
+puede cachearse un año con `immutable`: si el archivo cambia, cambia la URL.
+"""
+import hashlib
+import os
+from functools import lru_cache
+
+from fastapi import APIRouter, HTTPException, Request
+
+from services.http_cache import Representation, cached_response
+
+router = APIRouter()
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Nombre lógico -> archivo vendorizado en `static/`.
+ASSETS = {
+    "plotly.min.js": "vendor/plotly-2.35.2.min.js",
+}
+
+MEDIA_TYPES = {".js": "application/javascript", ".css": "text/css"}
+
+
+@lru_cache(maxsize=None)
+def _load(name: str) -> tuple[str, Representation]:
+    """Lee el asset una vez y devuelve (nombre con fingerprint, representación)."""
+    path = os.path.join(STATIC_DIR, ASSETS[name])
+    with open(path, "rb") as fh:
+        body = fh.read()
+    digest = hashlib.sha256(body).hexdigest()[:12]
+    stem, ext = os.path.splitext(os.path.basename(path))
+    rep = Representation(body, MEDIA_TYPES.get(ext, "application/octet-stream"), etag=f'"{digest}"', quality=9)
+    return f"{stem}.{digest}{ext}", rep
+
+
+@lru_cache(maxsize=None)
+def _by_fingerprint() -> dict:
+    return {_load(name)[0]: _load(name)[1] for name in ASSETS}
+
+
+def asset_url(name: str) -> str:
+    """URL pública (con fingerprint) del asset lógico `name`."""
+    return f"/static/{_load(name)[0]}"
+
+
+@router.get("/static/{filename}", include_in_schema=False)
+async def get_asset(filename: str, request: Request):
+    """Sirve un asset versionado; nombres desconocidos o antiguos dan 404."""
+    rep = _by_fingerprint().get(filename)
+    if rep is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    return await cached_response(request, rep, IMMUTABLE)
@@ -2,31 +2,43 @@
 Endpoint de resumen para el dashboard (JSON).
 
 Relación con otros módulos:
-- Reutiliza `process_data` de `analytics.py` para calcular métricas.
+- Usa `services.readings` (mismo formato que `process_data` de `analytics.py`);
+    la agregación pasa por `services.sharding` (todos los shards si los hay).
 - Sirve como backend JSON para frontends que no usan la plantilla HTML directa.
+- Solo lee: usa `read_session` (réplica de lectura si hay una al día).
+- Las peticiones simultáneas comparten una única agregación
+    (`services.singleflight`, por generación de datos).
 """
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from database import get_db
-from models import Sensor
-from routers.analytics import process_data
+from fastapi import APIRouter
+from database import read_session
+from services.cache import data_generation
+from services.readings import summarize
+from services.sharding import aggregate
+from services.shared_aggregates import shared_aggregates
+from services.singleflight import singleflight
 
 router = APIRouter()
 
 
+def _summary():
+    with read_session() as db:
+        return summarize(aggregate(db))
+
+
 @router.get("/dashboard")
-async def get_dashboard(db: Session = Depends(get_db)):
+async def get_dashboard():
     """Devuelve conteo y métricas agregadas de todas las lecturas.
 
-    Relación con el bloque siguiente: consulta ORM, transforma a dicts simples,
-    llama a `process_data` y fusiona resultados con el conteo total.
+    Relación con el bloque siguiente: agrega en la BD (filas y bloques
+    compactados) en el threadpool; `summarize` ya incluye el conteo total.
+    Con el segmento compartido entre workers (`services.shared_aggregates`)
+    el total sale de memoria sin consultar la BD.
     """
-    sensors = db.query(Sensor).all()
-    readings = [
-        {"temperature": s.temperature, "humidity": s.humidity, "ph": s.ph, "light": s.light}
-        for s in sensors
-    ]
-    if not readings:
+    partials = shared_aggregates.totals()
+    if partials is not None:
+        processed = summarize(partials)
+    else:
+        processed = await singleflight.do(("dashboard", data_generation()), _summary)
+    if not processed:
         return {"count": 0, "metrics": {}}
-    processed = process_data(readings)
-    return {"count": len(readings), **processed}
+    return processed
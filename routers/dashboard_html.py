@@ -2,40 +2,69 @@
 Vista HTML del dashboard (Jinja2Templates).
 
 Relación con otros módulos:
-- Lee datos desde la base usando ORM (no hace llamadas HTTP internas).
-- Reutiliza `process_data` para mantener una única lógica de agregación.
+- Lee datos desde la base usando ORM (no hace llamadas HTTP internas), con la
+    sesión de solo lectura `read_session` (réplica si hay una al día).
+- Reutiliza `services.readings` para mantener una única lógica de agregación
+    (a través de `services.sharding`, que la reparte entre shards si los hay);
+    con el segmento de `services.shared_aggregates` activo no consulta la BD.
 - `templates/dashboard.html` es la plantilla que renderizamos.
+- El HTML renderizado se cachea en `services.cache.fragment_cache` con la
+    generación de datos como clave: mientras no haya escrituras nuevas no se
+    consulta la BD ni se vuelve a renderizar, y el `ETag` permite responder 304.
+    Si llegan varias peticiones antes de que exista el fragmento, solo una
+    lo renderiza (`services.singleflight`) y el resto espera su resultado.
 """
-from fastapi import APIRouter, Request, Depends
+from fastapi import APIRouter, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
-from database import get_db
-from models import Sensor
-from routers.analytics import process_data
+from database import read_session
+from services.readings import summarize
+from services.sharding import aggregate
+from services.shared_aggregates import shared_aggregates
+from routers.assets import asset_url
+from services.cache import data_generation, fragment_cache
+from services.http_cache import Representation, cached_response
+from services.singleflight import singleflight
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 
+# El navegador puede guardar la página pero debe revalidarla (barato: 304).
+HTML_CACHE_CONTROL = "no-cache"
+
+
+def render_dashboard(db: Session) -> Representation:
+    """Agrega métricas y renderiza la plantilla a bytes (sin `Request`)."""
+    partials = shared_aggregates.totals()
+    processed = summarize(partials if partials is not None else aggregate(db))
+    # processed contains top-level aggregates and nested 'metrics'
+    data = processed.get("metrics", {})
+
+    # Los KPIs por ventana los pide la página a /analytics; el total histórico
+    # se renderiza aquí, así que el HTML (y su ETag) cambia con los datos
+    html = templates.get_template("dashboard.html").render(
+        data=data, count=processed.get("count", 0), plotly_src=asset_url("plotly.min.js")
+    )
+    return Representation(html.encode("utf-8"), "text/html; charset=utf-8")
+
+
+def _render_and_store(key) -> Representation:
+    with read_session() as db:
+        return fragment_cache.put(key, render_dashboard(db))
+
 
 @router.get("/dashboard/view", response_class=HTMLResponse)
-async def get_dashboard(request: Request, db: Session = Depends(get_db)):
+async def get_dashboard(request: Request):
     """Renderiza la plantilla y obtiene métricas directamente de la BD.
 
-    Relación con el bloque siguiente: recupera filas ORM, convierte a dicts,
-    calcula métricas y pasa el contexto `data` a la plantilla Jinja2.
+    Relación con el bloque siguiente: si ya existe un fragmento para la
+    generación actual se reutiliza; si no, se agregan las métricas en la BD y
+    se renderiza (en el threadpool, una vez por generación aunque lleguen
+    varias peticiones a la vez). `cached_response` resuelve 304 y compresión.
     """
-    sensors = db.query(Sensor).all()
-    readings = [
-        {"temperature": s.temperature, "humidity": s.humidity, "ph": s.ph, "light": s.light}
-        for s in sensors
-    ]
-    if not readings:
-        data = {}
-    else:
-        processed = process_data(readings)
-        # processed contains top-level aggregates and nested 'metrics'
-        data = processed.get("metrics", {})
-
-    # Starlette >=0.49 expects request as first argument
-    return templates.TemplateResponse(request, "dashboard.html", {"data": data})
+    key = ("dashboard.html", data_generation())
+    rep = fragment_cache.get(key)
+    if rep is None:
+        rep = await singleflight.do(key, lambda: _render_and_store(key))
+    return await cached_response(request, rep, HTML_CACHE_CONTROL)
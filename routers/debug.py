@@ -0,0 +1,35 @@
+"""
+Endpoints de depuración del modo de perfilado (`DB_PROFILE=1`).
+
+Relación con otros módulos:
+- Solo se registra en `main.create_app()` si `database.DB_PROFILE` está activo.
+- Lee el estado en memoria de `services.profiling`: estadísticas por ruta,
+    anillo de consultas lentas (con su EXPLAIN) y perfiles cProfile.
+"""
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from services import profiling
+
+router = APIRouter(prefix="/debug")
+
+
+@router.get("/slow-queries")
+async def slow_queries():
+    """Tiempo de BD por ruta y últimas consultas que superaron `SLOW_QUERY_MS`."""
+    return profiling.snapshot()
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """Perfiles cProfile guardados (id, ruta, duración y peticiones solapadas)."""
+    return profiling.list_profiles()
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: int):
+    """Perfil en formato "folded stacks" (entrada de flamegraph.pl / speedscope)."""
+    entry = profiling.get_profile(profile_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(entry["folded"])
@@ -0,0 +1,19 @@
+"""
+Endpoint de métricas internas del proceso.
+
+Relación con otros módulos:
+- Devuelve lo que registraron los servicios en `services.metrics`
+    (p. ej. `ingest_limits`: límites configurados, peticiones rechazadas,
+    buckets vivos y concurrencia en curso).
+"""
+from fastapi import APIRouter
+
+from services import metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Instantánea JSON de las métricas de este proceso (no agregadas entre workers)."""
+    return metrics.collect()
@@ -2,41 +2,134 @@
 Endpoints de ingestión de datos de sensores.
 
 Relación con otros módulos:
-- Usa `models.Sensor` (ORM) para persistir la lectura recibida.
+- `services.ingest` persiste las lecturas con `INSERT ... ON CONFLICT`: los
+    reintentos de los gateways (misma lectura, mismo sensor y timestamp) no
+    duplican filas ni sesgan los promedios de `/analytics`.
+- El `sensor_id` externo se traduce a la clave entera `sensor_key` con
+    `services.sensor_registry`.
 - Obtiene una sesión de DB con `database.get_db` (dependency de FastAPI).
 - Complementa a `analytics.py` y `dashboard*` que leen estos datos para mostrar métricas.
+- Tras cada escritura avanza la generación de `services.cache` para invalidar
+    los fragmentos cacheados del dashboard.
+- `services.ratelimit` protege la ingesta: 429 (`Retry-After`) si un sensor o
+    cliente supera su caudal y 503 si ya hay demasiadas escrituras en curso.
+    La escritura se hace en el threadpool para no bloquear el event loop.
+- `GET /sensor-data/snapshot` exporta las lecturas en Parquet o Arrow con
+    `services.snapshot`, en streaming y leyendo de la réplica (`get_read_db`).
+    Con shards (`services.sharding`) la ingesta escribe cada lectura en el
+    shard de su sensor y la exportación se hace por shard con el script.
 """
-from fastapi import APIRouter, HTTPException, Depends
-from datetime import datetime, timezone
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterable, Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from models import SensorCreate, Sensor
-from database import get_db
+from models import SensorBatch, SensorCreate
+from database import get_db, get_read_db, read_session
+from routers.analytics import resolve_sensor_filter
+from services import sharding, snapshot
+from services.ingest import IdempotencyKeyReused, ingest_batch, ingest_readings
+from services.ratelimit import (
+    Overloaded,
+    RateLimited,
+    client_key,
+    ingest_concurrency,
+    ingest_limiter,
+    retry_after_header,
+)
 
 router = APIRouter()
 
 
+@contextmanager
+def ingest_guard(request: Request, sensor_ids: Iterable[Optional[str]]):
+    """Aplica los límites de caudal y reserva un hueco de concurrencia."""
+    try:
+        ingest_limiter.check(client_key(request), sensor_ids)
+    except RateLimited as exc:
+        raise HTTPException(status_code=429, detail=str(exc), headers=retry_after_header(exc.retry_after))
+    try:
+        ingest_concurrency.acquire()
+    except Overloaded as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers=retry_after_header(1))
+    try:
+        yield
+    finally:
+        ingest_concurrency.release()
+
+
 @router.post("/sensor-data")
-async def receive_sensor(data: SensorCreate, db: Session = Depends(get_db)):
+async def receive_sensor(
+    data: SensorCreate,
+    request: Request,
+    on_conflict: Literal["ignore", "update"] = "ignore",
+    db: Session = Depends(get_db),
+):
     """Recibe JSON de una lectura y la persiste en la base de datos configurada.
 
-    Relación con el siguiente bloque: tras construir la entidad `Sensor`,
-    se añade a la sesión y se hace `commit`; si todo sale bien, devolvemos éxito.
-    Si hay error, hacemos rollback y propagamos 500.
+    Relación con el siguiente bloque: `ingest_readings` inserta y hace
+    `commit`; la respuesta indica si la lectura era nueva o un duplicado.
+    Si hay error, el servicio hace rollback y propagamos 500.
     """
-    ts = data.timestamp if data.timestamp else datetime.now(timezone.utc)
-    sensor = Sensor(
-        sensor_id=data.sensor_id,
-        temperature=data.temperature,
-        humidity=data.humidity,
-        ph=data.ph,
-        light=data.light,
-        timestamp=ts,
-    )
+    with ingest_guard(request, [data.sensor_id]):
+        try:
+            result = await run_in_threadpool(ingest_readings, db, [data], on_conflict)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "success", **result}
+
+
+@router.post("/sensor-data/batch")
+async def receive_sensor_batch(batch: SensorBatch, request: Request, db: Session = Depends(get_db)):
+    """Recibe un lote de lecturas y lo inserta con una sentencia por trozo.
+
+    Si el lote trae `idempotency_key` y ya se procesó, se devuelve el mismo
+    resultado con `replayed: true` sin volver a escribir; si la clave llega con
+    otras lecturas se responde 409 (no es un reenvío).
+    """
+    with ingest_guard(request, (r.sensor_id for r in batch.readings)):
+        try:
+            result = await run_in_threadpool(
+                ingest_batch, db, batch.readings, batch.on_conflict, batch.idempotency_key
+            )
+        except IdempotencyKeyReused as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "success", **result}
+
+
+@router.get("/sensor-data/snapshot")
+async def get_snapshot(
+    format: Literal["parquet", "arrow"] = "parquet",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    sensor_id: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Descarga las lecturas de `[start, end)` como fichero Parquet o Arrow IPC.
+
+    Relación con el bloque siguiente: aquí solo se valida (sensor, pyarrow);
+    el cuerpo lo genera `stream_snapshot` grupo a grupo con su propia sesión,
+    así que la memoria no crece con el tamaño del histórico.
+    """
+    sensor_key = resolve_sensor_filter(db, sensor_id)
+    if sharding.shards.enabled:
+        raise HTTPException(
+            status_code=501,
+            detail="snapshot export is per shard: run scripts/export_snapshot.py with DATABASE_URL set to each shard",
+        )
     try:
-        db.add(sensor)
-        db.commit()
-        db.refresh(sensor)
-        return {"status": "success"}
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
+        snapshot.require_pyarrow()
+    except snapshot.SnapshotUnavailable as exc:
+        raise HTTPException(status_code=501, detail=str(exc))
+    media_type, extension = snapshot.FORMATS[format]
+    body = snapshot.stream_snapshot(read_session, format, start, end, sensor_key)
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="agrosense-snapshot.{extension}"'},
+    )
@@ -0,0 +1,36 @@
+"""Compact old sensor readings into compressed per-(sensor, day) blocks.
+
+Readings older than `--days` (default `COMPACTION_AGE_DAYS`, 90) are moved from
+`sensor_data` to `sensor_data_blocks`. Analytics keep returning the same
+results. Schedule it daily (cron / Task Scheduler):
+
+    python scripts/compact_readings.py --days 90
+"""
+import argparse
+import os
+import sys
+
+# make project root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from database import SessionLocal, init_db
+from services.compaction import COMPACTION_AGE_DAYS, compact
+
+
+def main():
+    """Ejecuta una pasada de compactación e imprime cuántas filas se movieron."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=COMPACTION_AGE_DAYS, help="edad mínima en días")
+    args = parser.parse_args()
+
+    init_db()
+    session = SessionLocal()
+    try:
+        stats = compact(session, older_than_days=args.days)
+    finally:
+        session.close()
+    print(f"Compacted {stats['rows']} readings into {stats['blocks']} blocks (cutoff {stats['cutoff']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Export sensor readings to a Parquet or Arrow IPC file for offline analysis.
+
+Reads `sensor_data` and the compacted blocks in bounded chunks, so memory does
+not grow with the history size. Load the result with pandas/pyarrow:
+
+    python scripts/export_snapshot.py readings.parquet --start 2025-01-01
+    python -c "import pandas as pd; print(pd.read_parquet('readings.parquet'))"
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+# make project root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from database import SessionLocal, init_db
+from services.sensor_registry import registry
+from services.snapshot import FORMATS, SNAPSHOT_ROW_GROUP_ROWS, write_snapshot
+
+
+def main(argv=None):
+    """Escribe el snapshot en `output` e imprime cuántas lecturas exportó."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="fichero de salida (.parquet / .arrow)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default=None,
+                        help="por defecto se deduce de la extensión (parquet si no es .arrow)")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None, help="ISO 8601, incluido")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="ISO 8601, excluido")
+    parser.add_argument("--sensor-id", default=None)
+    parser.add_argument("--row-group-rows", type=int, default=SNAPSHOT_ROW_GROUP_ROWS)
+    args = parser.parse_args(argv)
+    fmt = args.format or ("arrow" if args.output.endswith((".arrow", ".arrows")) else "parquet")
+
+    init_db()
+    session = SessionLocal()
+    try:
+        sensor_key = None
+        if args.sensor_id is not None:
+            sensor_key = registry.lookup(session, args.sensor_id)
+            if sensor_key is None:
+                parser.error(f"unknown sensor_id {args.sensor_id!r}")
+        rows = write_snapshot(session, args.output, fmt, args.start, args.end, sensor_key, args.row_group_rows)
+    finally:
+        session.close()
+    print(f"Exported {rows} readings to {args.output} ({fmt})")
+
+
+if __name__ == "__main__":
+    main()
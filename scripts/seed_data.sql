@@ -5,15 +5,27 @@
 
 
 -- ======================
--- Tabla: sensor_data
+-- Tablas: sensors (dimensión) y sensor_data (lecturas)
 -- ======================
--- Drop dependent view first if it exists (Postgres will prevent dropping table otherwise)
+-- Drop dependent views first if they exist (Postgres will prevent dropping table otherwise)
 DROP VIEW IF EXISTS sensor_metrics;
+-- Resumen por sensor de la API (GET /analytics/sensors); lo recrea seed_from_sql.py
+DROP MATERIALIZED VIEW IF EXISTS sensor_summary;
+DROP TABLE IF EXISTS sensor_data_blocks;
 DROP TABLE IF EXISTS sensor_data;
+DROP TABLE IF EXISTS sensors;
+
+CREATE TABLE sensors (
+    id SERIAL PRIMARY KEY,
+    code VARCHAR(64) NOT NULL UNIQUE,
+    name VARCHAR,
+    location VARCHAR,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
 
 CREATE TABLE sensor_data (
     id SERIAL PRIMARY KEY,
-    sensor_id VARCHAR(20) NOT NULL,
+    sensor_key INTEGER REFERENCES sensors(id),
     temperature DECIMAL(5,2) NOT NULL,
     humidity DECIMAL(5,2) NOT NULL,
     ph DECIMAL(4,2) NOT NULL,
@@ -21,11 +33,20 @@ CREATE TABLE sensor_data (
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX ix_sensor_data_sensor_key ON sensor_data (sensor_key);
+CREATE INDEX ix_sensor_data_timestamp ON sensor_data (timestamp);
+CREATE UNIQUE INDEX uq_sensor_reading ON sensor_data (sensor_key, timestamp);
+
 -- ======================
 -- Datos de ejemplo reales
 -- ======================
 
-INSERT INTO sensor_data (sensor_id, temperature, humidity, ph, light, timestamp) VALUES
+INSERT INTO sensors (code) VALUES ('S-101'), ('S-102'), ('S-103');
+
+-- Las lecturas se escriben con el código y se traducen a la clave entera
+INSERT INTO sensor_data (sensor_key, temperature, humidity, ph, light, timestamp)
+SELECT s.id, v.temperature, v.humidity, v.ph, v.light, v.ts::timestamp
+FROM (VALUES
 ('S-101', 24.5, 68.2, 6.7, 425.0, '2025-11-10 06:00:00'),
 ('S-101', 25.1, 70.0, 6.8, 440.5, '2025-11-10 07:00:00'),
 ('S-101', 26.0, 72.4, 6.9, 455.2, '2025-11-10 08:00:00'),
@@ -42,14 +63,16 @@ INSERT INTO sensor_data (sensor_id, temperature, humidity, ph, light, timestamp)
 ('S-103', 21.0, 63.5, 6.5, 400.4, '2025-11-10 07:00:00'),
 ('S-103', 22.1, 65.7, 6.6, 410.9, '2025-11-10 08:00:00'),
 ('S-103', 23.3, 68.0, 6.7, 430.5, '2025-11-10 09:00:00'),
-('S-103', 24.5, 70.2, 6.8, 450.0, '2025-11-10 10:00:00');
+('S-103', 24.5, 70.2, 6.8, 450.0, '2025-11-10 10:00:00')
+) AS v(code, temperature, humidity, ph, light, ts)
+JOIN sensors s ON s.code = v.code;
 
 -- ======================
 -- Vista de métricas
 -- ======================
 CREATE OR REPLACE VIEW sensor_metrics AS
 SELECT
-    sensor_id,
+    s.code AS sensor_id,
     ROUND(AVG(temperature), 2) AS avg_temp,
     ROUND(AVG(humidity), 2) AS avg_humidity,
     ROUND(AVG(ph), 2) AS avg_ph,
@@ -60,8 +83,9 @@ SELECT
     MIN(humidity) AS min_humidity,
     MAX(light) AS max_light,
     MIN(light) AS min_light
-FROM sensor_data
-GROUP BY sensor_id;
+FROM sensor_data d
+JOIN sensors s ON s.id = d.sensor_key
+GROUP BY s.code;
 
 -- ======================
 -- Consulta de prueba
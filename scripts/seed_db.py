@@ -15,16 +15,17 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 import random
 from database import engine, SessionLocal, init_db
 from models import Sensor
+from services.sensor_registry import registry
 
 
-def make_sample(sensor_id: str, ts: datetime):
+def make_sample(sensor_key: int, ts: datetime):
     """Construye una instancia `Sensor` con valores aleatorios.
 
     Relación con el bloque siguiente: estas instancias se agregan a la sesión
     para insertar registros de ejemplo y visualizar métricas en el dashboard.
     """
     return Sensor(
-        sensor_id=sensor_id,
+        sensor_key=sensor_key,
         temperature=round(random.uniform(15.0, 35.0), 1),
         humidity=round(random.uniform(30.0, 90.0), 1),
         ph=round(random.uniform(5.5, 7.5), 2),
@@ -40,7 +41,8 @@ def main():
     try:
         # insert 5 readings spaced 1 minute apart
         now = datetime.now(timezone.utc)
-        samples = [make_sample(f"demo-{i+1}", now) for i in range(5)]
+        keys = registry.resolve_many(session, [f"demo-{i+1}" for i in range(5)])
+        samples = [make_sample(key, now) for key in keys.values()]
         session.add_all(samples)
         session.commit()
         print("Inserted sample sensor readings")
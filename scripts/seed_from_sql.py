@@ -18,7 +18,8 @@ from sqlalchemy import text
 # make project root importable
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from database import engine, init_db
+from database import Base, engine, init_db
+from services.sensor_summary import ensure_storage
 
 
 def main():
@@ -48,6 +49,10 @@ def main():
         with engine.begin() as conn:
             # exec_driver_sql runs the SQL verbatim using the DBAPI
             conn.exec_driver_sql(sql)
+            # El SQL solo recrea sensors/sensor_data: restaurar bloques y el
+            # resumen por sensor (vista materializada) sobre los datos nuevos
+            Base.metadata.create_all(bind=conn)
+            ensure_storage(conn)
         print("Seed SQL executed successfully.")
     except Exception as exc:
         print("Error executing seed SQL:", exc)
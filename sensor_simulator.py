@@ -1,9 +1,49 @@
-import requests
+"""
+Simulador de sensores IoT y cliente gateway con spool local.
+
+Modos:
+- Por defecto (demo): envía una lectura cada `--interval` segundos a
+    `POST /sensor-data`; si el envío falla la lectura se pierde.
+- `--gateway`: store-and-forward. Cada lectura se añade primero a un spool
+    SQLite local (`Spool`) y un hilo emisor (`SpoolSender`) lo vacía en lotes
+    contra `POST /sensor-data/batch`.
+
+Garantías del modo gateway:
+- Nada se pierde: una lectura solo se borra del spool cuando el servidor
+    confirma el lote que la contiene (200).
+- Nada se duplica: cada lote lleva una `idempotency_key` determinista
+    (`<gateway>:<spool>:<primer seq>-<último seq>`) y el servidor descarta
+    además las lecturas repetidas por (sensor, timestamp). `<spool>` es un id
+    aleatorio que se guarda en el propio fichero del spool: si el fichero se
+    borra, `seq` vuelve a empezar en 1 pero con otro id, y una clave antigua
+    nunca hace pasar por "ya recibido" un lote nuevo. Si aun así el servidor
+    responde 409 (clave ya usada con otro contenido), el lote se reenvía con
+    un sufijo nuevo en la clave; un segundo 409 lo aparta al `dead_letter`.
+- Orden: el spool es FIFO por `seq` y no se envía el lote siguiente hasta
+    confirmar el anterior.
+- Tras una caída, el backlog se reenvía sin pausas entre lotes sobre
+    conexiones keep-alive (`requests.Session`), y los fallos se reintentan con
+    backoff exponencial con jitter, respetando `Retry-After` (429/503).
+
+Relación con otros módulos: solo habla HTTP con la API (`routers/sensors.py`);
+no importa nada del servidor.
+"""
+import argparse
+import json
 import random
+import socket
+import sqlite3
+import threading
 import time
+import uuid
 from datetime import datetime, timezone
 
+import requests
+from requests.adapters import HTTPAdapter
+
 URL = "http://127.0.0.1:8000/sensor-data"
+BASE_URL = "http://127.0.0.1:8000"
+BATCH_PATH = "/sensor-data/batch"
 
 def generate_data():
     return {
@@ -31,5 +71,220 @@ def main():
         print("\nSimulador detenido.")
 
 
+class Spool:
+    """Cola FIFO persistente de lecturas (SQLite en modo WAL).
+
+    `seq` es autoincremental y nunca se reutiliza, así que identifica cada
+    lectura de forma estable aunque el proceso se reinicie. `spool_id`
+    (tabla `meta`) distingue este fichero de uno recreado en el mismo gateway.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: una lectura aceptada sobrevive también a un corte de luz
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool (seq INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter (seq INTEGER PRIMARY KEY, payload TEXT NOT NULL, error TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # Se genera una sola vez por fichero; INSERT OR IGNORE conserva el existente
+        self._conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('spool_id', ?)", (uuid.uuid4().hex[:12],)
+        )
+        self.spool_id = self._conn.execute("SELECT value FROM meta WHERE key = 'spool_id'").fetchone()[0]
+
+    def append(self, reading: dict) -> int:
+        """Guarda la lectura y devuelve su `seq`."""
+        with self._lock:
+            cur = self._conn.execute("INSERT INTO spool (payload) VALUES (?)", (json.dumps(reading),))
+            return cur.lastrowid
+
+    def peek(self, limit: int):
+        """Las `limit` lecturas más antiguas como [(seq, reading)], sin borrarlas."""
+        with self._lock:
+            rows = self._conn.execute("SELECT seq, payload FROM spool ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(seq, json.loads(payload)) for seq, payload in rows]
+
+    def ack(self, up_to_seq: int) -> None:
+        """Borra las lecturas confirmadas (todas las `seq <= up_to_seq`)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM spool WHERE seq <= ?", (up_to_seq,))
+
+    def dead_letter(self, seq: int, error: str, last_seq: int = None) -> None:
+        """Aparta lecturas que el servidor rechaza siempre (p. ej. 422).
+
+        Por defecto solo `seq`; con `last_seq`, todo el rango `seq..last_seq`.
+        """
+        last_seq = seq if last_seq is None else last_seq
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dead_letter (seq, payload, error) "
+                "SELECT seq, payload, ? FROM spool WHERE seq BETWEEN ? AND ?", (error, seq, last_seq)
+            )
+            self._conn.execute("DELETE FROM spool WHERE seq BETWEEN ? AND ?", (seq, last_seq))
+            self._conn.execute("COMMIT")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SpoolSender:
+    """Vacía un `Spool` en lotes hacia `POST /sensor-data/batch`."""
+
+    def __init__(self, spool: Spool, base_url: str = BASE_URL, gateway_id: str = None,
+                 batch_size: int = 500, session=None, timeout: float = 10.0,
+                 backoff_base: float = 0.5, backoff_max: float = 60.0, sleep=time.sleep):
+        self.spool = spool
+        self.url = base_url.rstrip("/") + BATCH_PATH
+        self.gateway_id = gateway_id or socket.gethostname()
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self.session = session or self._make_session()
+        self.failures = 0
+        self.sent = 0
+        # Se reduce a la mitad ante un 422 para aislar la lectura inválida
+        self._limit = batch_size
+        # Tras un 409: ((primer seq, último seq), sufijo) de la clave nueva del lote
+        self._rekey = None
+
+    @staticmethod
+    def _make_session() -> requests.Session:
+        session = requests.Session()
+        # Conexiones keep-alive reutilizadas entre lotes (sin handshake por envío)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _backoff(self, retry_after=None) -> float:
+        self.failures += 1
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:  # formato fecha HTTP: usar el backoff normal
+                pass
+        # Exponencial con "full jitter": evita que todos los gateways reintenten a la vez
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (self.failures - 1)))
+
+    def send_batch(self):
+        """Envía el lote más antiguo. Devuelve (lecturas confirmadas, espera antes del siguiente)."""
+        batch = self.spool.peek(self._limit)
+        if not batch:
+            return 0, 0.0
+        first, last = batch[0][0], batch[-1][0]
+        key = f"{self.gateway_id}:{self.spool.spool_id}:{first}-{last}"
+        rekeyed = self._rekey is not None and self._rekey[0] == (first, last)
+        if rekeyed:
+            key += f":{self._rekey[1]}"
+        body = {
+            "readings": [reading for _, reading in batch],
+            "idempotency_key": key,
+            "on_conflict": "ignore",
+        }
+        try:
+            r = self.session.post(self.url, json=body, timeout=self.timeout)
+        except Exception:  # red caída, timeout, DNS...
+            return 0, self._backoff()
+
+        if r.status_code == 200:
+            self.spool.ack(last)
+            self.failures = 0
+            self._limit = self.batch_size
+            self._rekey = None
+            self.sent += len(batch)
+            return len(batch), 0.0
+        if r.status_code == 409:
+            # Reintentar con la misma clave daría 409 para siempre y bloquearía el spool
+            self.failures = 0
+            self._limit = self.batch_size
+            if rekeyed:
+                self.spool.dead_letter(first, r.text[:500], last)
+                self._rekey = None
+            else:
+                self._rekey = ((first, last), uuid.uuid4().hex[:8])
+            return 0, 0.0
+        if r.status_code == 422:
+            if len(batch) == 1:
+                self.spool.dead_letter(first, r.text[:500])
+                self._limit = self.batch_size
+                return 0, 0.0
+            self._limit = max(1, len(batch) // 2)
+            return 0, 0.0
+        retry_after = r.headers.get("Retry-After") if r.status_code in (429, 503) else None
+        return 0, self._backoff(retry_after)
+
+    def drain(self, stop: threading.Event = None) -> int:
+        """Envía lotes seguidos hasta vaciar el spool (o `stop`); devuelve cuántas lecturas."""
+        total = 0
+        while stop is None or not stop.is_set():
+            sent, wait = self.send_batch()
+            total += sent
+            if wait:
+                if stop is None:
+                    self.sleep(wait)
+                elif stop.wait(wait):
+                    break
+            elif not sent and not len(self.spool):
+                break
+        return total
+
+    def run(self, stop: threading.Event, poll_interval: float = 1.0) -> None:
+        """Bucle del hilo emisor: drena y espera a que lleguen lecturas nuevas."""
+        while not stop.is_set():
+            self.drain(stop)
+            stop.wait(poll_interval)
+
+
+def run_gateway(args) -> None:
+    spool = Spool(args.spool)
+    sender = SpoolSender(spool, args.url, args.gateway_id, args.batch_size)
+    stop = threading.Event()
+    thread = threading.Thread(target=sender.run, args=(stop,), daemon=True)
+    thread.start()
+    print(f"🌱 Gateway iniciado: spool={args.spool} pendientes={len(spool)}")
+    try:
+        while True:
+            data = generate_data()
+            seq = spool.append(data)
+            print(f"📥 #{seq} en spool (pendientes: {len(spool)}, enviadas: {sender.sent})")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("\nGateway detenido; las lecturas pendientes se enviarán en el próximo arranque.")
+    finally:
+        stop.set()
+        thread.join(timeout=5)
+        spool.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulador de sensores AgroSense")
+    parser.add_argument("--gateway", action="store_true", help="modo store-and-forward con spool local")
+    parser.add_argument("--url", default=BASE_URL, help="URL base de la API")
+    parser.add_argument("--spool", default="gateway_spool.db", help="fichero SQLite del spool")
+    parser.add_argument("--gateway-id", default=None, help="identificador del gateway (por defecto, hostname)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=5.0, help="segundos entre lecturas")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.gateway:
+        run_gateway(args)
+    else:
+        main()
@@ -0,0 +1 @@
+"""Services package: infraestructura compartida por los routers (cachés, compresión)."""
@@ -0,0 +1,97 @@
+"""
+Generación de datos y caché de fragmentos renderizados.
+
+Relación con otros módulos:
+- `routers/sensors.py` llama a `bump_generation()` tras cada escritura, de modo
+    que cualquier valor cacheado con una generación anterior deja de usarse.
+- `routers/dashboard_html.py` guarda el HTML renderizado en `fragment_cache`
+    con la generación como clave y la usa también para el `ETag`.
+
+La generación es local al proceso. Para que las escrituras hechas por otros
+procesos (otro worker, scripts de seed) se vean sin reiniciar, el token incluye
+una época que avanza cada `CACHE_TTL_SECONDS` segundos. Con el segmento de
+`services.shared_aggregates` activo (`use_shared_generation`) el contador es
+el compartido por todos los workers.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+
+# Distingue procesos: un ETag emitido por otro worker nunca coincide por azar.
+_BOOT_ID = uuid.uuid4().hex[:8]
+_lock = threading.Lock()
+_generation = 0
+# Contador entre procesos (objeto con `bump()` y `token()`), o None
+_shared = None
+
+
+def use_shared_generation(counter) -> None:
+    """Usa `counter` como generación (None vuelve al contador del proceso)."""
+    global _shared
+    _shared = counter
+
+
+def bump_generation() -> int:
+    """Marca que los datos cambiaron; devuelve el nuevo contador."""
+    global _generation
+    shared = _shared
+    if shared is not None:
+        shared.bump()
+    with _lock:
+        _generation += 1
+        return _generation
+
+
+def data_generation() -> str:
+    """Token opaco que cambia cuando cambian los datos (o expira el TTL)."""
+    epoch = int(time.monotonic() // CACHE_TTL_SECONDS) if CACHE_TTL_SECONDS > 0 else 0
+    shared = _shared
+    if shared is not None:
+        return f"{shared.token()}.{epoch}"
+    return f"{_BOOT_ID}.{_generation}.{epoch}"
+
+
+class FragmentCache:
+    """LRU pequeño y thread-safe para valores derivados de los datos.
+
+    Las claves incluyen la generación, así que las entradas obsoletas nunca se
+    sirven: simplemente dejan de pedirse y el LRU las descarta.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> Any:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, factory())
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,118 @@
+"""
+Codificación columnar comprimida para bloques de lecturas (cold storage).
+
+Relación con otros módulos:
+- `services/compaction.py` empaqueta las lecturas antiguas de un sensor y día en
+    un `models.SensorBlock` usando `encode_floats` / `encode_timestamps`.
+- `services/readings.py` decodifica los bloques cuando una consulta necesita
+    valores individuales (ventanas parciales, series temporales, exportación).
+
+Formato:
+- Métricas: un byte de cabecera con la escala decimal `k`. Si todos los valores
+    son exactos con `k` decimales (lo habitual: los sensores reportan 1-3), se
+    guardan como deltas (zigzag) de enteros `v * 10**k`; si no, `k = 255` y se guardan
+    los float64 tal cual. En ambos casos: byte-shuffle -> zlib. El shuffle
+    agrupa el byte i de todos los valores; con deltas pequeños los bytes altos
+    son cero y zlib los reduce a casi nada.
+- Timestamps: microsegundos desde la época, codificados como deltas `int64`
+    (el primero es absoluto) con el mismo shuffle + zlib. Con muestreo regular
+    todos los deltas son iguales y el bloque ocupa unos pocos bytes.
+Siempre se serializa en little-endian.
+"""
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+from typing import Iterable
+
+_LEVEL = 6
+_WIDTH = 8  # bytes por valor (float64 / int64)
+_MAX_SCALE = 6
+_RAW = 255  # cabecera: float64 sin escalar
+
+
+def _to_le_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le_bytes(typecode: str, raw: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(raw)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _shuffle(raw: bytes) -> bytes:
+    # Slicing extendido en C: concatena el byte i de cada valor.
+    return b"".join(raw[i::_WIDTH] for i in range(_WIDTH))
+
+
+def _unshuffle(raw: bytes) -> bytes:
+    n = len(raw) // _WIDTH
+    out = bytearray(len(raw))
+    for i in range(_WIDTH):
+        out[i::_WIDTH] = raw[i * n:(i + 1) * n]
+    return bytes(out)
+
+
+def _deltas(ints) -> array:
+    return array("q", [b - a for a, b in zip([0] + ints[:-1], ints)])
+
+
+def _zigzag(deltas: array) -> array:
+    # Intercala signos (0,-1,1,-2,... -> 0,1,2,3,...) para que un delta negativo
+    # pequeño no llene de 0xFF los bytes altos.
+    return array("q", [(d << 1) ^ (d >> 63) for d in deltas])
+
+
+def _unzigzag(values: array):
+    return ((z >> 1) ^ -(z & 1) for z in values)
+
+
+def _decimal_scale(values) -> int:
+    """Menor `k` tal que todos los valores se recuperan exactos de `round(v*10**k)`."""
+    for k in range(_MAX_SCALE + 1):
+        factor = 10 ** k
+        try:
+            if all(round(v * factor) / factor == v for v in values):
+                return k
+        except (OverflowError, ValueError):  # inf / nan
+            return _RAW
+    return _RAW
+
+
+def encode_floats(values: Iterable[float]) -> bytes:
+    """Comprime una columna de floats sin pérdida."""
+    values = list(values)
+    k = _decimal_scale(values)
+    if k == _RAW:
+        payload = _to_le_bytes(array("d", values))
+    else:
+        factor = 10 ** k
+        payload = _to_le_bytes(_zigzag(_deltas([round(v * factor) for v in values])))
+    return bytes([k]) + zlib.compress(_shuffle(payload), _LEVEL)
+
+
+def decode_floats(blob: bytes) -> array:
+    """Inverso de `encode_floats`; devuelve `array('d')`."""
+    k = blob[0]
+    raw = _unshuffle(zlib.decompress(blob[1:]))
+    if k == _RAW:
+        return _from_le_bytes("d", raw)
+    factor = 10 ** k
+    return array("d", [i / factor for i in accumulate(_unzigzag(_from_le_bytes("q", raw)))])
+
+
+def encode_timestamps(micros: Iterable[int]) -> bytes:
+    """Comprime timestamps (µs desde la época) como deltas; deben venir ordenados."""
+    return zlib.compress(_shuffle(_to_le_bytes(_deltas(list(micros)))), _LEVEL)
+
+
+def decode_timestamps(blob: bytes) -> array:
+    """Inverso de `encode_timestamps`; devuelve `array('q')` en µs."""
+    deltas = _from_le_bytes("q", _unshuffle(zlib.decompress(blob)))
+    return array("q", accumulate(deltas))
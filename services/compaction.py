@@ -0,0 +1,117 @@
+"""
+Compactación de lecturas antiguas en bloques columnares (cold storage).
+
+Relación con otros módulos:
+- Lee `models.Sensor` (filas calientes) y escribe `models.SensorBlock` usando
+    el formato de `services.columnar`.
+- `services.readings` lee ambos orígenes, por lo que analítica, exportación y
+    series temporales no cambian tras compactar.
+- `scripts/compact_readings.py` ejecuta `compact()` como tarea periódica.
+
+Las lecturas con más de `COMPACTION_AGE_DAYS` días (por defecto 90) se agrupan
+por (sensor, día UTC). Cada grupo se escribe como un bloque y sus filas se
+borran en la misma transacción; si ya existía un bloque para ese día (lecturas
+tardías o una ejecución anterior) se fusiona con él. `uq_sensor_reading` solo
+cubre las filas calientes: un reenvío tardío de una lectura ya compactada
+vuelve a entrar como fila, y al fusionar gana la fila nueva (igual que
+`on_conflict=update`) en lugar de contarse dos veces.
+"""
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from models import Sensor, SensorBlock
+from services.columnar import decode_floats, decode_timestamps, encode_floats, encode_timestamps
+from services.readings import METRICS, to_micros, to_utc
+
+COMPACTION_AGE_DAYS = int(os.getenv("COMPACTION_AGE_DAYS", "90"))
+_DELETE_CHUNK = 500
+
+
+def _from_micros(us: int) -> datetime:
+    return datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(microseconds=us)
+
+
+def _write_block(db: Session, sensor_key: Optional[int], day: date, rows: List[tuple]) -> None:
+    """Crea o fusiona el bloque (sensor_key, day) con `rows` = [(µs, t, h, ph, l)].
+
+    Una lectura por timestamp: ante repeticiones gana la última de `rows`, y
+    cualquiera de `rows` sobre la del bloque existente.
+    """
+    existing = db.execute(
+        select(SensorBlock).where(
+            SensorBlock.sensor_key.is_(None) if sensor_key is None else SensorBlock.sensor_key == sensor_key,
+            SensorBlock.day == day,
+        )
+    ).scalar_one_or_none()
+    merged = {}
+    if existing is not None:
+        old_ts = decode_timestamps(existing.timestamps)
+        old = [decode_floats(getattr(existing, m)) for m in METRICS]
+        merged = {int(t): (int(t), *(float(col[i]) for col in old)) for i, t in enumerate(old_ts)}
+    merged.update((r[0], r) for r in rows)
+    rows = sorted(merged.values(), key=lambda r: r[0])
+
+    block = existing or SensorBlock(sensor_key=sensor_key, day=day)
+    block.count = len(rows)
+    block.ts_start = _from_micros(rows[0][0])
+    block.ts_end = _from_micros(rows[-1][0])
+    block.timestamps = encode_timestamps(r[0] for r in rows)
+    for i, m in enumerate(METRICS, start=1):
+        values = [r[i] for r in rows]
+        setattr(block, m, encode_floats(values))
+        setattr(block, f"{m}_sum", sum(values))
+        setattr(block, f"{m}_min", min(values))
+        setattr(block, f"{m}_max", max(values))
+    if existing is None:
+        db.add(block)
+
+
+def _sensor_filter(sensor_key: Optional[int]):
+    return Sensor.sensor_key.is_(None) if sensor_key is None else Sensor.sensor_key == sensor_key
+
+
+def compact(db: Session, older_than_days: int = COMPACTION_AGE_DAYS, now: Optional[datetime] = None) -> Dict:
+    """Compacta las lecturas anteriores al día de corte; devuelve contadores.
+
+    Avanza sensor a sensor y día a día: en memoria solo hay un grupo
+    (sensor, día) y cada grupo se confirma en su propia transacción, así que
+    el job puede interrumpirse y reanudarse sin perder ni duplicar lecturas.
+    """
+    now = to_utc(now or datetime.now(timezone.utc))
+    cutoff = datetime.combine((now - timedelta(days=older_than_days)).date(), time.min, tzinfo=timezone.utc)
+    stats = {"rows": 0, "blocks": 0, "cutoff": cutoff.isoformat()}
+    columns = [Sensor.id, Sensor.timestamp, *[getattr(Sensor, m) for m in METRICS]]
+
+    sensor_keys = db.execute(select(Sensor.sensor_key).where(Sensor.timestamp < cutoff).distinct()).scalars().all()
+    for key in sensor_keys:
+        day_start = db.execute(
+            select(func.min(Sensor.timestamp)).where(_sensor_filter(key), Sensor.timestamp < cutoff)
+        ).scalar()
+        while day_start is not None:
+            day = to_utc(day_start).date()
+            lo = datetime.combine(day, time.min, tzinfo=timezone.utc)
+            hi = min(lo + timedelta(days=1), cutoff)
+            found = db.execute(
+                select(*columns)
+                .where(_sensor_filter(key), Sensor.timestamp >= lo, Sensor.timestamp < hi)
+                .order_by(Sensor.timestamp, Sensor.id)
+            ).all()
+            if found:
+                rows = [(to_micros(ts), *values) for _, ts, *values in found]
+                _write_block(db, key, day, rows)
+                ids = [r[0] for r in found]
+                for i in range(0, len(ids), _DELETE_CHUNK):
+                    db.execute(delete(Sensor).where(Sensor.id.in_(ids[i:i + _DELETE_CHUNK])))
+                db.commit()
+                stats["rows"] += len(found)
+                stats["blocks"] += 1
+            day_start = db.execute(
+                select(func.min(Sensor.timestamp)).where(
+                    _sensor_filter(key), Sensor.timestamp >= hi, Sensor.timestamp < cutoff
+                )
+            ).scalar()
+    return stats
@@ -0,0 +1,198 @@
+"""
+Ejecutor de analítica pesada en un pool de procesos (fuera del event loop).
+
+Relación con otros módulos:
+- `routers/analytics.py` carga las lecturas con `services.readings.load_columns`
+    y delega el cálculo (percentiles, correlaciones...) a `analytics_executor`,
+    de modo que un cálculo de meses no bloquea la ingesta ni otros clientes.
+- Los kernels viven en `services/kernels.py`: funciones puras sobre arrays
+    numpy con la firma `kernel(cols, params, check_cancelled)`.
+- `main.lifespan` cierra el pool al apagar el servidor.
+
+Cómo viajan los datos:
+- Las columnas (`readings.Columns`) se copian una vez a un segmento
+    `multiprocessing.shared_memory`; el worker crea vistas numpy sobre él sin
+    deserializar nada. Solo viaja por pickle el nombre del segmento, el número
+    de filas, los parámetros y el resultado (pequeño).
+- El primer byte del segmento es la bandera de cancelación: al vencer el
+    timeout (o si el cliente se desconecta) el proceso principal la activa y el
+    kernel aborta en su siguiente `check_cancelled()`.
+- Con menos de `ANALYTICS_INLINE_ROWS` filas el coste de enviar el trabajo
+    supera al del cálculo: se ejecuta en el threadpool con las mismas vistas.
+
+El pool usa el contexto `spawn` (los workers no heredan conexiones ni hilos
+del servidor) y se crea en el primer uso con `ANALYTICS_WORKERS` procesos
+(por defecto, los núcleos disponibles para este proceso).
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from services.readings import METRICS, Columns
+
+_HEADER = 8  # byte 0: bandera de cancelación; el resto alinea los arrays a 8
+
+
+def _available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS / Windows
+        return os.cpu_count() or 1
+
+
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", str(_available_cores())))
+ANALYTICS_TIMEOUT_SECONDS = float(os.getenv("ANALYTICS_TIMEOUT_SECONDS", "30"))
+ANALYTICS_INLINE_ROWS = int(os.getenv("ANALYTICS_INLINE_ROWS", "50000"))
+
+_FIELDS = ("ts", "sensor_key") + METRICS
+
+
+class JobCancelled(Exception):
+    """El kernel vio activada la bandera de cancelación."""
+
+
+class AnalyticsTimeout(TimeoutError):
+    """El cálculo superó el tiempo máximo y fue cancelado."""
+
+
+class ColumnsView:
+    """Vistas numpy de solo lectura: `ts`, `sensor_key` y `metrics[m]`."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.ts = arrays["ts"]
+        self.sensor_key = arrays["sensor_key"]
+        self.metrics = {m: arrays[m] for m in METRICS}
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+
+def _views(buffer, n: int) -> ColumnsView:
+    arrays = {}
+    for i, name in enumerate(_FIELDS):
+        dtype = np.float64 if name in METRICS else np.int64
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=n, offset=_HEADER + i * n * 8)
+        arrays[name].flags.writeable = False
+    return ColumnsView(arrays)
+
+
+def _pack(columns: Columns, buffer) -> None:
+    n = len(columns)
+    sources = [columns.ts, columns.sensor_key] + [columns.metrics[m] for m in METRICS]
+    for i, source in enumerate(sources):
+        offset = _HEADER + i * n * 8
+        buffer[offset:offset + n * 8] = memoryview(source).cast("B")
+
+
+def _run(kernel: Callable, buffer, n: int, params: Dict):
+    cols = _views(buffer, n)
+
+    def check_cancelled() -> None:
+        if buffer[0]:
+            raise JobCancelled()
+
+    try:
+        check_cancelled()
+        return kernel(cols, params, check_cancelled)
+    finally:
+        del cols  # libera las vistas antes de cerrar el segmento
+
+
+def _worker(kernel: Callable, shm_name: str, n: int, params: Dict):
+    """Punto de entrada en el proceso hijo."""
+    shm = SharedMemory(name=shm_name)
+    try:
+        return _run(kernel, shm.buf, n, params)
+    finally:
+        shm.close()
+
+
+def _signal_cancel(flag) -> None:
+    try:
+        flag[0] = 1
+    except (ValueError, TypeError):  # el segmento ya se liberó: el trabajo terminó
+        pass
+
+
+def _release(shm: SharedMemory) -> None:
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class AnalyticsExecutor:
+    """Pool de procesos perezoso para kernels de analítica."""
+
+    def __init__(self, workers: int = ANALYTICS_WORKERS, inline_rows: int = ANALYTICS_INLINE_ROWS):
+        self.workers = workers
+        self.inline_rows = inline_rows
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=max(1, self.workers), mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    async def run(self, kernel: Callable, columns: Columns, params: Optional[Dict] = None,
+                  timeout: Optional[float] = ANALYTICS_TIMEOUT_SECONDS):
+        """Ejecuta `kernel` sobre `columns` y devuelve su resultado.
+
+        Lanza `AnalyticsTimeout` si tarda más de `timeout` segundos; en ese caso
+        (o si se cancela la corrutina) el kernel recibe la orden de abortar.
+        """
+        params = params or {}
+        n = len(columns)
+        loop = asyncio.get_running_loop()
+        if self.workers <= 0 or n < self.inline_rows:
+            buffer = bytearray(_HEADER + len(_FIELDS) * n * 8)
+            _pack(columns, buffer)
+            future = loop.run_in_executor(None, _run, kernel, buffer, n, params)
+            flag = buffer
+        else:
+            shm = SharedMemory(create=True, size=_HEADER + len(_FIELDS) * n * 8)
+            try:
+                shm.buf[0] = 0
+                _pack(columns, shm.buf)
+                pool_future = self._get_pool().submit(_worker, kernel, shm.name, n, params)
+            except BaseException:
+                _release(shm)
+                raise
+            # El segmento se libera cuando el worker termina (o si nunca empezó)
+            pool_future.add_done_callback(lambda _f: _release(shm))
+            future = asyncio.wrap_future(pool_future)
+            flag = shm.buf
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            _signal_cancel(flag)
+            raise AnalyticsTimeout(f"analytics job exceeded {timeout}s") from None
+        except asyncio.CancelledError:
+            _signal_cancel(flag)
+            raise
+        except BrokenProcessPool:
+            # Un worker murió (OOM, señal): el próximo trabajo crea un pool nuevo
+            with self._lock:
+                self._pool = None
+            raise
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+analytics_executor = AnalyticsExecutor()
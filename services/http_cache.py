@@ -0,0 +1,188 @@
+"""
+Utilidades HTTP: compresión (gzip/brotli), ETags y respuestas condicionales.
+
+Relación con otros módulos:
+- `main.py` instala `CompressionMiddleware` para comprimir HTML y JSON.
+- `routers/dashboard_html.py` y `routers/assets.py` envuelven su contenido en
+    una `Representation`: el cuerpo se comprime una sola vez por codificación y
+    se reutiliza; `cached_response()` responde 304 si el `ETag` coincide.
+
+`brotli` es opcional: si no está instalado solo se negocia gzip.
+"""
+import gzip
+import hashlib
+import threading
+from typing import Optional
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES, GZipMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depende del entorno
+    brotli = None
+
+# Por debajo de este tamaño comprimir cuesta más de lo que ahorra.
+MINIMUM_SIZE = 500
+# A partir de este tamaño se comprime en el threadpool para no bloquear el loop.
+THREAD_MINIMUM_SIZE = 64 * 1024
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+# Binarios columnares (ya comprimidos por columna): gzip solo gastaría CPU.
+GZIP_EXCLUDED_TYPES = DEFAULT_EXCLUDED_CONTENT_TYPES + (
+    "application/vnd.apache.parquet",
+    "application/vnd.apache.arrow.stream",
+)
+
+
+def _accepted_codings(accept_encoding: str) -> dict:
+    """Parsea `Accept-Encoding` a {coding: q}."""
+    codings = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[name.strip().lower()] = q
+    return codings
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Elige `br` (si hay brotli) o `gzip` según lo que acepte el cliente."""
+    codings = _accepted_codings(accept_encoding or "")
+    if brotli is not None and codings.get("br", 0) > 0:
+        return "br"
+    if codings.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str], quality: int = 5) -> bytes:
+    """Comprime `body`; `quality` va de 0 a 11 (brotli) y se acota a 9 en gzip."""
+    if encoding == "br":
+        return brotli.compress(body, quality=quality)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=min(quality, 9), mtime=0)
+    return body
+
+
+def is_compressible(media_type: str) -> bool:
+    return media_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class Representation:
+    """Cuerpo inmutable con su ETag y sus variantes comprimidas cacheadas."""
+
+    def __init__(self, body: bytes, media_type: str, etag: Optional[str] = None, quality: int = 5):
+        self.body = body
+        self.media_type = media_type
+        self.etag = etag or '"%s"' % hashlib.sha256(body).hexdigest()[:20]
+        self.quality = quality
+        self._variants = {None: body}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        data = self._variants.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._variants.get(encoding)
+                if data is None:
+                    data = compress(self.body, encoding, self.quality)
+                    self._variants[encoding] = data
+        return data
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Comparación débil de `If-None-Match` (RFC 9110 §13.1.2)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in header.split(","))
+
+
+async def cached_response(request: Request, rep: Representation, cache_control: str) -> Response:
+    """Responde 304 si el cliente tiene la versión actual; si no, la variante comprimida."""
+    headers = {"ETag": rep.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if etag_matches(request, rep.etag):
+        return Response(status_code=304, headers=headers)
+    encoding = None
+    if len(rep.body) >= MINIMUM_SIZE and is_compressible(rep.media_type):
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    # La primera compresión de un asset grande no debe bloquear el event loop.
+    body = await run_in_threadpool(rep.encoded, encoding)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=rep.media_type, headers=headers)
+
+
+class CompressionMiddleware:
+    """Comprime respuestas con brotli si el cliente lo acepta y, si no, con gzip.
+
+    gzip se delega en `GZipMiddleware` de Starlette. La rama brotli comprime
+    respuestas completas (HTML/JSON); las respuestas en streaming y las que ya
+    traen `Content-Encoding` pasan sin tocar.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, exclude_content_types=GZIP_EXCLUDED_TYPES)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        if negotiate_encoding(accept) != "br":
+            await self.gzip(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def send_br(message: Message) -> None:
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                start = message
+                passthrough = (
+                    "content-encoding" in headers
+                    or message["status"] in (204, 206, 304)
+                    or not is_compressible(headers.get("content-type", ""))
+                )
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                # Streaming o cuerpo pequeño: se envía tal cual.
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            if len(body) >= THREAD_MINIMUM_SIZE:
+                body = await run_in_threadpool(compress, body, "br")
+            else:
+                body = compress(body, "br")
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = "br"
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_br)
@@ -0,0 +1,246 @@
+"""
+Ingesta idempotente de lecturas con inserción masiva (`ON CONFLICT`).
+
+Relación con otros módulos:
+- `routers/sensors.py` delega aquí tanto `POST /sensor-data` como
+    `POST /sensor-data/batch`.
+- Resuelve los códigos de sensor con `services.sensor_registry` (una sola
+    consulta para todo el lote) e inserta con `database.dialect_insert`.
+- Tras escribir avanza la generación de `services.cache`, suma las filas
+    escritas al contador de refresco de `services.sensor_summary`, copia las
+    lecturas a los rings en memoria de `services.ring_buffer` y actualiza la
+    tendencia incremental de `services.trend` (los sensores con lecturas
+    sobrescritas se recalculan al final con `trend_store.rebuild_stale()`).
+
+Garantías:
+- La restricción única (sensor_key, timestamp) de `models.Sensor` convierte
+    los reintentos de los gateways en duplicados inocuos: `ON CONFLICT DO
+    NOTHING` los descarta y `RETURNING` dice cuáles se insertaron de verdad.
+- Con `on_conflict="update"` los duplicados se sobrescriben con un segundo
+    `INSERT ... ON CONFLICT DO UPDATE` limitado a esas filas.
+- Con `SHARD_URLS` (`services.sharding`) las claves se resuelven en el
+    catálogo (`db`) y cada grupo de lecturas se escribe en su shard; los
+    shards se escriben en paralelo y cada uno confirma por su lado.
+- El coste es de unas pocas sentencias por lote (trozos de `CHUNK_SIZE`
+    filas), nunca una ida y vuelta por lectura.
+- `idempotency_cache` recuerda el resultado de las últimas
+    `IDEMPOTENCY_CACHE_SIZE` claves de lote para responder reenvíos sin tocar
+    la BD. Guarda también una huella (SHA-256) del cuerpo: una clave repetida
+    con otras lecturas no es un reenvío y se rechaza (`IdempotencyKeyReused`,
+    409) en lugar de responder "ya recibido" a un lote que nunca se escribió.
+- Con `SHARED_AGGREGATES_NAME` las lecturas nuevas se suman también al
+    segmento compartido entre workers (`services.shared_aggregates`); el
+    `commit` y esa suma ocurren dentro de su `write_gate()`.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import Sensor, SensorCreate
+from services.cache import FragmentCache, bump_generation
+from services.readings import METRICS, to_micros
+from services import sharding
+from services.ring_buffer import ring_store
+from services.sensor_registry import registry
+from services.sensor_summary import summary_refresher
+from services.shared_aggregates import shared_aggregates
+from services.trend import trend_store
+
+# Filas por sentencia: 7 parámetros/fila se mantiene bajo el límite de SQLite.
+CHUNK_SIZE = 500
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+idempotency_cache = FragmentCache(maxsize=IDEMPOTENCY_CACHE_SIZE)
+
+_CONFLICT_COLUMNS = ["sensor_key", "timestamp"]
+
+
+class IdempotencyKeyReused(Exception):
+    """La `idempotency_key` ya se usó para un lote con otro contenido."""
+
+
+def _fingerprint(readings: List[SensorCreate], on_conflict: str) -> str:
+    payload = [r.model_dump(mode="json") for r in readings]
+    body = json.dumps([on_conflict, payload], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def _row(reading: SensorCreate, keys: Dict[str, int], now: datetime) -> dict:
+    row = {m: getattr(reading, m) for m in METRICS}
+    row["sensor_key"] = keys.get(reading.sensor_id) if reading.sensor_id is not None else None
+    row["timestamp"] = reading.timestamp or now
+    return row
+
+
+def _identity(row: dict) -> tuple:
+    return row["sensor_key"], to_micros(row["timestamp"])
+
+
+def _ring_rows(rows: List[dict]):
+    return ((r["sensor_key"], to_micros(r["timestamp"]), tuple(r[m] for m in METRICS)) for r in rows)
+
+
+def _write(db: Session, unique: Dict[tuple, dict], anonymous: List[dict], on_conflict: str) -> Tuple:
+    """Inserta (y con `on_conflict="update"` sobrescribe) las filas y hace `commit`.
+
+    Devuelve `(inserted, inserted_count, updated, conflicting)`: identidades
+    insertadas, cuántas filas entraron, cuántas se sobrescribieron y cuáles.
+    """
+    rows = list(unique.values()) + anonymous
+    table = Sensor.__table__
+    inserted = set()
+    inserted_count = 0
+    for i in range(0, len(rows), CHUNK_SIZE):
+        stmt = (
+            dialect_insert(table, db)
+            .values(rows[i:i + CHUNK_SIZE])
+            .on_conflict_do_nothing(index_elements=_CONFLICT_COLUMNS)
+            .returning(table.c.sensor_key, table.c.timestamp)
+        )
+        for key, ts in db.execute(stmt):
+            inserted.add((key, to_micros(ts)))
+            inserted_count += 1
+
+    updated = 0
+    conflicting = []
+    if on_conflict == "update":
+        conflicting = [r for ident, r in unique.items() if ident not in inserted]
+        for i in range(0, len(conflicting), CHUNK_SIZE):
+            stmt = dialect_insert(table, db).values(conflicting[i:i + CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=_CONFLICT_COLUMNS,
+                set_={m: stmt.excluded[m] for m in METRICS},
+            )
+            updated += db.execute(stmt).rowcount or 0
+    db.commit()
+    return inserted, inserted_count, updated, conflicting
+
+
+def _write_shards(keys: Dict[str, int], unique: Dict[tuple, dict], anonymous: List[dict],
+                  on_conflict: str) -> List:
+    """Reparte las filas por shard y escribe cada grupo en su base, en paralelo.
+
+    Devuelve `[(unique, anonymous, resultado de _write o excepción)]` por shard.
+    """
+    shards = sharding.shards
+    shard_of = {key: shards.shard_for(code) for code, key in keys.items()}
+    groups: Dict[int, tuple] = {}
+    for ident, row in unique.items():
+        groups.setdefault(shard_of[row["sensor_key"]], ({}, []))[0][ident] = row
+    if anonymous:
+        groups.setdefault(shards.shard_for(None), ({}, []))[1].extend(anonymous)
+    codes = {key: code for code, key in keys.items()}
+
+    def write(index: int, db: Session):
+        group_unique, group_anonymous = groups[index]
+        keys_here = {r["sensor_key"] for r in group_unique.values()}
+        shards.ensure_devices(index, db, {k: codes[k] for k in keys_here})
+        try:
+            result = _write(db, group_unique, group_anonymous, on_conflict)
+        except Exception:
+            db.rollback()
+            raise
+        shards.note_written(index, result[1] + result[2])
+        return result
+
+    indices = sorted(groups)
+    results = shards.scatter(write, indices, return_exceptions=True)
+    return [(*groups[i], result) for i, result in zip(indices, results)]
+
+
+def _after_write(unique: Dict[tuple, dict], anonymous: List[dict], inserted: set, inserted_count: int,
+                 updated: int, conflicting: List[dict]) -> None:
+    if inserted_count or updated:
+        # Invalida los fragmentos cacheados (dashboard) que dependen de los datos
+        bump_generation()
+        summary_refresher.note_writes(inserted_count + updated)
+        new_rows = [r for ident, r in unique.items() if ident in inserted] + anonymous
+        ring_store.add_many(_ring_rows(new_rows))
+        trend_store.add_many(_ring_rows(new_rows))
+        shared_aggregates.add_many(_ring_rows(new_rows))
+        ring_store.add_many(_ring_rows(conflicting), replace=True)
+        if updated:
+            # Una suma no permite quitar el valor anterior: recalcular esos sensores
+            overwritten = {r["sensor_key"] for r in conflicting}
+            shared_aggregates.mark_stale(overwritten)
+            trend_store.mark_stale(overwritten)
+
+
+def ingest_readings(db: Session, readings: List[SensorCreate], on_conflict: str = "ignore") -> Dict[str, int]:
+    """Inserta las lecturas y devuelve `{"inserted": n, "duplicates": m}`.
+
+    Los duplicados incluyen tanto lecturas ya almacenadas como repeticiones
+    dentro del propio lote. Hace `commit`; ante error hace rollback y relanza.
+    Con shards, las lecturas de los shards que sí confirmaron quedan
+    registradas (cachés, rings) aunque otro shard falle.
+    """
+    try:
+        with shared_aggregates.write_gate():
+            return _ingest(db, readings, on_conflict)
+    finally:
+        shared_aggregates.rebuild_stale()
+        trend_store.rebuild_stale(sharding.session_factories)
+
+
+def _ingest(db: Session, readings: List[SensorCreate], on_conflict: str) -> Dict[str, int]:
+    now = datetime.now(timezone.utc)
+    try:
+        keys = registry.resolve_many(db, (r.sensor_id for r in readings))
+        # Dentro del lote gana la última versión de cada (sensor, timestamp)
+        unique: Dict[tuple, dict] = {}
+        anonymous: List[dict] = []
+        for reading in readings:
+            row = _row(reading, keys, now)
+            if row["sensor_key"] is None:
+                anonymous.append(row)  # sin sensor no hay identidad que deduplicar
+            else:
+                unique[_identity(row)] = row
+        if sharding.shards.enabled:
+            db.commit()  # sensores nuevos en el catálogo antes de escribir en los shards
+        else:
+            written = _write(db, unique, anonymous, on_conflict)
+    except Exception:
+        # Los sensores registrados en esta transacción no llegan a la caché
+        db.rollback()
+        raise
+
+    if not sharding.shards.enabled:
+        _after_write(unique, anonymous, *written)
+        return {"inserted": written[1], "duplicates": len(readings) - written[1]}
+
+    inserted_count = 0
+    failure = None
+    for group_unique, group_anonymous, result in _write_shards(keys, unique, anonymous, on_conflict):
+        if isinstance(result, Exception):
+            failure = failure or result
+            continue
+        _after_write(group_unique, group_anonymous, *result)
+        inserted_count += result[1]
+    if failure is not None:
+        raise failure
+    return {"inserted": inserted_count, "duplicates": len(readings) - inserted_count}
+
+
+def ingest_batch(db: Session, readings: List[SensorCreate], on_conflict: str = "ignore",
+                 idempotency_key: Optional[str] = None) -> Dict:
+    """`ingest_readings` con deduplicación opcional por clave de lote.
+
+    Lanza `IdempotencyKeyReused` si la clave ya se usó con otro cuerpo.
+    """
+    if idempotency_key is None:
+        return ingest_readings(db, readings, on_conflict)
+    fingerprint = _fingerprint(readings, on_conflict)
+    previous = idempotency_cache.get(idempotency_key)
+    if previous is not None:
+        previous_fingerprint, previous_result = previous
+        if previous_fingerprint != fingerprint:
+            raise IdempotencyKeyReused(f"idempotency_key {idempotency_key!r} already used for a different batch")
+        return {**previous_result, "replayed": True}
+    result = ingest_readings(db, readings, on_conflict)
+    idempotency_cache.put(idempotency_key, (fingerprint, result))
+    return result
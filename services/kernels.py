@@ -0,0 +1,188 @@
+"""
+Kernels de analítica pesada (numpy) ejecutados por `services.executor`.
+
+Relación con otros módulos:
+- `services.executor.AnalyticsExecutor.run` los invoca en un proceso worker
+    (o en el threadpool para ventanas pequeñas) con la firma
+    `kernel(cols, params, check_cancelled)`; `cols` es un `ColumnsView`.
+- `routers/analytics.py` elige el kernel y da formato a la respuesta
+    (`percentiles` para `/analytics/percentiles`, `lttb_series` para
+    `/analytics/series`, `correlation` para `/analytics/correlation`).
+
+Reglas para un kernel: función de nivel de módulo (se envía por referencia al
+proceso hijo), sin acceso a la BD, resultado pequeño y serializable, y llamada
+a `check_cancelled()` entre pasos costosos. Si los datos hacen inviable el
+cálculo (p. ej. una rejilla demasiado grande) se lanza `KernelInputError`,
+que el router traduce a 422.
+"""
+import os
+from typing import Dict
+
+import numpy as np
+
+# Celdas (columnas sensor×métrica × intervalos) de la rejilla de correlación: ~8 bytes cada una.
+CORRELATION_MAX_CELLS = int(os.getenv("CORRELATION_MAX_CELLS", "5000000"))
+CORRELATION_MIN_OVERLAP = 3
+
+
+class KernelInputError(ValueError):
+    """Los parámetros o el volumen de datos no permiten ejecutar el kernel."""
+
+
+def percentiles(cols, params: Dict, check_cancelled) -> Dict:
+    """Percentiles `params["q"]` (0-100) de cada métrica de `params["metrics"]`.
+
+    Los NaN (métricas no informadas) se ignoran. Devuelve
+    `{"count": n, "percentiles": {metric: {"p50": v, ...}}}`.
+    """
+    qs = [float(q) for q in params["q"]]
+    out = {}
+    for metric in params["metrics"]:
+        check_cancelled()
+        values = cols.metrics[metric]
+        values = values[~np.isnan(values)]
+        if not len(values):
+            out[metric] = {}
+            continue
+        result = np.percentile(values, qs)
+        out[metric] = {f"p{q:g}": round(float(v), 6) for q, v in zip(qs, result)}
+    return {"count": len(cols), "percentiles": out}
+
+
+def _lttb_indices(x: np.ndarray, ys: np.ndarray, threshold: int, check_cancelled) -> np.ndarray:
+    """Índices elegidos por Largest-Triangle-Three-Buckets para cada fila de `ys`.
+
+    `x` (n,) creciente y `ys` (k, n): las k métricas se resuelven a la vez,
+    cada una con su propia selección. Devuelve un array (k, threshold).
+    """
+    k, n = ys.shape
+    if threshold >= n:
+        return np.tile(np.arange(n), (k, 1))
+    # Primer y último punto fijos; los n-2 interiores en threshold-2 cubos
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(ys[:, 1:n - 1], edges[:-1] - 1, axis=1) / counts
+    # Punto C de cada cubo: la media del cubo siguiente (el último punto para el final)
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.concatenate([avg_y[:, 1:], ys[:, -1:]], axis=1)
+
+    rows = np.arange(k)
+    out = np.empty((k, threshold), dtype=np.int64)
+    out[:, 0], out[:, -1] = 0, n - 1
+    prev = np.zeros(k, dtype=np.int64)
+    for b in range(threshold - 2):
+        if b % 256 == 0:
+            check_cancelled()
+        lo, hi = edges[b], edges[b + 1]
+        ax, ay = x[prev], ys[rows, prev]
+        bx, by = x[lo:hi], ys[:, lo:hi]
+        # Doble del área del triángulo (A, B, C) para cada candidato B del cubo
+        area = np.abs((ax - next_x[b])[:, None] * (by - ay[:, None])
+                      - (ax[:, None] - bx[None, :]) * (next_y[:, b] - ay)[:, None])
+        prev = lo + area.argmax(axis=1)
+        out[:, b + 1] = prev
+    return out
+
+
+def lttb_series(cols, params: Dict, check_cancelled) -> Dict:
+    """Series por sensor de `params["metrics"]` reducidas a `params["points"]` con LTTB.
+
+    El presupuesto se reparte entre los sensores de la ventana (mínimo 3 puntos
+    por sensor), así que el tamaño de la respuesta no depende de cuántas
+    lecturas haya. `cols` debe venir ordenado por tiempo. Devuelve
+    `{"count": n, "series": {sensor_key: {metric: {"t": [ms], "v": [...]}}}}`.
+    """
+    metrics = list(params["metrics"])
+    n = len(cols)
+    if not n:
+        return {"count": 0, "series": {}}
+    keys = np.asarray(cols.sensor_key)
+    order = np.argsort(keys, kind="stable")  # estable: cada grupo sigue en orden temporal
+    group_keys, starts = np.unique(keys[order], return_index=True)
+    bounds = np.append(starts, n)
+    budget = max(3, int(params["points"]) // len(group_keys))
+    ts_all = np.asarray(cols.ts)
+    ys_all = np.vstack([np.asarray(cols.metrics[m]) for m in metrics])
+
+    series = {}
+    for key, lo, hi in zip(group_keys, bounds[:-1], bounds[1:]):
+        check_cancelled()
+        idx = order[lo:hi]
+        ts = ts_all[idx]
+        # Segundos relativos al primer punto: float64 sin pérdida de precisión
+        x = (ts - ts[0]) / 1e6
+        chosen = _lttb_indices(x, ys_all[:, idx], budget, check_cancelled)
+        series[int(key)] = {
+            m: {
+                "t": (ts[chosen[i]] // 1000).tolist(),
+                "v": np.round(ys_all[i, idx][chosen[i]], 4).tolist(),
+            }
+            for i, m in enumerate(metrics)
+        }
+    return {"count": n, "series": series}
+
+
+def correlation(cols, params: Dict, check_cancelled) -> Dict:
+    """Matriz de Pearson entre todas las series (sensor, métrica) alineadas en una rejilla.
+
+    Cada lectura cae en el intervalo `(ts - start_us) // resolution_us`; el valor
+    de una serie en un intervalo es la media de sus lecturas (`np.bincount`).
+    La correlación de cada par usa solo los intervalos en los que ambas series
+    tienen dato ("pairwise complete"), y todos los pares salen de unos pocos
+    productos de matrices: con `M` (máscara de presencia) y `X` (valores
+    centrados, 0 si falta) se obtienen `n = M·Mᵀ`, `Σx = X·Mᵀ`, `Σx² = X²·Mᵀ`
+    y `Σxy = X·Xᵀ`. Pares con menos de `CORRELATION_MIN_OVERLAP` intervalos
+    comunes o varianza nula quedan en None.
+    """
+    metrics = list(params["metrics"])
+    resolution = int(params["resolution_us"])
+    if not len(cols):
+        return {"bins": 0, "keys": [], "metrics": metrics, "matrix": [], "overlap": []}
+    ts = np.asarray(cols.ts)
+    start = params.get("start_us")
+    start = int(ts.min()) if start is None else int(start)
+    bins = (ts - start) // resolution
+    n_bins = int(bins.max()) + 1
+    keys, key_idx = np.unique(np.asarray(cols.sensor_key), return_inverse=True)
+    n_cols = len(keys) * len(metrics)
+    if n_cols * n_bins > CORRELATION_MAX_CELLS:
+        raise KernelInputError(
+            f"{n_cols} series x {n_bins} intervals exceeds {CORRELATION_MAX_CELLS} cells: "
+            "use a coarser resolution, a shorter window or fewer metrics"
+        )
+
+    # Rejilla (serie, intervalo): suma y número de lecturas por celda
+    cell = key_idx * n_bins + bins
+    counts = np.bincount(cell, minlength=len(keys) * n_bins).reshape(len(keys), n_bins)
+    present = np.repeat(counts > 0, len(metrics), axis=0).astype(np.float64)
+    values = np.empty((n_cols, n_bins))
+    for i, metric in enumerate(metrics):
+        check_cancelled()
+        sums = np.bincount(cell, weights=np.asarray(cols.metrics[metric]), minlength=len(keys) * n_bins)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values[i::len(metrics)] = sums.reshape(len(keys), n_bins) / counts
+    # Centrar cada serie mejora la precisión de Σxy - ΣxΣy/n sin cambiar r
+    observed = present > 0
+    means = np.where(observed, values, 0.0).sum(axis=1) / observed.sum(axis=1)  # cada serie tiene datos
+    x = np.where(observed, values - means[:, None], 0.0)
+
+    check_cancelled()
+    n = present @ present.T
+    sx = x @ present.T  # sx[i, j] = Σ x_i sobre los intervalos comunes con j
+    sxx = (x * x) @ present.T
+    sxy = x @ x.T
+    spread = n * sxx - sx ** 2  # n² · varianza de x_i en los intervalos comunes con j
+    # Varianza nula salvo ruido de redondeo (serie constante en el solape)
+    flat = spread <= 1e-20 * n ** 2 * (1 + means[:, None] ** 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = np.clip((n * sxy - sx * sx.T) / np.sqrt(spread * spread.T), -1.0, 1.0)
+    r[(n < CORRELATION_MIN_OVERLAP) | flat | flat.T] = np.nan
+    matrix = [[None if np.isnan(v) else round(float(v), 4) for v in row] for row in r]
+    return {
+        "bins": n_bins,
+        "keys": [int(k) for k in keys],
+        "metrics": metrics,
+        "matrix": matrix,
+        "overlap": n.astype(np.int64).tolist(),
+    }
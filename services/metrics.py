@@ -0,0 +1,35 @@
+"""
+Registro de fuentes de métricas internas expuestas en `GET /metrics`.
+
+Relación con otros módulos:
+- Cada servicio con estado en memoria (limitador de ingesta, cachés...)
+    registra aquí una función sin argumentos que devuelve un dict serializable.
+- `routers/metrics.py` llama a `collect()` y devuelve el resultado como JSON.
+
+Una fuente que falla no rompe el endpoint: su entrada pasa a ser
+`{"error": "..."}`.
+"""
+import threading
+from typing import Callable, Dict
+
+_sources: Dict[str, Callable[[], Dict]] = {}
+_lock = threading.Lock()
+
+
+def register_source(name: str, source: Callable[[], Dict]) -> None:
+    """Registra (o reemplaza) la fuente `name`."""
+    with _lock:
+        _sources[name] = source
+
+
+def collect() -> Dict[str, Dict]:
+    """Instantánea de todas las fuentes registradas, por nombre."""
+    with _lock:
+        sources = dict(_sources)
+    out = {}
+    for name, source in sorted(sources.items()):
+        try:
+            out[name] = source()
+        except Exception as exc:
+            out[name] = {"error": str(exc)}
+    return out
@@ -0,0 +1,309 @@
+"""
+Modo de perfilado: log de consultas lentas con EXPLAIN y muestreo cProfile.
+
+Relación con otros módulos:
+- `database.get_engine()` llama a `instrument_engine()` cuando `DB_PROFILE`
+    está activo: cada sentencia se cronometra con eventos del engine.
+- `main.create_app()` instala `ProfilingMiddleware`, que fija en un
+    `ContextVar` la petición en curso; así cada consulta se atribuye a la
+    plantilla de su endpoint (p. ej. `GET /debug/profiles/{profile_id}`, no
+    una entrada por id).
+- `routers/debug.py` expone el anillo de consultas lentas y los perfiles.
+
+Qué se guarda (todo en memoria y acotado):
+- `route_stats`: por ruta, número de sentencias, tiempo total y lentas.
+- `slow_queries`: las últimas `SLOW_QUERY_LOG_SIZE` sentencias que superaron
+    `SLOW_QUERY_MS`, con su plan (`EXPLAIN` en Postgres, `EXPLAIN QUERY PLAN`
+    en SQLite) capturado en la misma conexión y con los mismos parámetros.
+- `profiles`: con `PROFILE_SAMPLE_RATE` (0..1) o la cabecera `X-Profile: 1`
+    la petición se ejecuta bajo cProfile; el resultado se guarda en formato
+    "folded stacks" (`a;b;c <µs>`), el que consumen `flamegraph.pl` y
+    speedscope. El id se devuelve en la cabecera `X-Profile-Id`.
+
+El perfilado cProfile es por hilo: incluye el trabajo síncrono hecho en el
+event loop (nuestros handlers `async`), no el de dependencias que Starlette
+ejecuta en el threadpool. El trabajo que se envía al threadpool con
+`profiled_call` (p. ej. la agregación de `services.singleflight`) se perfila
+en su hilo y se suma al perfil de la petición.
+
+Ojo: el event loop es compartido. Mientras la petición perfilada espera, el
+loop ejecuta las corrutinas de otras peticiones y cProfile las cuenta en este
+perfil. Solo es fiable sin concurrencia: cada perfil guarda
+`overlapping_requests`, las peticiones HTTP que estuvieron en curso a la vez;
+con un valor distinto de 0 el perfil mezcla trabajo ajeno.
+"""
+import cProfile
+import itertools
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "200"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_LOG_SIZE = int(os.getenv("PROFILE_LOG_SIZE", "20"))
+PROFILE_HEADER = "x-profile"
+
+# `scope` ASGI de la petición en curso. Se guarda el dict (no la ruta ya
+# resuelta) porque el router añade `scope["route"]` después del middleware.
+_request_scope: ContextVar[Optional[dict]] = ContextVar("agrosense_request_scope", default=None)
+# Perfiles extra (otros hilos) de la petición perfilada en curso.
+_thread_profiles: ContextVar[Optional[list]] = ContextVar("agrosense_thread_profiles", default=None)
+
+_lock = threading.Lock()
+route_stats: Dict[str, Dict[str, float]] = {}
+slow_queries: deque = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+profiles: deque = deque(maxlen=PROFILE_LOG_SIZE)
+_profile_ids = itertools.count(1)
+# cProfile usa el hook de perfilado del hilo: una petición perfilada a la vez.
+_profiler_busy = threading.Lock()
+# Peticiones HTTP en curso y, mientras se perfila una, cuántas se solaparon con ella
+_in_flight = 0
+_overlap: Optional[Dict[str, int]] = None
+
+_EXPLAIN_PREFIX = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}
+_START_KEY = "agrosense_query_start"
+
+
+def _explain(conn, cursor, statement: str, parameters) -> Optional[List[str]]:
+    """Plan de la sentencia, o None si no es un SELECT o el dialecto no aplica."""
+    prefix = _EXPLAIN_PREFIX.get(conn.dialect.name)
+    head = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    if prefix is None or head not in ("SELECT", "WITH"):
+        return None
+    # Cursor DBAPI nuevo sobre la misma conexión: ve la misma transacción y no
+    # vuelve a disparar los eventos del engine.
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute(prefix + statement, parameters)
+        return [" | ".join(str(col) for col in row) for row in explain_cursor.fetchall()]
+    except Exception as exc:  # el plan es informativo: nunca rompe la consulta
+        return [f"EXPLAIN failed: {exc}"]
+    finally:
+        explain_cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info[_START_KEY].pop()) * 1000
+    route = current_route()
+    slow = elapsed_ms >= SLOW_QUERY_MS
+    with _lock:
+        stats = route_stats.setdefault(route, {"statements": 0, "total_ms": 0.0, "slow": 0})
+        stats["statements"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["slow"] += slow
+    if not slow:
+        return
+    plan = None if executemany else _explain(conn, cursor, statement, parameters)
+    entry = {
+        "route": route,
+        "duration_ms": round(elapsed_ms, 3),
+        "statement": statement,
+        "parameters": repr(parameters)[:500],
+        "plan": plan,
+        "at": time.time(),
+    }
+    with _lock:
+        slow_queries.append(entry)
+
+
+def instrument_engine(engine) -> None:
+    """Registra los eventos de cronometraje en `engine` (idempotente)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def reset() -> None:
+    """Vacía estadísticas, anillo de consultas lentas y perfiles."""
+    with _lock:
+        route_stats.clear()
+        slow_queries.clear()
+        profiles.clear()
+
+
+def snapshot() -> Dict:
+    """Copia consistente del estado para el endpoint de depuración."""
+    with _lock:
+        routes = {
+            route: {**s, "total_ms": round(s["total_ms"], 3)} for route, s in route_stats.items()
+        }
+        return {"threshold_ms": SLOW_QUERY_MS, "routes": routes, "slow_queries": list(slow_queries)}
+
+
+def _frame_name(func) -> str:
+    filename, line, name = func
+    if filename == "~":  # built-ins: ('~', 0, "<built-in method ...>")
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def fold_stats(profiler: cProfile.Profile, max_depth: int = 64, extra=(),
+               min_fraction: float = 1 / 5000) -> str:
+    """Convierte un cProfile en "folded stacks" (`a;b;c <µs>` por línea).
+
+    cProfile solo guarda aristas caller->callee, no pilas completas: se
+    reconstruyen bajando desde las raíces y repartiendo el tiempo acumulado de
+    cada arista entre sus hijos (mismo criterio que flameprof). El tiempo que
+    no explica ningún hijo es tiempo propio del marco. `extra` son perfiles de
+    otros hilos de la misma petición; sus raíces se añaden como pilas propias.
+
+    El número de pilas distintas puede crecer exponencialmente con el grafo de
+    llamadas: no se baja por aristas con menos de `min_fraction` del tiempo
+    total ni más allá de `max_depth`; ese tiempo queda como propio del padre.
+    """
+    combined = pstats.Stats(profiler)
+    for other in extra:
+        combined.add(other)
+    stats = combined.stats
+    callees: Dict[tuple, Dict[tuple, float]] = {}
+    for func, (_cc, _nc, _tt, _ct, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, {})[func] = edge[3]
+    roots = [f for f, (_cc, _nc, _tt, _ct, callers) in stats.items() if not callers]
+    floor = sum(stats[r][3] for r in roots) * min_fraction
+    lines: Dict[str, int] = {}
+
+    def walk(func, cumulative: float, path: List[str], seen: set) -> None:
+        path = path + [_frame_name(func)]
+        children = {c: t for c, t in callees.get(func, {}).items() if c not in seen}
+        child_total = sum(children.values())
+        scale = min(1.0, cumulative / child_total) if child_total else 0.0
+        kept = {}
+        if len(path) < max_depth:
+            kept = {c: t * scale for c, t in children.items() if t * scale >= floor}
+        own = cumulative - sum(kept.values())
+        if own > 0:
+            key = ";".join(path)
+            lines[key] = lines.get(key, 0) + int(own * 1_000_000)
+        for child, t in kept.items():
+            walk(child, t, path, seen | {child})
+
+    for root in roots:
+        walk(root, stats[root][3], [], {root})
+    return "\n".join(f"{stack} {us}" for stack, us in lines.items() if us > 0) + "\n"
+
+
+def current_route() -> str:
+    """Etiqueta `MÉTODO /plantilla` de la petición en curso; "-" fuera de ella."""
+    scope = _request_scope.get()
+    if scope is None:
+        return "-"
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "")
+    return f"{scope.get('method', '')} {path}".strip()
+
+
+def profiled_call(fn, *args):
+    """Llama a `fn(*args)`; si la petición actual se está perfilando, bajo un
+    cProfile propio de este hilo que se suma al perfil de la petición.
+
+    Pensado para funciones que se ejecutan en el threadpool (el `ContextVar`
+    viaja con `run_in_threadpool`).
+    """
+    extra = _thread_profiles.get()
+    if extra is None:
+        return fn(*args)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return fn(*args)
+    finally:
+        profiler.disable()
+        with _lock:
+            extra.append(profiler)
+
+
+class ProfilingMiddleware:
+    """Atribuye las consultas a la ruta y, si toca, perfila la petición."""
+
+    def __init__(self, app, sample_rate: Optional[float] = None) -> None:
+        self.app = app
+        self.sample_rate = PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    def _should_profile(self, scope) -> bool:
+        for name, value in scope.get("headers", ()):
+            if name == PROFILE_HEADER.encode() and value in (b"1", b"true"):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        global _in_flight
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _request_scope.set(scope)
+        with _lock:
+            _in_flight += 1
+            if _overlap is not None:
+                _overlap["requests"] += 1
+        try:
+            if not self._should_profile(scope) or not _profiler_busy.acquire(blocking=False):
+                await self.app(scope, receive, send)
+                return
+            await self._profile(scope, receive, send)
+        finally:
+            with _lock:
+                _in_flight -= 1
+            _request_scope.reset(token)
+
+    async def _profile(self, scope, receive, send):
+        global _overlap
+        try:
+            profile_id = next(_profile_ids)
+
+            async def send_with_id(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-profile-id", str(profile_id).encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            profiler = cProfile.Profile()
+            extra: list = []
+            extra_token = _thread_profiles.set(extra)
+            with _lock:
+                # Las que ya estaban en curso también comparten el loop con esta
+                overlap = _overlap = {"requests": _in_flight - 1}
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                profiler.disable()
+                _thread_profiles.reset(extra_token)
+                with _lock:
+                    _overlap = None
+                    extra = list(extra)
+                entry = {
+                    "id": profile_id,
+                    "route": current_route(),
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                    "overlapping_requests": overlap["requests"],
+                    "folded": fold_stats(profiler, extra=extra),
+                }
+                with _lock:
+                    profiles.append(entry)
+        finally:
+            _profiler_busy.release()
+
+
+def get_profile(profile_id: int) -> Optional[Dict]:
+    with _lock:
+        return next((p for p in profiles if p["id"] == profile_id), None)
+
+
+def list_profiles() -> List[Dict]:
+    with _lock:
+        return [{k: v for k, v in p.items() if k != "folded"} for p in profiles]
@@ -0,0 +1,242 @@
+"""
+Limitación de caudal (token bucket) y control de concurrencia para la ingesta.
+
+Relación con otros módulos:
+- `routers/sensors.py` llama a `ingest_limiter.check()` con la IP del cliente y
+    los `sensor_id` de la petición, y toma un hueco de `ingest_concurrency`
+    mientras escribe en la BD.
+- Registra la fuente `ingest_limits` en `services.metrics` (`GET /metrics`).
+
+Política:
+- Un bucket por `sensor_id` (`SENSOR_RATE_PER_SEC`, ráfaga `SENSOR_BURST`) y
+    otro por cliente (`CLIENT_RATE_PER_SEC`, ráfaga `CLIENT_BURST`). Cada
+    petición consume un token de su cliente y uno de cada sensor que contiene:
+    un lote cuenta como un envío por sensor, así que vaciar un backlog en
+    lotes no se bloquea, pero un dispositivo en bucle sí.
+- Si algún bucket no tiene token no se consume ninguno y se responde 429 con
+    `Retry-After` (segundos hasta que haya token en el más lento).
+- `INGEST_MAX_CONCURRENCY` limita las escrituras simultáneas: por encima se
+    responde 503 de inmediato en vez de encolar peticiones hasta agotar el
+    pool de conexiones (`Retry-After: 1`).
+
+Estructura compacta: cada tabla guarda `clave -> índice` y dos `array('d')`
+(tokens y último instante). Un bucket inactivo el tiempo suficiente para
+rellenarse equivale a uno nuevo, así que el barrido periódico lo elimina sin
+cambiar el comportamiento; los huecos libres se reutilizan.
+"""
+import math
+import os
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+from services.metrics import register_source
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1").lower() in ("1", "true", "yes")
+SENSOR_RATE_PER_SEC = float(os.getenv("SENSOR_RATE_PER_SEC", "2"))
+SENSOR_BURST = float(os.getenv("SENSOR_BURST", "10"))
+CLIENT_RATE_PER_SEC = float(os.getenv("CLIENT_RATE_PER_SEC", "50"))
+CLIENT_BURST = float(os.getenv("CLIENT_BURST", "200"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Por debajo del pool por defecto de SQLAlchemy (5 + 10 overflow): deja
+# conexiones libres para las lecturas del dashboard.
+INGEST_MAX_CONCURRENCY = int(os.getenv("INGEST_MAX_CONCURRENCY", "10"))
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "").lower() in ("1", "true", "yes")
+
+_SWEEP_EVERY = 1024  # operaciones entre barridos de buckets inactivos
+
+
+class TokenBuckets:
+    """Tabla de token buckets con la misma tasa y ráfaga para todas las claves.
+
+    No es thread-safe por sí sola: `IngestLimiter` la protege con su lock.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._index: Dict[str, int] = {}
+        self._tokens = array("d")
+        self._stamp = array("d")
+        self._free: List[int] = []
+        self._ops = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def available(self, key: str, now: float) -> float:
+        """Tokens disponibles para `key` en `now` (sin consumir)."""
+        i = self._index.get(key)
+        if i is None:
+            return self.burst
+        return min(self.burst, self._tokens[i] + (now - self._stamp[i]) * self.rate)
+
+    def wait_time(self, key: str, now: float, cost: float = 1.0) -> float:
+        """Segundos hasta poder consumir `cost` tokens (0 si ya se puede)."""
+        missing = cost - self.available(key, now)
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else math.inf
+
+    def consume(self, key: str, now: float, cost: float = 1.0) -> None:
+        tokens = self.available(key, now) - cost
+        i = self._index.get(key)
+        if i is None:
+            if len(self._index) >= self.max_keys:
+                self.sweep(now)
+                if len(self._index) >= self.max_keys:
+                    self._evict_oldest()
+            if self._free:
+                i = self._free.pop()
+                self._tokens[i], self._stamp[i] = tokens, now
+            else:
+                i = len(self._tokens)
+                self._tokens.append(tokens)
+                self._stamp.append(now)
+            self._index[key] = i
+        else:
+            self._tokens[i], self._stamp[i] = tokens, now
+        self._ops += 1
+        if self._ops % _SWEEP_EVERY == 0:
+            self.sweep(now)
+
+    def _drop(self, key: str) -> None:
+        self._free.append(self._index.pop(key))
+        self.evicted += 1
+
+    def sweep(self, now: float) -> int:
+        """Elimina los buckets que ya estarían llenos; devuelve cuántos."""
+        stale = [k for k, i in self._index.items()
+                 if self._tokens[i] + (now - self._stamp[i]) * self.rate >= self.burst]
+        for key in stale:
+            self._drop(key)
+        return len(stale)
+
+    def _evict_oldest(self) -> None:
+        # Tabla llena de buckets activos: sacrificar el 1% menos reciente
+        victims = sorted(self._index, key=lambda k: self._stamp[self._index[k]])
+        for key in victims[:max(1, len(victims) // 100)]:
+            self._drop(key)
+
+
+class RateLimited(Exception):
+    """La petición excede algún bucket; `retry_after` en segundos."""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"rate limit exceeded for {scope}")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class IngestLimiter:
+    """Buckets por sensor y por cliente, consumidos de forma atómica."""
+
+    def __init__(self, enabled: bool = RATE_LIMIT_ENABLED,
+                 sensor_rate: float = SENSOR_RATE_PER_SEC, sensor_burst: float = SENSOR_BURST,
+                 client_rate: float = CLIENT_RATE_PER_SEC, client_burst: float = CLIENT_BURST):
+        self.enabled = enabled
+        self.sensors = TokenBuckets(sensor_rate, sensor_burst)
+        self.clients = TokenBuckets(client_rate, client_burst)
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = {"sensor": 0, "client": 0}
+
+    def check(self, client: Optional[str], sensor_ids: Iterable[Optional[str]], now: Optional[float] = None) -> None:
+        """Consume un token del cliente y de cada sensor o lanza `RateLimited`."""
+        if not self.enabled:
+            return
+        now = time.monotonic() if now is None else now
+        sensors = {s for s in sensor_ids if s is not None}
+        client = client or "unknown"
+        with self._lock:
+            waits = [("client", self.clients.wait_time(client, now))]
+            waits += [("sensor", self.sensors.wait_time(s, now)) for s in sensors]
+            scope, retry_after = max(waits, key=lambda w: w[1])
+            if retry_after > 0:
+                self.limited[scope] += 1
+                raise RateLimited(scope, retry_after)
+            self.clients.consume(client, now)
+            for s in sensors:
+                self.sensors.consume(s, now)
+            self.allowed += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.sensors = TokenBuckets(self.sensors.rate, self.sensors.burst, self.sensors.max_keys)
+            self.clients = TokenBuckets(self.clients.rate, self.clients.burst, self.clients.max_keys)
+            self.allowed = 0
+            self.limited = {"sensor": 0, "client": 0}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "sensor": {"rate_per_sec": self.sensors.rate, "burst": self.sensors.burst,
+                           "buckets": len(self.sensors), "evicted": self.sensors.evicted},
+                "client": {"rate_per_sec": self.clients.rate, "burst": self.clients.burst,
+                           "buckets": len(self.clients), "evicted": self.clients.evicted},
+                "allowed": self.allowed,
+                "limited": dict(self.limited),
+            }
+
+
+class Overloaded(Exception):
+    """No quedan huecos de concurrencia: la petición se descarta (503)."""
+
+
+class ConcurrencyLimiter:
+    """Semáforo no bloqueante: o hay hueco ahora o se rechaza la petición."""
+
+    def __init__(self, limit: int = INGEST_MAX_CONCURRENCY):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self.in_flight >= self.limit:
+                self.shed += 1
+                raise Overloaded(f"more than {self.limit} concurrent ingest requests")
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"limit": self.limit, "in_flight": self.in_flight, "peak": self.peak, "shed": self.shed}
+
+
+def client_key(request) -> str:
+    """Identidad del cliente: IP de la conexión, o la primera de
+    `X-Forwarded-For` si `RATE_LIMIT_TRUST_PROXY` (detrás de un proxy propio)."""
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+# Tope de `Retry-After`: con un caudal 0 la espera es infinita (`math.inf`)
+RETRY_AFTER_MAX_SECONDS = 3600
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    """Cabecera `Retry-After` en segundos enteros (entre 1 y `RETRY_AFTER_MAX_SECONDS`)."""
+    return {"Retry-After": str(max(1, math.ceil(min(seconds, RETRY_AFTER_MAX_SECONDS))))}
+
+
+ingest_limiter = IngestLimiter()
+ingest_concurrency = ConcurrencyLimiter()
+
+register_source(
+    "ingest_limits",
+    lambda: {**ingest_limiter.stats(), "concurrency": ingest_concurrency.stats()},
+)
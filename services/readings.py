@@ -0,0 +1,260 @@
+"""
+Lectura unificada de lecturas "calientes" (`sensor_data`) y bloques compactados.
+
+Relación con otros módulos:
+- `routers/analytics.py`, `routers/dashboard.py` y `routers/dashboard_html.py`
+    obtienen sus métricas con `aggregate()` + `summarize()`: la BD calcula
+    count/sum/min/max y los bloques completos aportan sus estadísticas
+    precalculadas, así que nunca se cargan filas en Python para un resumen.
+- Las consultas que necesitan valores individuales (series, exportación) usan
+    `iter_chunks()` / `load_columns()`, que decodifican los bloques con
+    `services.columnar` de forma transparente.
+
+Las ventanas son semiabiertas: `start <= timestamp < end`. Los datetimes sin
+zona horaria se interpretan como UTC.
+"""
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from models import Sensor, SensorBlock
+from services.columnar import decode_floats, decode_timestamps
+
+METRICS = ("temperature", "humidity", "ph", "light")
+# Decimales del promedio por métrica (mismo criterio que `process_data`).
+PRECISION = {"temperature": 1, "humidity": 1, "ph": 2, "light": 0}
+# Valor de `Columns.sensor_key` para lecturas sin sensor (las claves empiezan en 1).
+NO_SENSOR = 0
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_utc(value: datetime) -> datetime:
+    """Normaliza a datetime aware en UTC (naive = UTC)."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def to_micros(value: datetime) -> int:
+    """Microsegundos desde la época (UTC)."""
+    delta = to_utc(value) - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+@dataclass
+class Partial:
+    """Agregado parcial combinable de una métrica (count/sum/min/max)."""
+
+    count: int = 0
+    total: float = 0.0
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+
+    def add(self, count, total, minimum, maximum) -> "Partial":
+        if not count:
+            return self
+        self.count += int(count)
+        self.total += float(total)
+        self.minimum = minimum if self.minimum is None else min(self.minimum, minimum)
+        self.maximum = maximum if self.maximum is None else max(self.maximum, maximum)
+        return self
+
+    def merge(self, other: "Partial") -> "Partial":
+        return self.add(other.count, other.total, other.minimum, other.maximum)
+
+    def add_values(self, values) -> "Partial":
+        if len(values):
+            self.add(len(values), sum(values), min(values), max(values))
+        return self
+
+
+@dataclass
+class Columns:
+    """Lecturas en formato columnar: timestamps en µs, clave de sensor y métricas."""
+
+    ts: array = field(default_factory=lambda: array("q"))
+    sensor_key: array = field(default_factory=lambda: array("q"))
+    metrics: Dict[str, array] = field(default_factory=lambda: {m: array("d") for m in METRICS})
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def extend(self, other: "Columns") -> None:
+        self.ts.extend(other.ts)
+        self.sensor_key.extend(other.sensor_key)
+        for m in METRICS:
+            self.metrics[m].extend(other.metrics[m])
+
+    def take(self, indices) -> "Columns":
+        """Nuevo `Columns` con las posiciones `indices` (en ese orden)."""
+        return Columns(
+            ts=array("q", (self.ts[i] for i in indices)),
+            sensor_key=array("q", (self.sensor_key[i] for i in indices)),
+            metrics={m: array("d", (self.metrics[m][i] for i in indices)) for m in METRICS},
+        )
+
+
+def _hot_filters(start, end, sensor_key):
+    conds = []
+    if start is not None:
+        conds.append(Sensor.timestamp >= to_utc(start))
+    if end is not None:
+        conds.append(Sensor.timestamp < to_utc(end))
+    if sensor_key is not None:
+        conds.append(Sensor.sensor_key == sensor_key)
+    return conds
+
+
+def _block_inside(start, end, sensor_key):
+    """Condiciones de bloques completamente dentro de la ventana."""
+    conds = [SensorBlock.sensor_key == sensor_key] if sensor_key is not None else []
+    if start is not None:
+        conds.append(SensorBlock.ts_start >= to_utc(start))
+    if end is not None:
+        conds.append(SensorBlock.ts_end < to_utc(end))
+    return conds
+
+
+def _block_overlap(start, end, sensor_key):
+    """Condiciones de bloques con al menos una lectura posible en la ventana."""
+    conds = [SensorBlock.sensor_key == sensor_key] if sensor_key is not None else []
+    if start is not None:
+        conds.append(SensorBlock.ts_end >= to_utc(start))
+    if end is not None:
+        conds.append(SensorBlock.ts_start < to_utc(end))
+    return conds
+
+
+def _decode_block(block, start_us=None, end_us=None) -> Columns:
+    ts = decode_timestamps(block.timestamps)
+    cols = Columns(
+        ts=ts,
+        sensor_key=array("q", [block.sensor_key or NO_SENSOR]) * len(ts),
+        metrics={m: decode_floats(getattr(block, m)) for m in METRICS},
+    )
+    if start_us is None and end_us is None:
+        return cols
+    lo = start_us if start_us is not None else -(2**63)
+    hi = end_us if end_us is not None else 2**63 - 1
+    return cols.take([i for i, t in enumerate(ts) if lo <= t < hi])
+
+
+def aggregate(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              sensor_key: Optional[int] = None) -> Dict[str, Partial]:
+    """count/sum/min/max por métrica sobre filas calientes y bloques compactados.
+
+    Como mucho tres consultas: agregado SQL de `sensor_data`, suma de las
+    estadísticas de los bloques completamente dentro de la ventana y, solo si
+    hay bloques en el borde de la ventana, la lectura de esos bloques.
+    """
+    partials = {m: Partial() for m in METRICS}
+
+    hot_cols = [func.count(Sensor.id)]
+    for m in METRICS:
+        col = getattr(Sensor, m)
+        hot_cols += [func.sum(col), func.min(col), func.max(col)]
+    row = db.execute(select(*hot_cols).where(*_hot_filters(start, end, sensor_key))).one()
+    for i, m in enumerate(METRICS):
+        partials[m].add(row[0], row[1 + 3 * i], row[2 + 3 * i], row[3 + 3 * i])
+
+    block_cols = [func.sum(SensorBlock.count)]
+    for m in METRICS:
+        block_cols += [
+            func.sum(getattr(SensorBlock, f"{m}_sum")),
+            func.min(getattr(SensorBlock, f"{m}_min")),
+            func.max(getattr(SensorBlock, f"{m}_max")),
+        ]
+    row = db.execute(select(*block_cols).where(*_block_inside(start, end, sensor_key))).one()
+    for i, m in enumerate(METRICS):
+        partials[m].add(row[0], row[1 + 3 * i], row[2 + 3 * i], row[3 + 3 * i])
+
+    if start is not None or end is not None:
+        start_us = to_micros(start) if start is not None else None
+        end_us = to_micros(end) if end is not None else None
+        inside = _block_inside(start, end, sensor_key)
+        edge_filter = _block_overlap(start, end, sensor_key) + [~and_(*inside)]
+        edge = db.execute(select(SensorBlock).where(*edge_filter)).scalars()
+        for block in edge:
+            cols = _decode_block(block, start_us, end_us)
+            for m in METRICS:
+                partials[m].add_values(cols.metrics[m])
+    return partials
+
+
+def summarize(partials: Dict[str, Partial]) -> Dict:
+    """Convierte agregados parciales al formato de `process_data` (+ `count`).
+
+    Devuelve `{}` si no hay lecturas.
+    """
+    count = partials["temperature"].count
+    if not count:
+        return {}
+    # El redondeo intermedio a 9 decimales absorbe el ruido de coma flotante
+    # que introduce el orden de suma (SQL, bloques, shards), para que los
+    # empates como 21.15 se redondeen igual que `statistics.mean`.
+    nested = {
+        m: {"avg": round(round(p.total / p.count, 9), PRECISION[m]), "max": p.maximum, "min": p.minimum}
+        for m, p in partials.items()
+    }
+    return {
+        "count": count,
+        "avg_temp": nested["temperature"]["avg"],
+        "avg_humidity": nested["humidity"]["avg"],
+        "avg_ph": nested["ph"]["avg"],
+        "max_light": nested["light"]["max"],
+        "min_light": nested["light"]["min"],
+        "metrics": nested,
+    }
+
+
+def iter_chunks(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                sensor_key: Optional[int] = None, chunk_size: int = 10_000) -> Iterator[Columns]:
+    """Recorre todas las lecturas de la ventana en trozos columnares acotados.
+
+    Primero los bloques (datos antiguos, por día) y después las filas calientes
+    ordenadas por timestamp; la memoria usada es la de un trozo o un bloque.
+    """
+    start_us = to_micros(start) if start is not None else None
+    end_us = to_micros(end) if end is not None else None
+    blocks = (
+        select(SensorBlock)
+        .where(*_block_overlap(start, end, sensor_key))
+        .order_by(SensorBlock.day, SensorBlock.sensor_key)
+        .execution_options(yield_per=8)
+    )
+    for block in db.execute(blocks).scalars():
+        cols = _decode_block(block, start_us, end_us)
+        db.expunge(block)
+        if len(cols):
+            yield cols
+
+    stmt = (
+        select(Sensor.timestamp, Sensor.sensor_key, *[getattr(Sensor, m) for m in METRICS])
+        .where(*_hot_filters(start, end, sensor_key))
+        .order_by(Sensor.timestamp, Sensor.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for rows in db.execute(stmt).partitions():
+        cols = Columns()
+        for ts, key, *values in rows:
+            cols.ts.append(to_micros(ts))
+            cols.sensor_key.append(key or NO_SENSOR)
+            for m, v in zip(METRICS, values):
+                cols.metrics[m].append(v)
+        yield cols
+
+
+def load_columns(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 sensor_key: Optional[int] = None) -> Columns:
+    """Todas las lecturas de la ventana en un único `Columns` ordenado por tiempo."""
+    out = Columns()
+    for chunk in iter_chunks(db, start, end, sensor_key):
+        out.extend(chunk)
+    if any(a > b for a, b in zip(out.ts, out.ts[1:])):
+        out = out.take(sorted(range(len(out)), key=out.ts.__getitem__))
+    return out
@@ -0,0 +1,277 @@
+"""
+Buffers circulares en memoria con las lecturas recientes de cada sensor.
+
+Relación con otros módulos:
+- `services/ingest.py` (invocado desde `routers/sensors.py`) añade aquí cada
+    lectura insertada o actualizada, después del `commit`.
+- `main.lifespan` llama a `ring_store.warm()` al arrancar: carga la última
+    `RING_WARM_SECONDS` de lecturas (filas y bloques) con `services.readings`.
+- `routers/analytics.py` pregunta primero a `ring_store.aggregate()` /
+    `ring_store.columns()`: si la ventana está cubierta por la memoria responde
+    sin tocar la BD; si no (devuelven None) usa `services.readings`.
+- Publica su tamaño y aciertos en `GET /metrics` (`ring_buffer`).
+
+Estructura: un `SensorRing` por `sensor_key` con capacidad fija
+(`RING_CAPACITY` lecturas) y columnas `array` preasignadas (timestamp en µs y
+las cuatro métricas); escribir es O(1) y no reserva memoria. La memoria total
+se limita con `RING_MAX_BYTES`: si un sensor nuevo no cabe se descarta el ring
+del sensor con la escritura más antigua.
+
+Cobertura (cuándo la memoria tiene *todas* las lecturas de una ventana):
+- `covered_since`: desde el warm-up, la memoria tiene todo lo posterior a ese
+    instante. Sin warm-up no se responde nada desde memoria.
+- Cada lectura expulsada (por capacidad o por descarte de un ring) sube
+    `evicted_max` (global y por sensor) a su timestamp. Una ventana
+    `[start, end)` se sirve desde memoria solo si
+    `start >= covered_since` y `start > evicted_max`.
+
+Supone un único proceso escritor (uvicorn sin `--workers`): las lecturas que
+ingiere otro proceso (otro worker, scripts de seed, compactación) no llegan a
+este ring y las ventanas servidas desde memoria serían incorrectas sin ningún
+aviso. Por eso es opcional (`RING_BUFFER_ENABLED=1`) y se desactiva siempre
+que hay varios workers declarados (`SHARED_AGGREGATES_NAME`).
+"""
+import os
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from services.metrics import register_source
+from services.readings import METRICS, NO_SENSOR, Columns, Partial, iter_chunks, to_micros
+
+# Opt-in: solo es correcto si la API es el único escritor de la BD
+RING_BUFFER_ENABLED = (
+    os.getenv("RING_BUFFER_ENABLED", "0").lower() in ("1", "true", "yes")
+    and not os.getenv("SHARED_AGGREGATES_NAME")
+)
+RING_CAPACITY = int(os.getenv("RING_CAPACITY", "4096"))
+RING_MAX_BYTES = int(os.getenv("RING_MAX_BYTES", str(32 * 1024 * 1024)))
+RING_WARM_SECONDS = int(os.getenv("RING_WARM_SECONDS", "3600"))
+
+_NEVER = -(2**63)
+_COLUMNS = 1 + len(METRICS)  # ts + métricas, 8 bytes cada una
+
+
+class SensorRing:
+    """Ring de capacidad fija: columnas `ts` (µs) y métricas en `array`."""
+
+    __slots__ = ("capacity", "ts", "metrics", "head", "size", "last_write")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ts = array("q", bytes(8 * capacity))
+        self.metrics = {m: array("d", bytes(8 * capacity)) for m in METRICS}
+        self.head = 0  # próxima posición a escribir
+        self.size = 0
+        self.last_write = 0.0
+
+    @property
+    def nbytes(self) -> int:
+        return self.capacity * 8 * _COLUMNS
+
+    def append(self, ts_us: int, values) -> Optional[int]:
+        """Añade una lectura; devuelve el timestamp expulsado si el ring estaba lleno."""
+        evicted = self.ts[self.head] if self.size == self.capacity else None
+        self.ts[self.head] = ts_us
+        for m, v in zip(METRICS, values):
+            self.metrics[m][self.head] = v
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return evicted
+
+    def replace(self, ts_us: int, values) -> bool:
+        """Sobrescribe los valores de la lectura con ese timestamp (upsert)."""
+        ts = np.frombuffer(self.ts, dtype=np.int64)[:self.size]
+        hits = np.flatnonzero(ts == ts_us)
+        for i in hits:
+            for m, v in zip(METRICS, values):
+                self.metrics[m][i] = v
+        return bool(len(hits))
+
+    def max_ts(self) -> int:
+        if not self.size:
+            return _NEVER
+        return int(np.frombuffer(self.ts, dtype=np.int64)[:self.size].max())
+
+    def select(self, start_us: int, end_us: Optional[int]):
+        """Máscara numpy de las posiciones con `start <= ts < end`."""
+        ts = np.frombuffer(self.ts, dtype=np.int64)[:self.size]
+        mask = ts >= start_us
+        if end_us is not None:
+            mask &= ts < end_us
+        return ts, mask
+
+
+class RingStore:
+    """Rings por sensor con cobertura y límite de memoria, seguro entre hilos."""
+
+    def __init__(self, capacity: int = RING_CAPACITY, max_bytes: int = RING_MAX_BYTES,
+                 enabled: bool = RING_BUFFER_ENABLED):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._rings: Dict[int, SensorRing] = {}
+        self._lock = threading.RLock()
+        self.covered_since: Optional[int] = None
+        self.evicted_max = _NEVER
+        self._evicted_by_sensor: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    # -- escritura -------------------------------------------------------
+    def _evict(self, sensor_key: int, ts_us: int) -> None:
+        self.evicted_max = max(self.evicted_max, ts_us)
+        self._evicted_by_sensor[sensor_key] = max(self._evicted_by_sensor.get(sensor_key, _NEVER), ts_us)
+
+    def _ring_for(self, sensor_key: int) -> SensorRing:
+        ring = self._rings.get(sensor_key)
+        if ring is None:
+            per_ring = self.capacity * 8 * _COLUMNS
+            while self._rings and (len(self._rings) + 1) * per_ring > self.max_bytes:
+                oldest = min(self._rings, key=lambda k: self._rings[k].last_write)
+                self._evict(oldest, self._rings.pop(oldest).max_ts())
+            ring = self._rings[sensor_key] = SensorRing(self.capacity)
+        return ring
+
+    def add(self, sensor_key: Optional[int], ts_us: int, values, replace: bool = False) -> None:
+        """Registra una lectura escrita en la BD (`replace=True` para upserts)."""
+        if not self.enabled:
+            return
+        key = sensor_key or NO_SENSOR
+        with self._lock:
+            ring = self._ring_for(key)
+            ring.last_write = time.monotonic()
+            if replace and ring.replace(ts_us, values):
+                return
+            evicted = ring.append(ts_us, values)
+            if evicted is not None:
+                self._evict(key, evicted)
+
+    def add_many(self, rows: Iterable[tuple], replace: bool = False) -> None:
+        """`rows` = [(sensor_key, ts_us, (t, h, ph, l))]."""
+        for key, ts_us, values in rows:
+            self.add(key, ts_us, values, replace)
+
+    # -- cobertura ---------------------------------------------------------
+    def covers(self, start: Optional[datetime], sensor_key: Optional[int] = None) -> bool:
+        if not self.enabled or self.covered_since is None or start is None:
+            return False
+        start_us = to_micros(start)
+        floor = self.evicted_max if sensor_key is None else self._evicted_by_sensor.get(sensor_key, _NEVER)
+        return start_us >= self.covered_since and start_us > floor
+
+    def _rings_for(self, sensor_key: Optional[int]):
+        if sensor_key is None:
+            return list(self._rings.values())
+        ring = self._rings.get(sensor_key)
+        return [ring] if ring is not None else []
+
+    # -- lectura -----------------------------------------------------------
+    def aggregate(self, start: Optional[datetime], end: Optional[datetime] = None,
+                  sensor_key: Optional[int] = None) -> Optional[Dict[str, Partial]]:
+        """Como `readings.aggregate`, o None si la ventana no está cubierta."""
+        with self._lock:
+            if not self.covers(start, sensor_key):
+                self.misses += 1
+                return None
+            self.hits += 1
+            start_us, end_us = to_micros(start), to_micros(end) if end is not None else None
+            partials = {m: Partial() for m in METRICS}
+            for ring in self._rings_for(sensor_key):
+                _, mask = ring.select(start_us, end_us)
+                if not mask.any():
+                    continue
+                for m in METRICS:
+                    values = np.frombuffer(ring.metrics[m], dtype=np.float64)[:ring.size][mask]
+                    partials[m].add(len(values), float(values.sum()), float(values.min()), float(values.max()))
+            return partials
+
+    def columns(self, start: Optional[datetime], end: Optional[datetime] = None,
+                sensor_key: Optional[int] = None) -> Optional[Columns]:
+        """Como `readings.load_columns` (ordenado por tiempo), o None si no está cubierta."""
+        with self._lock:
+            if not self.covers(start, sensor_key):
+                self.misses += 1
+                return None
+            self.hits += 1
+            start_us, end_us = to_micros(start), to_micros(end) if end is not None else None
+            parts = []
+            for key, ring in self._rings.items():
+                if sensor_key is not None and key != sensor_key:
+                    continue
+                ts, mask = ring.select(start_us, end_us)
+                if mask.any():
+                    metrics = {m: np.frombuffer(ring.metrics[m], dtype=np.float64)[:ring.size][mask] for m in METRICS}
+                    parts.append((ts[mask], np.full(int(mask.sum()), key, dtype=np.int64), metrics))
+        if not parts:
+            return Columns()
+        ts = np.concatenate([p[0] for p in parts])
+        order = np.argsort(ts, kind="stable")
+        return Columns(
+            ts=array("q", ts[order].tobytes()),
+            sensor_key=array("q", np.concatenate([p[1] for p in parts])[order].tobytes()),
+            metrics={m: array("d", np.concatenate([p[2][m] for p in parts])[order].tobytes()) for m in METRICS},
+        )
+
+    # -- ciclo de vida -----------------------------------------------------
+    def warm(self, session_factory, horizon_seconds: int = RING_WARM_SECONDS,
+             now: Optional[datetime] = None, clear: bool = True) -> int:
+        """Carga las lecturas de la última `horizon_seconds` y marca la cobertura.
+
+        Debe ejecutarse antes de servir peticiones (desde el `lifespan`). Con
+        `clear=False` añade las lecturas de otra base (shards) sin vaciar los rings.
+        """
+        if not self.enabled:
+            return 0
+        now = now or datetime.now(timezone.utc)
+        since = now - timedelta(seconds=horizon_seconds)
+        loaded = 0
+        with self._lock:
+            if clear:
+                self._rings.clear()
+                self._evicted_by_sensor.clear()
+                self.evicted_max = _NEVER
+            db = session_factory()
+            try:
+                for chunk in iter_chunks(db, start=since):
+                    for i in range(len(chunk)):
+                        values = tuple(chunk.metrics[m][i] for m in METRICS)
+                        self.add(chunk.sensor_key[i], chunk.ts[i], values)
+                    loaded += len(chunk)
+            finally:
+                db.close()
+            self.covered_since = to_micros(since)
+        return loaded
+
+    def reset(self) -> None:
+        """Vacía todo y desactiva la cobertura hasta el próximo `warm()`."""
+        with self._lock:
+            self._rings.clear()
+            self._evicted_by_sensor.clear()
+            self.covered_since = None
+            self.evicted_max = _NEVER
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "sensors": len(self._rings),
+                "readings": sum(r.size for r in self._rings.values()),
+                "capacity_per_sensor": self.capacity,
+                "bytes": sum(r.nbytes for r in self._rings.values()),
+                "max_bytes": self.max_bytes,
+                "covered_since_us": self.covered_since,
+                "evicted_max_us": None if self.evicted_max == _NEVER else self.evicted_max,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+ring_store = RingStore()
+
+register_source("ring_buffer", ring_store.stats)
@@ -0,0 +1,118 @@
+"""
+Resolución código externo <-> clave entera de la dimensión `sensors`.
+
+Relación con otros módulos:
+- `routers/sensors.py` resuelve el `sensor_id` recibido a `sensor_key` antes de
+    insertar; los endpoints que devuelven lecturas traducen de vuelta.
+- Usa `database.dialect_insert` para registrar sensores nuevos con
+    `ON CONFLICT DO NOTHING`, de modo que dos workers que ven el mismo código
+    nuevo a la vez no fallan por la restricción única.
+
+La caché es un dict en memoria: los códigos de sensor son pocos y estables, así
+que tras el primer uso la resolución no cuesta ninguna consulta. Las claves de
+sensores creados en una transacción se guardan aparte en la sesión
+(`Session.info`) y solo pasan a la caché compartida tras su `commit`: otra
+petición nunca usa una clave que aún podría deshacerse con un rollback.
+"""
+import threading
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import SensorDevice
+
+
+_PENDING = "sensor_registry.pending"
+
+
+class SensorRegistry:
+    """Caché bidireccional code -> id / id -> code, segura entre hilos."""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._codes: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, rows) -> None:
+        with self._lock:
+            for key, code in rows:
+                self._ids[code] = key
+                self._codes[key] = code
+
+    def resolve_many(self, db: Session, codes: Iterable[Optional[str]]) -> Dict[str, int]:
+        """Devuelve {code: id} para todos los códigos, creando los que falten.
+
+        Como mucho tres consultas por llamada (buscar, insertar, releer), y
+        ninguna si todos los códigos ya están en caché. Los creados aquí se
+        cachean cuando `db` confirma (y se olvidan si hace rollback).
+        """
+        wanted = {c for c in codes if c is not None}
+        pending = db.info.setdefault(_PENDING, {}).setdefault(self, {})
+        missing = [c for c in wanted if c not in self._ids and c not in pending]
+        if missing:
+            table = SensorDevice.__table__
+            found = db.execute(select(table.c.id, table.c.code).where(table.c.code.in_(missing))).all()
+            self._remember(found)
+            new = [c for c in missing if c not in self._ids]
+            if new:
+                stmt = dialect_insert(table, db).values([{"code": c} for c in new])
+                db.execute(stmt.on_conflict_do_nothing(index_elements=["code"]))
+                created = db.execute(select(table.c.id, table.c.code).where(table.c.code.in_(new))).all()
+                # Filas de esta transacción (o de otro worker, ya confirmadas):
+                # a la caché compartida solo después del commit
+                pending.update((code, key) for key, code in created)
+        return {c: self._ids[c] if c in self._ids else pending[c] for c in wanted}
+
+    def resolve(self, db: Session, code: Optional[str]) -> Optional[int]:
+        """Clave entera de `code` (None si la lectura no trae sensor)."""
+        if code is None:
+            return None
+        key = self._ids.get(code)
+        if key is None:
+            key = self.resolve_many(db, [code])[code]
+        return key
+
+    def lookup(self, db: Session, code: str) -> Optional[int]:
+        """Clave de un código existente, sin registrarlo (None si no existe).
+
+        Para filtros de lectura: consultar un sensor desconocido no debe darlo
+        de alta en la dimensión.
+        """
+        key = self._ids.get(code)
+        if key is None:
+            table = SensorDevice.__table__
+            found = db.execute(select(table.c.id, table.c.code).where(table.c.code == code)).all()
+            self._remember(found)
+            key = self._ids.get(code)
+        return key
+
+    def codes_for(self, db: Session, keys: Iterable[Optional[int]]) -> Dict[int, str]:
+        """Devuelve {id: code} para las claves indicadas."""
+        wanted = {k for k in keys if k is not None}
+        missing = [k for k in wanted if k not in self._codes]
+        if missing:
+            table = SensorDevice.__table__
+            self._remember(db.execute(select(table.c.id, table.c.code).where(table.c.id.in_(missing))).all())
+        return {k: self._codes[k] for k in wanted if k in self._codes}
+
+    def clear(self) -> None:
+        """Vacía la caché (p. ej. si se borran o restauran filas de `sensors`)."""
+        with self._lock:
+            self._ids.clear()
+            self._codes.clear()
+
+
+registry = SensorRegistry()
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_pending(session: Session) -> None:
+    for reg, rows in session.info.pop(_PENDING, {}).items():
+        reg._remember((key, code) for code, key in rows.items())
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending(session: Session) -> None:
+    session.info.pop(_PENDING, None)
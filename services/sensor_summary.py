@@ -0,0 +1,202 @@
+"""
+Resumen por sensor precalculado (vista materializada / tabla resumen).
+
+Relación con otros módulos:
+- `routers/analytics.py` sirve `GET /analytics/sensors` leyendo `sensor_summary`
+    (una fila por sensor) en lugar de reagrupar `sensor_data` en cada petición.
+- `services/ingest.py` llama a `summary_refresher.note_writes()` tras cada
+    escritura; `main.lifespan` ejecuta `summary_refresher.run_periodically()`.
+- `migrations.py` (v5) crea el almacenamiento con `ensure_storage()`.
+- Con shards (`services.sharding`) cada shard tiene su propio resumen: los
+    métodos de refresco aceptan varios engines y se refrescan juntos.
+
+Almacenamiento según el motor:
+- Postgres: `MATERIALIZED VIEW sensor_summary` con índice único por
+    `sensor_key`, lo que permite `REFRESH MATERIALIZED VIEW CONCURRENTLY`: las
+    lecturas no se bloquean durante el refresco.
+- SQLite: tabla `sensor_summary` con las mismas columnas, reescrita en una
+    transacción (DELETE + INSERT ... SELECT).
+
+La vista guarda count/sum/min/max por métrica (sumando filas calientes y
+estadísticas de `sensor_data_blocks`), de modo que los promedios salen exactos
+y con el mismo redondeo que `services.readings.summarize`. `refreshed_at` es el
+instante del último refresco y se devuelve como marca de frescura.
+
+Se refresca cuando se cumple la primera condición: nunca se ha refrescado en
+este proceso, se acumulan `SUMMARY_REFRESH_WRITES` escrituras o pasan
+`SUMMARY_REFRESH_SECONDS` desde el último refresco.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from services.readings import METRICS, Partial, summarize, to_utc
+
+SUMMARY_NAME = "sensor_summary"
+SUMMARY_REFRESH_WRITES = int(os.getenv("SUMMARY_REFRESH_WRITES", "1000"))
+SUMMARY_REFRESH_SECONDS = float(os.getenv("SUMMARY_REFRESH_SECONDS", "300"))
+SUMMARY_POLL_SECONDS = float(os.getenv("SUMMARY_POLL_SECONDS", "5"))
+
+
+def _aggregate_sql(refreshed_at: str) -> str:
+    """SELECT por sensor que une filas calientes y bloques compactados."""
+    hot = ", ".join(
+        f"SUM({m}) AS {m}_sum, MIN({m}) AS {m}_min, MAX({m}) AS {m}_max" for m in METRICS
+    )
+    # Mismo rollup para los bloques y para combinar ambos orígenes
+    rollup = ", ".join(
+        f"SUM({m}_sum) AS {m}_sum, MIN({m}_min) AS {m}_min, MAX({m}_max) AS {m}_max" for m in METRICS
+    )
+    return (
+        f"SELECT sensor_key, SUM(n) AS count, {rollup}, {refreshed_at} AS refreshed_at FROM ("
+        f"SELECT sensor_key, COUNT(*) AS n, {hot} FROM sensor_data "
+        "WHERE sensor_key IS NOT NULL GROUP BY sensor_key "
+        "UNION ALL "
+        f"SELECT sensor_key, SUM(count) AS n, {rollup} FROM sensor_data_blocks "
+        "WHERE sensor_key IS NOT NULL GROUP BY sensor_key"
+        ") parts GROUP BY sensor_key"
+    )
+
+
+def ensure_storage(conn: Connection) -> None:
+    """Crea la vista materializada (Postgres) o la tabla resumen (SQLite)."""
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql(
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {SUMMARY_NAME} AS {_aggregate_sql('now()')}"
+        )
+        # Requisito de REFRESH ... CONCURRENTLY
+        conn.exec_driver_sql(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{SUMMARY_NAME}_key ON {SUMMARY_NAME} (sensor_key)"
+        )
+    else:
+        columns = ", ".join(f"{m}_sum FLOAT, {m}_min FLOAT, {m}_max FLOAT" for m in METRICS)
+        conn.exec_driver_sql(
+            f"CREATE TABLE IF NOT EXISTS {SUMMARY_NAME} "
+            f"(sensor_key INTEGER PRIMARY KEY, count INTEGER NOT NULL, {columns}, refreshed_at TIMESTAMP)"
+        )
+
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    if value is None:
+        return None
+    if isinstance(value, str):  # SQLite devuelve el texto tal cual
+        value = datetime.fromisoformat(value)
+    return to_utc(value)
+
+
+class SummaryRefresher:
+    """Decide cuándo refrescar `sensor_summary` y lo refresca de uno en uno."""
+
+    def __init__(self, max_writes: int = SUMMARY_REFRESH_WRITES, max_age: float = SUMMARY_REFRESH_SECONDS):
+        self.max_writes = max_writes
+        self.max_age = max_age
+        self.pending_writes = 0
+        self.refreshed_at: Optional[datetime] = None
+        self._refreshed_monotonic: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._storage_ready = weakref.WeakSet()
+
+    def note_writes(self, count: int) -> None:
+        """Registra `count` filas nuevas o modificadas desde el último refresco."""
+        if count:
+            with self._lock:
+                self.pending_writes += count
+
+    def is_due(self) -> bool:
+        if self._refreshed_monotonic is None:
+            return True
+        return (self.pending_writes >= self.max_writes
+                or time.monotonic() - self._refreshed_monotonic >= self.max_age)
+
+    def _ensure(self, engine: Engine) -> None:
+        if engine not in self._storage_ready:
+            with engine.begin() as conn:
+                ensure_storage(conn)
+            self._storage_ready.add(engine)
+
+    def refresh(self, *engines: Engine) -> datetime:
+        """Recalcula el resumen ahora (bloqueante) y devuelve la marca de frescura."""
+        with self._refresh_lock:
+            return self._refresh(*engines)
+
+    def _refresh(self, *engines: Engine) -> datetime:
+        with self._lock:
+            pending = self.pending_writes
+        now = datetime.now(timezone.utc)
+        for engine in engines:
+            self._ensure(engine)
+            with engine.begin() as conn:
+                if conn.dialect.name == "postgresql":
+                    conn.exec_driver_sql(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {SUMMARY_NAME}")
+                else:
+                    conn.exec_driver_sql(f"DELETE FROM {SUMMARY_NAME}")
+                    conn.execute(
+                        text(f"INSERT INTO {SUMMARY_NAME} {_aggregate_sql(':refreshed_at')}"),
+                        {"refreshed_at": now.replace(tzinfo=None).isoformat(sep=" ")},
+                    )
+        with self._lock:
+            # Las escrituras llegadas durante el refresco cuentan para el próximo
+            self.pending_writes -= pending
+            self.refreshed_at = now
+            self._refreshed_monotonic = time.monotonic()
+        return now
+
+    def refresh_if_due(self, *engines: Engine) -> bool:
+        """Refresca si toca; si otro hilo ya está refrescando, no espera."""
+        if not self.is_due() or not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            self._refresh(*engines)
+        finally:
+            self._refresh_lock.release()
+        return True
+
+    async def run_periodically(self, engines_factory, interval: float = SUMMARY_POLL_SECONDS) -> None:
+        """Bucle del `lifespan`: comprueba cada `interval` s si toca refrescar.
+
+        `engines_factory()` devuelve la lista de engines a refrescar.
+        """
+        while True:
+            try:
+                await run_in_threadpool(self.refresh_if_due, *engines_factory())
+            except Exception:  # un fallo puntual no debe matar el bucle
+                pass
+            await asyncio.sleep(interval)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.pending_writes = 0
+            self.refreshed_at = None
+            self._refreshed_monotonic = None
+            self._storage_ready.clear()
+
+
+summary_refresher = SummaryRefresher()
+
+
+def read_summary(conn) -> Dict:
+    """Filas de `sensor_summary` -> `{"refreshed_at", "sensors": {sensor_key: summarize()}}`.
+
+    `conn` puede ser una sesión o una conexión.
+    """
+    rows = conn.execute(text(f"SELECT * FROM {SUMMARY_NAME}")).mappings().all()
+    sensors = {}
+    refreshed_at = None
+    for row in rows:
+        partials = {
+            m: Partial().add(row["count"], row[f"{m}_sum"], row[f"{m}_min"], row[f"{m}_max"]) for m in METRICS
+        }
+        summary = summarize(partials)
+        sensors[row["sensor_key"]] = {"count": summary["count"], **summary["metrics"]}
+        stamp = _parse_timestamp(row["refreshed_at"])
+        refreshed_at = stamp if refreshed_at is None else max(refreshed_at, stamp)
+    return {"refreshed_at": refreshed_at, "sensors": sensors}
@@ -0,0 +1,243 @@
+"""
+Reparto opcional de las lecturas entre varias bases de datos (shards) por sensor.
+
+Relación con otros módulos:
+- `services/ingest.py` agrupa cada lote por shard (`shards.shard_for`) y
+    escribe los grupos en paralelo, cada uno en su base.
+- `routers/analytics.py`, `routers/dashboard.py` y `routers/dashboard_html.py`
+    usan `aggregate()` / `load_columns()` de este módulo en lugar de los de
+    `services.readings`. Sin shards son exactamente esas funciones; con shards
+    lanzan la consulta en todos los shards a la vez y combinan el resultado
+    (`Partial.merge` es exacto: count/sum/min/max).
+- `main.lifespan` prepara el esquema de cada shard (`init_shards`) y carga
+    rings y tendencia desde todos (`session_factories`).
+- `services.sensor_summary` refresca la tabla resumen de cada shard
+    (`write_engines`) y `/analytics/sensors` une sus filas (`read_summaries`).
+- Publica sus contadores en `GET /metrics` (`sharding`).
+
+Configuración: `SHARD_URLS` = URLs SQLAlchemy separadas por comas (en local,
+varios ficheros SQLite). Vacía = sin sharding: todo va a `database.engine`.
+
+Reparto:
+- Shard de un sensor = `crc32(code) % N`: estable entre procesos y reinicios
+    (a diferencia de `hash()`) y sin tabla de asignación. Las lecturas sin
+    sensor van al shard 0. Cambiar N reubica sensores: requiere migrar datos.
+- `database.engine` sigue siendo el catálogo: la dimensión `sensors`
+    (`services.sensor_registry`) asigna las claves. Cada shard guarda una
+    copia, con la misma clave, de las filas de `sensors` que referencian sus
+    lecturas, para que se cumpla la FK de `sensor_data`.
+- Un lote que toca varios shards no es atómico: cada shard confirma por su
+    lado. Si uno falla, la petición responde 500 y el reintento del gateway es
+    inocuo (`ON CONFLICT DO NOTHING`) para las lecturas que sí entraron.
+- Los shards se leen en su propio engine (sin réplica de lectura). La
+    compactación y la exportación (`scripts/compact_readings.py`,
+    `scripts/export_snapshot.py`) trabajan sobre una base: se ejecutan por
+    shard con `DATABASE_URL=<url del shard>`.
+"""
+import contextvars
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+import database
+from models import SensorDevice
+from services import readings
+from services.metrics import register_source
+from services.profiling import profiled_call
+from services.readings import METRICS, Columns, Partial
+from services.sensor_registry import registry
+
+SHARD_URLS = [url.strip() for url in os.getenv("SHARD_URLS", "").split(",") if url.strip()]
+
+
+class ShardSet:
+    """Engines de los shards (perezosos) y pool de hilos para el scatter-gather."""
+
+    def __init__(self, urls: Sequence[str] = ()):
+        self.urls = list(urls)
+        self._engines: Dict[int, Engine] = {}
+        self._factories: Dict[int, sessionmaker] = {}
+        # Claves de `sensors` ya copiadas en cada shard
+        self._devices: Dict[int, set] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.rows_written = [0] * len(self.urls)
+        self.scatters = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.urls)
+
+    def __len__(self) -> int:
+        return len(self.urls)
+
+    def shard_for(self, code: Optional[str]) -> int:
+        """Índice del shard de un código de sensor (0 para lecturas sin sensor)."""
+        if code is None:
+            return 0
+        return zlib.crc32(code.encode("utf-8")) % len(self.urls)
+
+    def engine(self, index: int) -> Engine:
+        engine = self._engines.get(index)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(index)
+                if engine is None:
+                    engine = self._engines[index] = database._build_engine(self.urls[index])
+        return engine
+
+    def sessionmaker(self, index: int) -> sessionmaker:
+        factory = self._factories.get(index)
+        if factory is None:
+            factory = sessionmaker(bind=self.engine(index), autoflush=False, autocommit=False)
+            self._factories[index] = factory
+        return factory
+
+    def targets(self, db: Session, sensor_key: Optional[int]) -> List[int]:
+        """Shards que pueden tener lecturas del filtro `sensor_key` (None = todos)."""
+        if sensor_key is None:
+            return list(range(len(self.urls)))
+        code = registry.codes_for(db, [sensor_key]).get(sensor_key)
+        return [self.shard_for(code)] if code is not None else []
+
+    def scatter(self, fn: Callable[[int, Session], object], indices: Sequence[int],
+                return_exceptions: bool = False) -> List:
+        """`fn(índice, sesión)` en cada shard de `indices`, en paralelo.
+
+        Cada llamada abre y cierra su propia sesión. Con `return_exceptions`
+        los errores se devuelven en su posición en lugar de lanzarse (como
+        `asyncio.gather`), para que el llamador sepa qué shards sí terminaron.
+        """
+        def run(index):
+            with self.sessionmaker(index)() as session:
+                return fn(index, session)
+
+        with self._lock:
+            self.scatters += 1
+            if self._pool is None:
+                # Varias peticiones pueden estar repartiendo a la vez
+                self._pool = ThreadPoolExecutor(max_workers=4 * len(self.urls), thread_name_prefix="shard")
+            pool = self._pool
+        # Copia del contexto por tarea: perfilado y ruta de la petición viajan al hilo
+        futures = [pool.submit(contextvars.copy_context().run, profiled_call, run, i) for i in indices]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                if not return_exceptions:
+                    raise
+                results.append(exc)
+        return results
+
+    def ensure_devices(self, index: int, session: Session, keys: Dict[int, str]) -> None:
+        """Copia en el shard las filas de `sensors` ({clave: código}) que aún no tenga."""
+        known = self._devices.setdefault(index, set())
+        missing = {k: c for k, c in keys.items() if k not in known}
+        if not missing:
+            return
+        table = SensorDevice.__table__
+        stmt = database.dialect_insert(table, session).values(
+            [{"id": k, "code": c} for k, c in missing.items()]
+        )
+        session.execute(stmt.on_conflict_do_nothing(index_elements=["id"]))
+        session.commit()
+        with self._lock:
+            known.update(missing)
+
+    def note_written(self, index: int, rows: int) -> None:
+        with self._lock:
+            self.rows_written[index] += rows
+
+    def reset(self) -> None:
+        with self._lock:
+            self._devices.clear()
+            self.rows_written = [0] * len(self.urls)
+            self.scatters = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "shards": len(self.urls),
+                "rows_written": list(self.rows_written),
+                "scatter_queries": self.scatters,
+            }
+
+
+shards = ShardSet(SHARD_URLS)
+
+register_source("sharding", shards.stats)
+
+
+def init_shards() -> None:
+    """`database.init_db` en cada shard (no hace nada sin `SHARD_URLS`)."""
+    for index in range(len(shards)):
+        database.init_db(shards.engine(index))
+
+
+def session_factories() -> List[sessionmaker]:
+    """Factorías de sesión de todas las bases con lecturas."""
+    if not shards.enabled:
+        return [database.get_sessionmaker()]
+    return [shards.sessionmaker(i) for i in range(len(shards))]
+
+
+def write_engines() -> List[Engine]:
+    """Engines de todas las bases con lecturas (escritores)."""
+    if not shards.enabled:
+        return [database.get_engine()]
+    return [shards.engine(i) for i in range(len(shards))]
+
+
+def aggregate(db: Session, start=None, end=None, sensor_key: Optional[int] = None) -> Dict[str, Partial]:
+    """`services.readings.aggregate` sobre todos los shards, combinado.
+
+    `db` es la sesión de la petición; con shards solo se usa como catálogo
+    para saber en qué shard está `sensor_key`.
+    """
+    if not shards.enabled:
+        return readings.aggregate(db, start, end, sensor_key)
+    merged = {m: Partial() for m in METRICS}
+    parts = shards.scatter(lambda _, s: readings.aggregate(s, start, end, sensor_key), shards.targets(db, sensor_key))
+    for partials in parts:
+        for m in METRICS:
+            merged[m].merge(partials[m])
+    return merged
+
+
+def load_columns(db: Session, start=None, end=None, sensor_key: Optional[int] = None) -> Columns:
+    """`services.readings.load_columns` sobre todos los shards, ordenado por tiempo."""
+    if not shards.enabled:
+        return readings.load_columns(db, start, end, sensor_key)
+    out = Columns()
+    parts = shards.scatter(
+        lambda _, s: readings.load_columns(s, start, end, sensor_key), shards.targets(db, sensor_key)
+    )
+    for part in parts:
+        out.extend(part)
+    if len(parts) > 1:
+        # Cada parte ya viene ordenada; un sort estable conserva el orden de empates
+        order = np.argsort(np.frombuffer(out.ts, dtype=np.int64), kind="stable")
+        out = out.take(order.tolist())
+    return out
+
+
+def read_summaries(db: Session, read_summary: Callable) -> Dict:
+    """`read_summary` de cada shard unido: cada sensor vive en un solo shard.
+
+    `refreshed_at` es el más antiguo de los shards (la frescura garantizada).
+    """
+    if not shards.enabled:
+        return read_summary(db)
+    parts = shards.scatter(lambda _, s: read_summary(s), range(len(shards)))
+    stamps = [p["refreshed_at"] for p in parts if p["refreshed_at"] is not None]
+    sensors = {}
+    for part in parts:
+        sensors.update(part["sensors"])
+    return {"refreshed_at": min(stamps) if stamps else None, "sensors": sensors}
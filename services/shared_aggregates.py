@@ -0,0 +1,458 @@
+"""
+Agregados count/sum/min/max por sensor en memoria compartida entre procesos.
+
+Relación con otros módulos:
+- `main.lifespan` llama a `shared_aggregates.start()`: abre (o crea) el
+    segmento `SHARED_AGGREGATES_NAME` de `multiprocessing.shared_memory` y lo
+    reconstruye desde la BD (todas las bases de `services.sharding`).
+- `services/ingest.py` escribe dentro de `write_gate()` y suma las lecturas
+    nuevas con `add_many()`; las sobrescritas (`on_conflict=update`) marcan el
+    sensor como obsoleto (`mark_stale()`) y se recalculan al terminar
+    (`rebuild_stale()`).
+- `routers/analytics.py` (`/analytics` sin ventana, `/analytics/sensors`),
+    `routers/dashboard.py` y `routers/dashboard_html.py` leen `totals()` /
+    `per_sensor()`: O(sensores), sin ida y vuelta a la BD. Devuelven None si
+    el segmento no puede responder (desactivado, sensor obsoleto...) y el
+    llamador usa el camino de siempre.
+- Con el segmento activo `services.cache.data_generation()` usa su contador
+    de generación: una escritura en un worker invalida las cachés de todos.
+- Publica sus contadores (de este proceso) en `GET /metrics` (`shared_aggregates`).
+
+Desactivado por defecto: solo tiene sentido con `uvicorn --workers N`, y
+necesita `fcntl` (Linux/macOS).
+
+Disposición del segmento (arrays numpy sobre el buffer compartido):
+- Cabecera: `magic`, `slots`, `instance` (aleatorio, por creación), `seq`,
+    `generation` y `overflow`.
+- `slots` registros fijos, uno por `sensor_key` (el 0 = lecturas sin
+    sensor): `count`, `stale` y `sum`/`min`/`max` por métrica. Una clave
+    `>= SHARED_AGGREGATES_SLOTS` no cabe: se anota en `overflow` y los totales
+    globales dejan de servirse desde aquí.
+
+Concurrencia:
+- Escritores: un `flock` exclusivo (`<nombre>.write.lock`) los serializa entre
+    procesos e hilos (cada adquisición abre su propio descriptor).
+- Lectores en x86-64: sin bloqueo, con seqlock: el escritor pone `seq`
+    impar, escribe y lo vuelve a poner par; el lector copia los registros y
+    reintenta si `seq` era impar o cambió. Tras `SEQLOCK_RETRIES` intentos se
+    rinde (None). numpy no emite barreras de memoria: el seqlock solo es
+    correcto porque x86-64 no reordena stores con stores ni loads con loads.
+- Lectores en otras arquitecturas (aarch64: Graviton, Docker en Apple
+    silicon): el modelo de memoria sí reordena y un lector podría ver el `seq`
+    nuevo junto a registros a medias. Ahí copian con el lock de escritura en
+    modo compartido (`locked_reads`); la llamada al sistema hace de barrera.
+- Reconstrucción frente a ingesta: la ingesta mantiene `<nombre>.gate.lock`
+    compartido desde el `commit` hasta sumar sus lecturas; `rebuild()` lo toma
+    exclusivo, así que la consulta a la BD y el segmento ven exactamente las
+    mismas escrituras.
+El segmento sobrevive a los procesos (no se borra al salir un worker) y cada
+proceso lo reconstruye al arrancar, de modo que escrituras hechas fuera de la
+API (scripts de seed) se recogen en el siguiente arranque. `unlink()` lo elimina.
+"""
+import inspect
+import os
+import platform
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import func, or_, select
+
+from models import Sensor, SensorBlock
+from services import cache
+from services.metrics import register_source
+from services.readings import METRICS, NO_SENSOR, Partial
+
+try:
+    import fcntl
+except ImportError:  # Windows: la función no está disponible
+    fcntl = None
+
+SHARED_AGGREGATES_NAME = os.getenv("SHARED_AGGREGATES_NAME", "")
+SHARED_AGGREGATES_SLOTS = int(os.getenv("SHARED_AGGREGATES_SLOTS", "4096"))
+SHARED_AGGREGATES_LOCK_DIR = os.getenv("SHARED_AGGREGATES_LOCK_DIR", tempfile.gettempdir())
+SEQLOCK_RETRIES = 100
+# Arquitecturas con orden total de stores (TSO), donde el seqlock sin barreras vale
+_SEQLOCK_SAFE = platform.machine().lower() in ("x86_64", "amd64")
+
+_MAGIC = 0x41475341_00000001  # "AGSA", versión 1
+
+HEADER = np.dtype([
+    ("magic", "<u8"), ("slots", "<u8"), ("instance", "<u8"), ("seq", "<u8"),
+    ("generation", "<u8"), ("overflow", "<u8"),
+])
+SLOT = np.dtype([
+    ("count", "<i8"), ("stale", "<i8"),
+    ("sum", "<f8", (len(METRICS),)), ("min", "<f8", (len(METRICS),)), ("max", "<f8", (len(METRICS),)),
+])
+
+
+# Python 3.13+ permite abrir el segmento sin registrarlo en el resource_tracker
+_HAS_TRACK = "track" in inspect.signature(SharedMemory).parameters
+
+
+def _shared_memory(name: str, create: bool, size: int = 0) -> SharedMemory:
+    # El segmento es de todos los workers: que el resource_tracker no lo borre
+    # cuando termine el proceso que lo abrió
+    if _HAS_TRACK:
+        return SharedMemory(name=name, create=create, size=size, track=False)
+    shm = SharedMemory(name=name, create=create, size=size)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _unlink(shm: SharedMemory) -> None:
+    if not _HAS_TRACK:
+        # `unlink()` lo da de baja en el tracker: volver a darlo de alta antes
+        resource_tracker.register(shm._name, "shared_memory")
+    shm.unlink()
+
+
+@contextmanager
+def _flock(path: str, mode: int):
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, mode)
+        yield
+    finally:
+        os.close(fd)  # cerrar libera el lock
+
+
+def _empty(slots: np.ndarray) -> None:
+    slots["count"] = 0
+    slots["stale"] = 0
+    slots["sum"] = 0.0
+    slots["min"] = np.inf
+    slots["max"] = -np.inf
+
+
+def _partials(slot) -> Dict[str, Partial]:
+    count = int(slot["count"])
+    if not count:
+        return {m: Partial() for m in METRICS}
+    return {
+        m: Partial(count, float(slot["sum"][i]), float(slot["min"][i]), float(slot["max"][i]))
+        for i, m in enumerate(METRICS)
+    }
+
+
+def collect(db, keys: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, Partial]]:
+    """count/sum/min/max por `sensor_key` (NO_SENSOR = sin sensor) en una base.
+
+    Dos consultas agrupadas (filas calientes y bloques), en la misma
+    transacción; `keys` limita el cálculo a esos sensores.
+    """
+    out: Dict[int, Dict[str, Partial]] = {}
+    if db.get_bind().dialect.name == "postgresql":
+        # Misma instantánea para las dos consultas (compactación concurrente)
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    hot = [Sensor.sensor_key, func.count(Sensor.id)]
+    for m in METRICS:
+        col = getattr(Sensor, m)
+        hot += [func.sum(col), func.min(col), func.max(col)]
+    blocks = [SensorBlock.sensor_key, func.sum(SensorBlock.count)]
+    for m in METRICS:
+        blocks += [
+            func.sum(getattr(SensorBlock, f"{m}_sum")),
+            func.min(getattr(SensorBlock, f"{m}_min")),
+            func.max(getattr(SensorBlock, f"{m}_max")),
+        ]
+    keys = None if keys is None else list(keys)
+    for model, columns in ((Sensor, hot), (SensorBlock, blocks)):
+        stmt = select(*columns).group_by(model.sensor_key)
+        if keys is not None:
+            conds = [model.sensor_key.in_([k for k in keys if k != NO_SENSOR])]
+            if NO_SENSOR in keys:
+                conds.append(model.sensor_key.is_(None))
+            stmt = stmt.where(or_(*conds))
+        for row in db.execute(stmt):
+            partials = out.setdefault(row[0] or NO_SENSOR, {m: Partial() for m in METRICS})
+            for i, m in enumerate(METRICS):
+                partials[m].add(row[1], row[2 + 3 * i], row[3 + 3 * i], row[4 + 3 * i])
+    return out
+
+
+class SharedAggregates:
+    """Vista de este proceso sobre el segmento compartido (None si no está abierto)."""
+
+    def __init__(self, name: str = SHARED_AGGREGATES_NAME, slots: int = SHARED_AGGREGATES_SLOTS,
+                 lock_dir: str = SHARED_AGGREGATES_LOCK_DIR):
+        self.name = name
+        self.slots = slots
+        self.lock_dir = lock_dir
+        self._shm: Optional[SharedMemory] = None
+        self._header = None
+        self._slots = None
+        self._session_factories: Callable[[], List] = lambda: []
+        # Copiar con `flock` compartido en lugar del seqlock (ver docstring del módulo)
+        self.locked_reads = not _SEQLOCK_SAFE
+        self._lock = threading.Lock()
+        self.reads = self.fallbacks = self.retries = self.rebuilds = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._shm is not None
+
+    @property
+    def _gate_path(self) -> str:
+        return os.path.join(self.lock_dir, f"{self.name}.gate.lock")
+
+    @property
+    def _write_path(self) -> str:
+        return os.path.join(self.lock_dir, f"{self.name}.write.lock")
+
+    # --- ciclo de vida -------------------------------------------------------
+
+    def start(self, session_factories: Callable[[], List]) -> None:
+        """Abre o crea el segmento y lo reconstruye desde la BD (no hace nada sin nombre).
+
+        `session_factories()` devuelve las factorías de sesión de todas las
+        bases con lecturas (`services.sharding.session_factories`).
+        """
+        if not self.name:
+            return
+        if self._shm is not None:
+            self._session_factories = session_factories
+            self.rebuild()
+            return
+        if fcntl is None:
+            raise RuntimeError("SHARED_AGGREGATES_NAME requires fcntl (POSIX) for the writer lock")
+        self._session_factories = session_factories
+        size = HEADER.itemsize + SLOT.itemsize * self.slots
+        with _flock(self._gate_path, fcntl.LOCK_EX):
+            try:
+                shm = _shared_memory(self.name, create=True, size=size)
+                created = True
+            except FileExistsError:
+                shm = _shared_memory(self.name, create=False)
+                created = False
+            header = np.ndarray((1,), dtype=HEADER, buffer=shm.buf)
+            if created:
+                header["slots"] = self.slots
+                header["instance"] = secrets.randbits(63)
+                header["magic"] = _MAGIC
+            elif header["magic"][0] != _MAGIC or header["slots"][0] != self.slots:
+                shm.close()
+                raise RuntimeError(
+                    f"shared memory segment {self.name!r} has a different layout "
+                    f"(expected {self.slots} slots): unlink it or change SHARED_AGGREGATES_NAME"
+                )
+            self._shm = shm
+            self._header = header
+            self._slots = np.ndarray((self.slots,), dtype=SLOT, buffer=shm.buf, offset=HEADER.itemsize)
+            self._rebuild(None)
+        cache.use_shared_generation(self)
+
+    def close(self) -> None:
+        """Suelta la vista de este proceso (el segmento sigue existiendo)."""
+        if self._shm is None:
+            return
+        cache.use_shared_generation(None)
+        self._header = self._slots = None
+        shm, self._shm = self._shm, None
+        shm.close()
+
+    def unlink(self) -> None:
+        """Cierra y elimina el segmento (p. ej. para cambiar el número de slots)."""
+        shm = self._shm
+        self.close()
+        try:
+            _unlink(shm or _shared_memory(self.name, create=False))
+        except FileNotFoundError:
+            pass
+
+    # --- escritura -----------------------------------------------------------
+
+    def write_gate(self):
+        """Contexto de la ingesta: del `commit` a `add_many()`, sin reconstrucciones a medias."""
+        if self._shm is None:
+            return nullcontext()
+        return _flock(self._gate_path, fcntl.LOCK_SH)
+
+    @contextmanager
+    def _writing(self):
+        with _flock(self._write_path, fcntl.LOCK_EX):
+            seq = self._header["seq"]
+            seq[0] += 1  # impar: escritura en curso
+            try:
+                yield
+            finally:
+                seq[0] += 1
+
+    def add_many(self, rows: Iterable[tuple]) -> None:
+        """Suma lecturas nuevas: `rows` = [(sensor_key, ts_us, (t, h, ph, l))]."""
+        if self._shm is None:
+            return
+        rows = list(rows)
+        if not rows:
+            return
+        keys = np.fromiter((k or NO_SENSOR for k, _, _ in rows), dtype=np.int64, count=len(rows))
+        values = np.array([v for _, _, v in rows], dtype=np.float64).reshape(len(rows), len(METRICS))
+        fits = keys < self.slots
+        keys, values = keys[fits], values[fits]
+        slots = self._slots
+        with self._writing():
+            if not fits.all():
+                self._header["overflow"] += 1
+            np.add.at(slots["count"], keys, 1)
+            np.add.at(slots["sum"], keys, values)
+            np.minimum.at(slots["min"], keys, values)
+            np.maximum.at(slots["max"], keys, values)
+
+    def mark_stale(self, keys: Iterable[Optional[int]]) -> None:
+        """Sensores con lecturas sobrescritas: sus sumas ya no valen hasta `rebuild_stale()`."""
+        if self._shm is None:
+            return
+        keys = [k or NO_SENSOR for k in keys]
+        keys = [k for k in keys if k < self.slots]
+        if keys:
+            with self._writing():
+                self._slots["stale"][keys] = 1
+
+    def bump(self) -> None:
+        """Avanza el contador de generación compartido (`services.cache`)."""
+        with _flock(self._write_path, fcntl.LOCK_EX):
+            self._header["generation"] += 1
+
+    def token(self) -> str:
+        header = self._header
+        return f"{int(header['instance'][0]):x}.{int(header['generation'][0])}"
+
+    # --- reconstrucción ------------------------------------------------------
+
+    def rebuild(self, keys: Optional[Iterable[int]] = None) -> None:
+        """Recalcula desde la BD todos los sensores (o solo `keys`)."""
+        if self._shm is None:
+            return
+        with _flock(self._gate_path, fcntl.LOCK_EX):
+            self._rebuild(keys)
+
+    def rebuild_stale(self) -> None:
+        """Recalcula los sensores marcados por `mark_stale()`, si hay alguno."""
+        if self._shm is not None and self._slots["stale"].any():
+            # Releer dentro del gate: otro proceso puede haberlos recalculado ya
+            with _flock(self._gate_path, fcntl.LOCK_EX):
+                stale = np.flatnonzero(self._slots["stale"]).tolist()
+                if stale:
+                    self._rebuild(stale)
+
+    def _rebuild(self, keys: Optional[List[int]]) -> None:
+        # Llamar con el gate exclusivo: ninguna ingesta entre la consulta y la escritura
+        merged: Dict[int, Dict[str, Partial]] = {}
+        for factory in self._session_factories():
+            with factory() as db:
+                for key, partials in collect(db, keys).items():
+                    target = merged.setdefault(key, {m: Partial() for m in METRICS})
+                    for m in METRICS:
+                        target[m].merge(partials[m])
+        slots = self._slots
+        with self._writing():
+            if keys is None:
+                _empty(slots)
+                self._header["overflow"] = 0
+            else:
+                for key in keys:
+                    _empty(slots[key:key + 1])
+            for key, partials in merged.items():
+                if key >= self.slots:
+                    self._header["overflow"] += 1
+                    continue
+                first = partials[METRICS[0]]
+                if not first.count:
+                    continue
+                slots["count"][key] = first.count
+                for i, m in enumerate(METRICS):
+                    slots["sum"][key, i] = partials[m].total
+                    slots["min"][key, i] = partials[m].minimum
+                    slots["max"][key, i] = partials[m].maximum
+        with self._lock:
+            self.rebuilds += 1
+
+    # --- lectura -------------------------------------------------------------
+
+    def _snapshot(self, index=slice(None)):
+        """Copia coherente (seqlock) de `slots[index]` y de `overflow`, o None."""
+        if self.locked_reads:
+            with _flock(self._write_path, fcntl.LOCK_SH):
+                return self._slots[index].copy(), int(self._header["overflow"][0])
+        seq = self._header["seq"]
+        for attempt in range(SEQLOCK_RETRIES):
+            before = int(seq[0])
+            if not before & 1:
+                data = self._slots[index].copy()
+                overflow = int(self._header["overflow"][0])
+                if int(seq[0]) == before:
+                    if attempt:
+                        with self._lock:
+                            self.retries += attempt
+                    return data, overflow
+            time.sleep(0)
+        return None
+
+    def _count(self, served: bool) -> None:
+        with self._lock:
+            if served:
+                self.reads += 1
+            else:
+                self.fallbacks += 1
+
+    def totals(self, sensor_key: Optional[int] = None) -> Optional[Dict[str, Partial]]:
+        """Agregado histórico de todas las lecturas (o de un sensor); None si no puede."""
+        if self._shm is None:
+            return None
+        if sensor_key is not None and sensor_key >= self.slots:
+            self._count(False)
+            return None
+        snapshot = self._snapshot(slice(None) if sensor_key is None else slice(sensor_key, sensor_key + 1))
+        if snapshot is None or snapshot[0]["stale"].any() or (sensor_key is None and snapshot[1]):
+            self._count(False)
+            return None
+        slots = snapshot[0]
+        used = slots[slots["count"] > 0]
+        total = np.zeros(1, dtype=SLOT)
+        if len(used):
+            total["count"] = used["count"].sum()
+            total["sum"] = used["sum"].sum(axis=0)
+            total["min"] = used["min"].min(axis=0)
+            total["max"] = used["max"].max(axis=0)
+        self._count(True)
+        return _partials(total[0])
+
+    def per_sensor(self) -> Optional[Dict[int, Dict[str, Partial]]]:
+        """`{sensor_key: partials}` de los sensores con lecturas (sin NO_SENSOR); None si no puede."""
+        if self._shm is None:
+            return None
+        snapshot = self._snapshot()
+        if snapshot is None or snapshot[0]["stale"].any() or snapshot[1]:
+            self._count(False)
+            return None
+        slots = snapshot[0]
+        keys = np.flatnonzero(slots["count"] > 0)
+        self._count(True)
+        return {int(k): _partials(slots[k]) for k in keys if k != NO_SENSOR}
+
+    def stats(self) -> Dict:
+        out = {"enabled": self.enabled, "name": self.name or None, "slots": self.slots,
+               "read_mode": "flock" if self.locked_reads else "seqlock"}
+        if self._shm is not None:
+            header = self._header
+            out.update(
+                sensors=int((self._slots["count"] > 0).sum()),
+                generation=int(header["generation"][0]),
+                overflow=int(header["overflow"][0]),
+            )
+        with self._lock:
+            out.update(reads=self.reads, fallbacks=self.fallbacks, seqlock_retries=self.retries,
+                       rebuilds=self.rebuilds)
+        return out
+
+
+shared_aggregates = SharedAggregates()
+
+register_source("shared_aggregates", shared_aggregates.stats)
@@ -0,0 +1,92 @@
+"""
+Coalescencia "single-flight" de cálculos idénticos concurrentes.
+
+Relación con otros módulos:
+- `routers/analytics.py` (`/analytics`), `routers/dashboard.py` y
+    `routers/dashboard_html.py` envuelven su agregación con `singleflight.do()`.
+    La clave incluye los parámetros normalizados y `services.cache.data_generation()`,
+    así que una petición posterior a una escritura nunca recibe un resultado
+    calculado antes de ella.
+- Publica sus contadores en `GET /metrics` (`singleflight`).
+
+Funcionamiento: la primera petición con una clave lanza el cálculo (una
+función síncrona) en el threadpool como tarea propia; las que llegan mientras
+sigue en curso esperan esa misma tarea y reciben el mismo resultado. Al
+terminar la entrada se borra: no es una caché, solo evita repetir trabajo
+simultáneo.
+- Errores: la excepción llega a todas las peticiones que esperaban y la
+    siguiente vuelve a intentarlo (los errores no se recuerdan).
+- Cancelación: cada petición espera con `asyncio.shield`, de modo que si se
+    cancela la que lanzó el cálculo (cliente desconectado, timeout) el resto
+    sigue esperando sin problemas. Por eso la función no debe usar la sesión
+    de la petición: abre la suya (`database.read_session()`).
+"""
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from fastapi.concurrency import run_in_threadpool
+
+from services.metrics import register_source
+from services.profiling import profiled_call
+
+
+class SingleFlight:
+    """Tabla de cálculos en curso por clave, dentro de un event loop."""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Resultado de `fn()`, compartido con las llamadas concurrentes de igual `key`."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._inflight.get(key)
+            # Una tarea de otro loop (p. ej. otro TestClient) no se puede esperar aquí
+            if task is not None and task.get_loop() is loop and not task.done():
+                self.coalesced += 1
+            else:
+                task = loop.create_task(self._run(fn))
+                self._inflight[key] = task
+                task.add_done_callback(lambda t: self._forget(key, t))
+                self.executions += 1
+        return await asyncio.shield(task)
+
+    async def _run(self, fn: Callable[[], Any]) -> Any:
+        try:
+            return await run_in_threadpool(profiled_call, fn)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        with self._lock:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+        if not task.cancelled():
+            # Marca la excepción como recuperada si nadie quedó esperando
+            task.exception()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._inflight.clear()
+            self.executions = self.coalesced = self.errors = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._inflight),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+            }
+
+
+singleflight = SingleFlight()
+
+register_source("singleflight", singleflight.stats)
@@ -0,0 +1,218 @@
+"""
+Exportación columnar (Parquet / Arrow IPC) de las lecturas para análisis offline.
+
+Relación con otros módulos:
+- Recorre las lecturas con `services.readings.iter_chunks` (bloques compactados
+    y filas calientes), así que la memoria usada es la de un grupo de filas,
+    no la del histórico completo.
+- `routers/sensors.py` (`GET /sensor-data/snapshot`) envía el resultado en
+    streaming con `stream_snapshot()`; `scripts/export_snapshot.py` lo escribe
+    en un fichero local con `write_snapshot()`.
+- `pyarrow` se importa bajo demanda (`require_pyarrow()`): sin él el resto de
+    la API funciona y el endpoint responde 501.
+
+Formato de salida (una fila por lectura):
+- `timestamp`: `timestamp[us, UTC]`; `sensor_id`: `dictionary<int32, string>`
+    (el código de cada sensor se guarda una vez, no por fila; nulo si la
+    lectura no trae sensor); `temperature`, `humidity`, `ph`, `light`: `double`.
+- Parquet: grupos de `SNAPSHOT_ROW_GROUP_ROWS` filas con estadísticas min/max
+    por columna, de modo que un lector que filtra por `timestamp` salta los
+    grupos fuera de rango. Compresión zstd.
+- Arrow: formato stream IPC (`pyarrow.ipc.open_stream`), un record batch por
+    grupo; si aparecen sensores nuevos durante la exportación el diccionario
+    crece con "dictionary deltas".
+El orden es el de `iter_chunks`: primero los bloques (por día y sensor) y
+después las filas calientes por timestamp.
+"""
+import importlib
+import os
+from typing import Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import SensorDevice
+from services.readings import METRICS, NO_SENSOR, Columns, iter_chunks
+
+SNAPSHOT_ROW_GROUP_ROWS = int(os.getenv("SNAPSHOT_ROW_GROUP_ROWS", "65536"))
+
+FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+
+
+class SnapshotUnavailable(RuntimeError):
+    """`pyarrow` no está instalado."""
+
+
+def require_pyarrow():
+    """Importa `pyarrow` (y `pyarrow.parquet`) o lanza `SnapshotUnavailable`."""
+    try:
+        pa = importlib.import_module("pyarrow")
+        importlib.import_module("pyarrow.parquet")
+        importlib.import_module("pyarrow.ipc")
+    except ImportError as exc:
+        raise SnapshotUnavailable("pyarrow is required for snapshot export") from exc
+    return pa
+
+
+def snapshot_schema(pa):
+    return pa.schema(
+        [
+            pa.field("timestamp", pa.timestamp("us", tz="UTC"), nullable=False),
+            pa.field("sensor_id", pa.dictionary(pa.int32(), pa.string())),
+            *[pa.field(m, pa.float64(), nullable=False) for m in METRICS],
+        ]
+    )
+
+
+class _SensorDictionary:
+    """Diccionario `sensor_key -> índice` que solo crece (compatible con deltas)."""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.codes: List[str] = []
+        self.lookup = np.full(1, -1, dtype=np.int32)  # posición NO_SENSOR = nulo
+        self._load()
+
+    def _load(self) -> None:
+        table = SensorDevice.__table__
+        rows = self.db.execute(select(table.c.id, table.c.code).order_by(table.c.id)).all()
+        if rows and rows[-1][0] >= len(self.lookup):
+            grown = np.full(rows[-1][0] + 1, -1, dtype=np.int32)
+            grown[:len(self.lookup)] = self.lookup
+            self.lookup = grown
+        for key, code in rows:
+            if self.lookup[key] < 0:
+                self.lookup[key] = len(self.codes)
+                self.codes.append(code)
+
+    def indices(self, keys: np.ndarray) -> np.ndarray:
+        if len(keys) and (keys.max() >= len(self.lookup) or (self.lookup[keys[keys != NO_SENSOR]] < 0).any()):
+            # Sensor registrado después de empezar la exportación
+            self._load()
+        return self.lookup[keys]
+
+
+def _record_batch(pa, schema, chunk: Columns, sensors: _SensorDictionary):
+    keys = np.frombuffer(chunk.sensor_key, dtype=np.int64)
+    idx = sensors.indices(keys)
+    sensor_ids = pa.DictionaryArray.from_arrays(
+        pa.array(idx, type=pa.int32(), mask=idx < 0),
+        pa.array(sensors.codes, type=pa.string()),
+    )
+    columns = [
+        pa.array(np.frombuffer(chunk.ts, dtype=np.int64), type=pa.timestamp("us", tz="UTC")),
+        sensor_ids,
+        *[pa.array(np.frombuffer(chunk.metrics[m], dtype=np.float64)) for m in METRICS],
+    ]
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def _row_groups(db: Session, start=None, end=None, sensor_key: Optional[int] = None,
+                rows: Optional[int] = None) -> Iterator[List[Columns]]:
+    # Junta trozos pequeños (un bloque = un sensor y día) hasta `rows` filas
+    rows = rows or SNAPSHOT_ROW_GROUP_ROWS
+    pending, size = [], 0
+    for chunk in iter_chunks(db, start, end, sensor_key, chunk_size=rows):
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= rows:
+            yield pending
+            pending, size = [], 0
+    if pending:
+        yield pending
+
+
+class SnapshotWriter:
+    """Escribe grupos de filas en Parquet o Arrow IPC sobre un `sink` (fichero o ruta)."""
+
+    def __init__(self, db: Session, sink, fmt: str = "parquet"):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown snapshot format {fmt!r}")
+        self.pa = require_pyarrow()
+        self.fmt = fmt
+        self.schema = snapshot_schema(self.pa)
+        self.sensors = _SensorDictionary(db)
+        self.rows = 0
+        if fmt == "parquet":
+            pq = importlib.import_module("pyarrow.parquet")
+            self._writer = pq.ParquetWriter(sink, self.schema, compression="zstd", write_statistics=True)
+        else:
+            ipc = importlib.import_module("pyarrow.ipc")
+            options = ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self._writer = ipc.new_stream(sink, self.schema, options=options)
+
+    def write_group(self, group: List[Columns]) -> None:
+        batches = [_record_batch(self.pa, self.schema, chunk, self.sensors) for chunk in group]
+        if self.fmt == "parquet":
+            # Un `write_table` = un grupo de filas con sus estadísticas min/max
+            table = self.pa.Table.from_batches(batches, schema=self.schema).unify_dictionaries()
+            self._writer.write_table(table, row_group_size=max(1, len(table)))
+        else:
+            for batch in batches:
+                self._writer.write_batch(batch)
+        self.rows += sum(len(b) for b in batches)
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def write_snapshot(db: Session, sink, fmt: str = "parquet", start=None, end=None,
+                   sensor_key: Optional[int] = None, row_group_rows: Optional[int] = None) -> int:
+    """Escribe las lecturas de la ventana en `sink`; devuelve cuántas."""
+    writer = SnapshotWriter(db, sink, fmt)
+    try:
+        for group in _row_groups(db, start, end, sensor_key, row_group_rows):
+            writer.write_group(group)
+    finally:
+        writer.close()
+    return writer.rows
+
+
+class _Buffer:
+    """Sink en memoria que se vacía tras cada grupo de filas."""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def stream_snapshot(session_factory, fmt: str = "parquet", start=None, end=None,
+                    sensor_key: Optional[int] = None,
+                    row_group_rows: Optional[int] = None) -> Iterator[bytes]:
+    """Genera el fichero por trozos: los bytes de cada grupo de filas en cuanto se escribe.
+
+    Abre su propia sesión con `session_factory` (un context manager), porque
+    la respuesta se sigue enviando después de que termine el handler.
+    """
+    buffer = _Buffer()
+    with session_factory() as db:
+        writer = SnapshotWriter(db, buffer, fmt)
+        try:
+            for group in _row_groups(db, start, end, sensor_key, row_group_rows):
+                writer.write_group(group)
+                data = buffer.drain()
+                if data:
+                    yield data
+        finally:
+            writer.close()
+    data = buffer.drain()
+    if data:
+        yield data
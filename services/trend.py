@@ -0,0 +1,243 @@
+"""
+Tendencia y previsión a corto plazo por sensor, mantenidas de forma incremental.
+
+Relación con otros módulos:
+- `services/ingest.py` llama a `trend_store.add_many()` con cada lectura nueva,
+    después del `commit` (mismo formato de filas que `services.ring_buffer`).
+- `main.lifespan` llama a `trend_store.backfill()` al arrancar: recorre las
+    lecturas recientes con `services.readings.iter_chunks` para inicializar el
+    estado sin esperar a la ingesta.
+- Las sobrescrituras (`on_conflict="update"`) marcan el sensor con
+    `mark_stale()` y `ingest_readings` llama después a `rebuild_stale()`, que
+    recalcula esos sensores desde la BD.
+- `routers/analytics.py` (`GET /analytics/trend`) lee el estado con
+    `trend_store.trend()`: O(1), nunca recorre el histórico.
+- Publica su tamaño en `GET /metrics` (`trend`).
+
+Modelo: regresión lineal por mínimos cuadrados ponderada exponencialmente
+(OLS "rodante" con ventana exponencial, semivida `TREND_HALF_LIFE_SECONDS`).
+Por sensor basta con guardar las estadísticas suficientes
+`S0 = Σw`, `S1 = Σw·t`, `S2 = Σw·t²` (comunes a todas las métricas) y, por
+métrica, `Sy = Σw·y` y `Sty = Σw·t·y`. El tiempo `t` está en horas relativas a
+la lectura más reciente (`origin`); cuando llega una lectura posterior se
+traslada el origen y se multiplican las sumas por el factor de decaimiento,
+así que actualizar cuesta O(métricas) y los números no crecen con la época.
+Una lectura atrasada entra con su peso `exp(-λ·Δ)` sin mover el origen.
+De las sumas salen:
+- media móvil (ponderada) = `Sy / S0`;
+- pendiente por hora = `(S0·Sty - S1·Sy) / (S0·S2 - S1²)`;
+- previsión a `h` horas de la última lectura = nivel en `origin` + pendiente·h.
+
+El tiempo es el de las lecturas, no el reloj del servidor: un sensor que deja
+de enviar conserva su última tendencia. Las sumas no permiten quitar un valor,
+así que un sensor con lecturas sobrescritas se recalcula entero (sus últimas
+`TREND_BACKFILL_HALF_LIVES` semividas).
+
+Como los rings, el estado es del proceso y solo ve las escrituras de su API:
+con varios workers o con otros escritores (seeds, scripts) cada proceso daría
+una tendencia distinta. Por eso es opcional (`TREND_ENABLED=1`) y se
+desactiva siempre con `SHARED_AGGREGATES_NAME` (varios workers).
+"""
+import math
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from services.metrics import register_source
+from services.readings import METRICS, NO_SENSOR, iter_chunks
+
+# Opt-in: solo es correcto si la API es el único escritor de la BD
+TREND_ENABLED = (
+    os.getenv("TREND_ENABLED", "0").lower() in ("1", "true", "yes")
+    and not os.getenv("SHARED_AGGREGATES_NAME")
+)
+TREND_HALF_LIFE_SECONDS = float(os.getenv("TREND_HALF_LIFE_SECONDS", "3600"))
+# Tras 10 semividas el peso de una lectura es < 0,1 %: no vale la pena cargarla.
+TREND_BACKFILL_HALF_LIVES = float(os.getenv("TREND_BACKFILL_HALF_LIVES", "10"))
+
+_US_PER_HOUR = 3_600_000_000
+
+
+def _chunk_rows(chunk) -> Iterator[tuple]:
+    """Filas `(sensor_key, ts_us, valores)` de un trozo de `iter_chunks`, sin las anónimas."""
+    keys, ts = chunk.sensor_key, chunk.ts
+    columns = [chunk.metrics[m] for m in METRICS]
+    return (
+        (keys[i], ts[i], tuple(c[i] for c in columns))
+        for i in range(len(chunk)) if keys[i] != NO_SENSOR
+    )
+
+
+class SensorTrend:
+    """Estadísticas suficientes de la regresión ponderada de un sensor."""
+
+    __slots__ = ("origin", "count", "s0", "s1", "s2", "sy", "sty")
+
+    def __init__(self, origin: float):
+        self.origin = origin  # horas desde la época de la lectura más reciente
+        self.count = 0
+        self.s0 = self.s1 = self.s2 = 0.0
+        self.sy = [0.0] * len(METRICS)
+        self.sty = [0.0] * len(METRICS)
+
+    def add(self, t: float, values, decay: float) -> None:
+        """Incorpora una lectura en `t` horas; `decay` = λ por hora."""
+        d = t - self.origin
+        if d > 0:
+            # Trasladar el origen a `t` y envejecer lo acumulado
+            f = math.exp(-decay * d)
+            self.s2 = (self.s2 - 2 * d * self.s1 + d * d * self.s0) * f
+            self.s1 = (self.s1 - d * self.s0) * f
+            self.s0 *= f
+            for i in range(len(METRICS)):
+                self.sty[i] = (self.sty[i] - d * self.sy[i]) * f
+                self.sy[i] *= f
+            self.origin = t
+            d, w = 0.0, 1.0
+        else:
+            w = math.exp(decay * d)
+        self.count += 1
+        self.s0 += w
+        self.s1 += w * d
+        self.s2 += w * d * d
+        for i, y in enumerate(values):
+            self.sy[i] += w * y
+            self.sty[i] += w * d * y
+
+    def estimate(self, metric: int, horizon_hours: float) -> Dict:
+        mean = self.sy[metric] / self.s0
+        variance_t = self.s2 / self.s0 - (self.s1 / self.s0) ** 2
+        if variance_t <= 1e-12:
+            # Todas las lecturas (con peso) en el mismo instante: sin pendiente
+            return {"mean": mean, "slope_per_hour": None, "level": mean, "forecast": None}
+        slope = (self.s0 * self.sty[metric] - self.s1 * self.sy[metric]) / (self.s0 ** 2 * variance_t)
+        level = (self.sy[metric] - slope * self.s1) / self.s0
+        return {"mean": mean, "slope_per_hour": slope, "level": level, "forecast": level + slope * horizon_hours}
+
+
+class TrendStore:
+    """`SensorTrend` por `sensor_key`, seguro entre hilos."""
+
+    def __init__(self, half_life_seconds: float = TREND_HALF_LIFE_SECONDS, enabled: bool = TREND_ENABLED):
+        self.half_life_seconds = half_life_seconds
+        self.enabled = enabled
+        self._decay = math.log(2) / (half_life_seconds / 3600)
+        self._sensors: Dict[int, SensorTrend] = {}
+        # Sensores con lecturas sobrescritas, pendientes de `rebuild_stale()`
+        self._stale = set()
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.rebuilds = 0
+
+    def add(self, sensor_key: Optional[int], ts_us: int, values) -> None:
+        """Registra una lectura escrita en la BD (las lecturas sin sensor se ignoran)."""
+        if not self.enabled or not sensor_key:
+            return
+        t = ts_us / _US_PER_HOUR
+        with self._lock:
+            state = self._sensors.get(sensor_key)
+            if state is None:
+                state = self._sensors[sensor_key] = SensorTrend(t)
+            state.add(t, values, self._decay)
+            self.updates += 1
+
+    def add_many(self, rows: Iterable[tuple]) -> None:
+        """`rows` = [(sensor_key, ts_us, (t, h, ph, l))]."""
+        for key, ts_us, values in rows:
+            self.add(key, ts_us, values)
+
+    def trend(self, sensor_key: int, metric: str, horizon_hours: float = 1.0) -> Dict:
+        """Media, pendiente (unidades/hora) y previsión de `metric` para el sensor."""
+        with self._lock:
+            state = self._sensors.get(sensor_key)
+            if state is None or not state.count:
+                return {"samples": 0, "last_reading": None, "mean": None, "slope_per_hour": None,
+                        "level": None, "forecast": None}
+            result = state.estimate(METRICS.index(metric), horizon_hours)
+            origin_us = round(state.origin * _US_PER_HOUR)
+            samples, weight = state.count, state.s0
+        last = datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(microseconds=origin_us)
+        return {
+            "samples": samples,
+            "effective_samples": round(weight, 2),
+            "last_reading": last.isoformat(),
+            **{k: None if v is None else round(v, 4) for k, v in result.items()},
+        }
+
+    def backfill(self, session_factory, now: Optional[datetime] = None, clear: bool = True) -> int:
+        """Reconstruye el estado desde las lecturas de las últimas semividas.
+
+        Debe ejecutarse antes de servir peticiones (desde el `lifespan`). Con
+        `clear=False` añade las lecturas de otra base (shards) al estado actual.
+        """
+        if not self.enabled:
+            return 0
+        now = now or datetime.now(timezone.utc)
+        since = now - timedelta(seconds=self.half_life_seconds * TREND_BACKFILL_HALF_LIVES)
+        loaded = 0
+        if clear:
+            with self._lock:
+                self._sensors.clear()
+        db = session_factory()
+        try:
+            for chunk in iter_chunks(db, start=since):
+                self.add_many(_chunk_rows(chunk))
+                loaded += len(chunk)
+        finally:
+            db.close()
+        return loaded
+
+    def mark_stale(self, keys: Iterable[Optional[int]]) -> None:
+        """Sensores con lecturas sobrescritas: su estado no vale hasta `rebuild_stale()`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._stale.update(k for k in keys if k)
+
+    def rebuild_stale(self, session_factories: Callable[[], List]) -> None:
+        """Recalcula desde la BD los sensores marcados por `mark_stale()`.
+
+        `session_factories()` devuelve las factorías de sesión de todas las
+        bases con lecturas (`services.sharding.session_factories`). La ventana
+        es relativa a la última lectura de cada sensor, igual que los pesos.
+        """
+        with self._lock:
+            stale, self._stale = self._stale, set()
+            origins = {k: self._sensors[k].origin for k in stale if k in self._sensors}
+        for key, origin in origins.items():
+            last = datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(hours=origin)
+            since = last - timedelta(seconds=self.half_life_seconds * TREND_BACKFILL_HALF_LIVES)
+            fresh = TrendStore(self.half_life_seconds, enabled=True)
+            for factory in session_factories():
+                with factory() as db:
+                    for chunk in iter_chunks(db, start=since, sensor_key=key):
+                        fresh.add_many(_chunk_rows(chunk))
+            with self._lock:
+                state = fresh._sensors.get(key)
+                if state is None:
+                    self._sensors.pop(key, None)
+                else:
+                    self._sensors[key] = state
+                self.rebuilds += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._sensors.clear()
+            self._stale.clear()
+            self.updates = self.rebuilds = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "half_life_seconds": self.half_life_seconds,
+                "sensors": len(self._sensors),
+                "updates": self.updates,
+                "rebuilds": self.rebuilds,
+            }
+
+
+trend_store = TrendStore()
+
+register_source("trend", trend_store.stats)
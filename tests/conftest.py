@@ -1,17 +1,107 @@
 """Fixtures de Pytest para AgroSense_Tech.
 
 Alineadas con ISO/IEC 29119: preparación controlada y limpieza consistente.
+
+Base de datos de las pruebas:
+- Toda la sesión de pytest usa un engine propio (`TEST_DATABASE_URL`; por
+    defecto SQLite en memoria con caché compartida), nunca `agrosense.db`:
+    `database.engine` y `database.SessionLocal` se sustituyen al arrancar.
+- `db_session` abre una conexión, empieza una transacción y liga a ella tanto
+    la sesión del test como la de la app (`get_db` / `get_read_db` en
+    `app.dependency_overrides` y `database.SessionLocal` para lo que se abre
+    fuera de la petición). Los `commit()` de la app solo liberan un SAVEPOINT;
+    al terminar se hace rollback de todo. Limpiar no cuesta nada.
+- Marca `committed_db`: para tests que necesitan ver los datos desde otras
+    conexiones del engine (refresco de `sensor_summary` con `engine.begin()`,
+    sondeo de la réplica). Confirman de verdad y se vacían las tablas después.
+- `seed_dataset` / `seeded_client`: lecturas en volumen que se insertan una
+    sola vez por sesión en otra base en memoria; cada test trabaja dentro de
+    su propia transacción sobre ellas y no las altera.
 """
 import os
 import shutil
 import tempfile
-from typing import Generator
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Generator, List
+
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
+import database
+from database import Base, get_db, get_read_db, read_routing
 from main import app
-from database import Base, engine, SessionLocal
-from models import Sensor
+from models import Sensor, SensorDevice
+from routers.analytics import correlation_cache
+from services.cache import bump_generation
+from services.ingest import idempotency_cache
+from services.ratelimit import ingest_limiter
+from services.ring_buffer import ring_store
+from services.sensor_registry import registry
+from services.sensor_summary import summary_refresher
+from services.singleflight import singleflight
+from services.trend import trend_store
+
+TEST_DATABASE_URL = os.getenv(
+    "TEST_DATABASE_URL", "sqlite:///file:agrosense_tests?mode=memory&cache=shared&uri=true"
+)
+SEED_DATABASE_URL = os.getenv(
+    "TEST_SEED_DATABASE_URL", "sqlite:///file:agrosense_seed?mode=memory&cache=shared&uri=true"
+)
+SEED_SENSORS = 16
+SEED_READINGS_PER_SENSOR = 1500
+SEED_START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "committed_db: el test confirma en la BD de pruebas en lugar de hacer rollback"
+    )
+
+
+def _build_test_engine(url: str) -> Engine:
+    """Engine de pruebas con SAVEPOINT funcionales en SQLite."""
+    if make_url(url).get_backend_name() != "sqlite":
+        return database._build_engine(url)
+    # Caché compartida: todas las conexiones del pool ven la misma base en memoria
+    engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=QueuePool)
+
+    # pysqlite abre y cierra transacciones por su cuenta y rompe los SAVEPOINT
+    # anidados: se le quita el control y el BEGIN se emite al empezar cada
+    # transacción, directamente en la conexión DBAPI para que no aparezca en
+    # los eventos de sentencias (perfilado, recuentos de los tests).
+    @event.listens_for(engine, "connect")
+    def _no_implicit_transactions(dbapi_connection, _record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _explicit_begin(conn):
+        conn.connection.dbapi_connection.execute("BEGIN")
+
+    return engine
+
+
+def _reset_state() -> None:
+    """Estado en memoria de la app que reflejaría filas de otro test."""
+    # Las claves de `sensors` se reutilizan tras un rollback
+    registry.clear()
+    idempotency_cache.clear()
+    correlation_cache.clear()
+    # Cada prueba empieza con los buckets de ingesta llenos
+    ingest_limiter.reset()
+    # Los rings reflejarían filas ya borradas: sin cobertura hasta un warm()
+    ring_store.reset()
+    trend_store.reset()
+    summary_refresher.reset()
+    singleflight.reset()
+    read_routing.reset()
+    # Los cambios de datos del fixture no pasan por la API: invalidar fragmentos a mano
+    bump_generation()
 
 
 @pytest.fixture(scope="session")
@@ -24,22 +114,88 @@ def test_db_dir() -> Generator[str, None, None]:
         shutil.rmtree(tmp, ignore_errors=True)
 
 
+@pytest.fixture(scope="session", autouse=True)
+def test_engine() -> Generator[Engine, None, None]:
+    """Engine de la sesión de pytest, instalado como `database.engine`."""
+    engine = _build_test_engine(TEST_DATABASE_URL)
+    # Una base en memoria desaparece al cerrarse su última conexión
+    keeper = engine.connect()
+    database.init_db(engine)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(database, "engine", engine, raising=False)
+        mp.setattr(database, "SessionLocal", sessionmaker(bind=engine, autoflush=False), raising=False)
+        yield engine
+    keeper.close()
+    engine.dispose()
+
+
+class TransactionalBinding:
+    """Conexión con una transacción abierta a la que se ligan test y app."""
+
+    def __init__(self, engine: Engine, monkeypatch: pytest.MonkeyPatch):
+        self.connection = engine.connect()
+        self.transaction = self.connection.begin()
+        # `commit()` dentro de la app = liberar un SAVEPOINT, no confirmar
+        self.sessionmaker = sessionmaker(
+            bind=self.connection, autoflush=False, join_transaction_mode="create_savepoint"
+        )
+        monkeypatch.setattr(database, "engine", engine, raising=False)
+        monkeypatch.setattr(database, "SessionLocal", self.sessionmaker, raising=False)
+        app.dependency_overrides[get_db] = self._override
+        app.dependency_overrides[get_read_db] = self._override
+
+    def _override(self):
+        db = self.sessionmaker()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def close(self) -> None:
+        app.dependency_overrides.pop(get_db, None)
+        app.dependency_overrides.pop(get_read_db, None)
+        if self.transaction.is_active:
+            self.transaction.rollback()
+        self.connection.close()
+
+
 @pytest.fixture(scope="function")
-def db_session(test_db_dir) -> Generator:
-    """Crea una sesión nueva y limpia la tabla antes de cada prueba.
+def db_session(request, test_engine, monkeypatch) -> Generator:
+    """Sesión del test; todo lo que escriban test y app se deshace al terminar.
 
-    Aunque el proyecto soporta Postgres vía DATABASE_URL, para pruebas unitarias
-    aisladas dejamos que utilice el engine configurado (que puede ser sqlite fallback).
+    Con la marca `committed_db` la sesión confirma contra `test_engine` y las
+    tablas se vacían antes y después (comportamiento anterior a los SAVEPOINT).
     """
-    # Asegurar creación de tablas
-    Base.metadata.create_all(bind=engine)
-    session = SessionLocal()
+    _reset_state()
+    if request.node.get_closest_marker("committed_db"):
+        yield from _committed_session(test_engine)
+        return
+    binding = TransactionalBinding(test_engine, monkeypatch)
+    session = binding.sessionmaker()
+    try:
+        yield session
+    finally:
+        session.close()
+        binding.close()
+        _reset_state()
+
+
+def _clear_tables(engine: Engine) -> None:
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            if table is not database.schema_version_table:
+                conn.execute(table.delete())
+
+
+def _committed_session(engine: Engine) -> Generator:
+    _clear_tables(engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
     try:
-        session.query(Sensor).delete()
-        session.commit()
         yield session
     finally:
         session.close()
+        _clear_tables(engine)
+        _reset_state()
 
 
 @pytest.fixture(scope="function")
@@ -49,3 +205,64 @@ def client(db_session) -> Generator[TestClient, None, None]:
     El fixture db_session asegura limpieza; aquí solo se instancia el TestClient.
     """
     yield TestClient(app)
+
+
+@dataclass
+class SeedDataset:
+    """Lecturas de `seed_dataset` y los valores esperados para comprobarlas."""
+
+    engine: Engine
+    codes: List[str]
+    start: datetime
+    end: datetime
+    count: int
+    temperature_sum: float
+
+
+@pytest.fixture(scope="session")
+def seed_dataset() -> Generator[SeedDataset, None, None]:
+    """`SEED_SENSORS` × `SEED_READINGS_PER_SENSOR` lecturas, una por minuto.
+
+    Se inserta una vez por sesión en su propia base (`TEST_SEED_DATABASE_URL`)
+    con un `executemany` por tabla, sin pasar por la API.
+    """
+    engine = _build_test_engine(SEED_DATABASE_URL)
+    keeper = engine.connect()
+    database.init_db(engine)
+    rng = np.random.default_rng(2026)
+    codes = [f"seed-{i:02d}" for i in range(SEED_SENSORS)]
+    minutes = np.arange(SEED_READINGS_PER_SENSOR)
+    timestamps = [SEED_START + timedelta(minutes=int(m)) for m in minutes]
+    rows, temperature_sum = [], 0.0
+    for key, _ in enumerate(codes, start=1):
+        temperature = 18.0 + 4.0 * np.sin(minutes / 90.0 + key) + rng.normal(0, 0.3, len(minutes))
+        humidity = rng.uniform(40.0, 80.0, len(minutes))
+        ph = rng.uniform(6.0, 7.2, len(minutes))
+        light = rng.uniform(0.0, 900.0, len(minutes))
+        temperature_sum += float(temperature.sum())
+        rows.extend(
+            {"sensor_key": key, "temperature": float(temperature[i]), "humidity": float(humidity[i]),
+             "ph": float(ph[i]), "light": float(light[i]), "timestamp": timestamps[i]}
+            for i in range(len(minutes))
+        )
+    with engine.begin() as conn:
+        conn.execute(insert(SensorDevice.__table__), [{"id": k, "code": c} for k, c in enumerate(codes, start=1)])
+        conn.execute(insert(Sensor.__table__), rows)
+    yield SeedDataset(
+        engine=engine, codes=codes, start=SEED_START, end=timestamps[-1],
+        count=len(rows), temperature_sum=temperature_sum,
+    )
+    keeper.close()
+    engine.dispose()
+
+
+@pytest.fixture(scope="function")
+def seeded_client(seed_dataset, monkeypatch) -> Generator[TestClient, None, None]:
+    """TestClient con la app ligada a `seed_dataset` dentro de una transacción."""
+    _reset_state()
+    binding = TransactionalBinding(seed_dataset.engine, monkeypatch)
+    try:
+        yield TestClient(app)
+    finally:
+        binding.close()
+        _reset_state()
@@ -0,0 +1,71 @@
+"""Integration tests for GET /analytics/correlation."""
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+from routers import analytics
+from services import kernels
+
+BASE = datetime(2026, 6, 3, tzinfo=timezone.utc)
+
+
+def _seed(client):
+    # cr-a: humedad baja cuando sube la temperatura; cr-b sigue la temperatura de cr-a
+    body = {"readings": []}
+    for m in range(0, 120, 2):
+        temp = 20.0 + (m % 30) / 3
+        ts = (BASE + timedelta(minutes=m)).isoformat()
+        body["readings"].append({"sensor_id": "cr-a", "temperature": temp, "humidity": 90.0 - 2 * temp,
+                                 "ph": 6.5, "light": 100.0, "timestamp": ts})
+        body["readings"].append({"sensor_id": "cr-b", "temperature": temp + 1.5, "humidity": 40.0,
+                                 "ph": 6.5, "light": 10.0 * m, "timestamp": ts})
+    assert client.post("/sensor-data/batch", json=body).status_code == 200
+
+
+def test_correlation_matrix(client: TestClient):
+    _seed(client)
+    params = {"start": BASE.isoformat(), "end": (BASE + timedelta(hours=2)).isoformat(),
+              "resolution": 600, "metric": "temperature,humidity"}
+    data = client.get("/analytics/correlation", params=params).json()
+    assert data["resolution_seconds"] == 600 and data["bins"] == 12
+    index = {(s["sensor_id"], s["metric"]): i for i, s in enumerate(data["series"])}
+    assert len(index) == 4
+    a_temp, a_hum = index["cr-a", "temperature"], index["cr-a", "humidity"]
+    b_temp, b_hum = index["cr-b", "temperature"], index["cr-b", "humidity"]
+    matrix = data["matrix"]
+    assert matrix[a_temp][a_hum] == -1.0  # humedad vs temperatura en cr-a
+    assert matrix[a_temp][b_temp] == 1.0  # temperatura entre sensores
+    assert matrix[b_hum][b_hum] is None  # humedad constante en cr-b
+    assert data["overlap"][a_temp][b_temp] == 12
+
+
+def test_correlation_is_cached_per_generation(client: TestClient, monkeypatch):
+    _seed(client)
+    calls = []
+    original = analytics.run_heavy
+
+    async def counting(kernel, columns, params):
+        calls.append(kernel)
+        return await original(kernel, columns, params)
+
+    monkeypatch.setattr(analytics, "run_heavy", counting)
+    params = {"start": BASE.isoformat(), "end": (BASE + timedelta(hours=2)).isoformat()}
+    first = client.get("/analytics/correlation", params=params).json()
+    assert client.get("/analytics/correlation", params=params).json() == first
+    assert len(calls) == 1
+
+    # Una escritura nueva invalida el resultado guardado
+    reading = {"sensor_id": "cr-c", "temperature": 1.0, "humidity": 2.0, "ph": 7.0, "light": 3.0,
+               "timestamp": (BASE + timedelta(minutes=5)).isoformat()}
+    assert client.post("/sensor-data", json=reading).status_code in (200, 201)
+    again = client.get("/analytics/correlation", params=params).json()
+    assert len(calls) == 2 and len(again["series"]) == 12
+
+
+def test_correlation_rejects_bad_input(client: TestClient, monkeypatch):
+    _seed(client)
+    assert client.get("/analytics/correlation", params={"metric": "wind"}).status_code == 422
+    assert client.get("/analytics/correlation", params={"resolution": 0}).status_code == 422
+    monkeypatch.setattr(kernels, "CORRELATION_MAX_CELLS", 10)
+    r = client.get("/analytics/correlation", params={"start": BASE.isoformat(), "resolution": 60})
+    assert r.status_code == 422 and "cells" in r.json()["detail"]
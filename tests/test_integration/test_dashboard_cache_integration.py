@@ -0,0 +1,44 @@
+"""Integration tests for dashboard HTML caching, compression and static assets."""
+from fastapi.testclient import TestClient
+
+
+def test_dashboard_view_conditional_get(client: TestClient):
+    r = client.get("/dashboard/view")
+    assert r.status_code == 200
+    etag = r.headers["etag"]
+    assert r.headers["cache-control"] == "no-cache"
+
+    r304 = client.get("/dashboard/view", headers={"If-None-Match": etag})
+    assert r304.status_code == 304
+    assert r304.content == b""
+
+
+def test_dashboard_view_compressed(client: TestClient):
+    r = client.get("/dashboard/view", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert "AgroSense Tech" in r.text  # httpx decodes transparently
+
+
+def test_plotly_asset_fingerprinted_and_immutable(client: TestClient):
+    html = client.get("/dashboard/view").text
+    start = html.index("/static/plotly-")
+    url = html[start:html.index('"', start)]
+    r = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert "immutable" in r.headers["cache-control"]
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.text.startswith("/**")
+    assert client.get(url, headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+    assert client.get("/static/plotly-0.0.0.min.js").status_code == 404
+
+
+def test_dashboard_view_rerenders_after_ingest(client: TestClient):
+    etag = client.get("/dashboard/view").headers["etag"]
+    payload = {"sensor_id": "c1", "temperature": 20.0, "humidity": 50.0, "ph": 6.5, "light": 200}
+    assert client.post("/sensor-data", json=payload).status_code == 200
+    # New generation -> cache miss and re-render with the new KPIs: the old ETag no longer matches
+    r = client.get("/dashboard/view", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["etag"] != etag
+    assert client.get("/dashboard/view", headers={"If-None-Match": r.headers["etag"]}).status_code == 304
@@ -0,0 +1,43 @@
+"""Integration test: the gateway spool replays into the real API without duplicates."""
+from datetime import datetime, timedelta, timezone
+
+import requests
+from fastapi.testclient import TestClient
+
+from models import Sensor
+from sensor_simulator import Spool, SpoolSender
+
+BASE = datetime(2026, 5, 1, tzinfo=timezone.utc)
+
+
+class LostAckSession:
+    """Delivers every request but drops the first response, like a link cut after the commit."""
+
+    def __init__(self, client: TestClient):
+        self.client = client
+        self.calls = 0
+
+    def post(self, url, json, timeout):
+        self.calls += 1
+        response = self.client.post(url, json=json)
+        if self.calls == 1:
+            raise requests.ConnectionError("connection reset")
+        return response
+
+
+def test_backlog_replays_once_after_lost_ack(client: TestClient, db_session, tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    for i in range(30):
+        spool.append({
+            "sensor_id": f"gw-s{i % 3}", "temperature": 20.0 + i / 10, "humidity": 55.0,
+            "ph": 6.6, "light": 300.0, "timestamp": (BASE + timedelta(seconds=i)).isoformat(),
+        })
+    session = LostAckSession(client)
+    sender = SpoolSender(spool, "http://testserver", "gw-it", batch_size=12, session=session, sleep=lambda s: None)
+
+    assert sender.drain() == 30
+    assert len(spool) == 0
+    assert session.calls == 4  # the first batch was re-sent once
+    assert db_session.query(Sensor).count() == 30
+    stamps = [s.timestamp for s in db_session.query(Sensor).order_by(Sensor.id)]
+    assert stamps == sorted(stamps)
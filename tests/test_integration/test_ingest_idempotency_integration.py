@@ -0,0 +1,76 @@
+"""Integration tests for idempotent, deduplicating ingest (single and batch)."""
+from sqlalchemy import event
+from fastapi.testclient import TestClient
+
+import database
+
+TS = "2026-01-01T10:00:00+00:00"
+
+
+def _reading(sensor="dup1", ts=TS, temperature=20.0):
+    return {"sensor_id": sensor, "temperature": temperature, "humidity": 50.0, "ph": 6.5, "light": 200, "timestamp": ts}
+
+
+def test_single_retry_is_not_stored_twice(client: TestClient):
+    first = client.post("/sensor-data", json=_reading()).json()
+    retry = client.post("/sensor-data", json=_reading()).json()
+    assert (first["inserted"], first["duplicates"]) == (1, 0)
+    assert (retry["inserted"], retry["duplicates"]) == (0, 1)
+    assert client.get("/dashboard").json()["count"] == 1
+
+
+def test_batch_reports_inserted_and_duplicates(client: TestClient):
+    assert client.post("/sensor-data", json=_reading()).status_code == 200
+    batch = {
+        "readings": [
+            _reading(),  # already stored
+            _reading(ts="2026-01-01T10:05:00+00:00"),
+            _reading(ts="2026-01-01T10:05:00+00:00"),  # repeated inside the batch
+            _reading(sensor="dup2"),
+        ]
+    }
+    body = client.post("/sensor-data/batch", json=batch).json()
+    assert body["status"] == "success"
+    assert (body["inserted"], body["duplicates"]) == (2, 2)
+    assert client.get("/dashboard").json()["count"] == 3
+
+
+def test_batch_idempotency_key_replays_result(client: TestClient):
+    batch = {"idempotency_key": "gw-1:1-2", "readings": [_reading(), _reading(sensor="dup2")]}
+    first = client.post("/sensor-data/batch", json=batch).json()
+    again = client.post("/sensor-data/batch", json=batch).json()
+    assert first["inserted"] == 2 and "replayed" not in first
+    assert again == {**first, "replayed": True}
+
+
+def test_reused_idempotency_key_with_other_body_is_rejected(client: TestClient):
+    key = "gw-1:1-2"
+    assert client.post("/sensor-data/batch", json={"idempotency_key": key, "readings": [_reading()]}).status_code == 200
+    # Mismo gateway con el spool recreado: la clave se repite con otras lecturas
+    other = {"idempotency_key": key, "readings": [_reading(ts="2026-01-01T11:00:00+00:00")]}
+    r = client.post("/sensor-data/batch", json=other)
+    assert r.status_code == 409
+    assert client.get("/dashboard").json()["count"] == 1
+
+
+def test_on_conflict_update_overwrites(client: TestClient):
+    client.post("/sensor-data", json=_reading(temperature=20.0))
+    body = client.post("/sensor-data?on_conflict=update", json=_reading(temperature=30.0)).json()
+    assert (body["inserted"], body["duplicates"]) == (0, 1)
+    assert client.get("/analytics").json()["temperature"]["max"] == 30.0
+
+
+def test_batch_cost_does_not_grow_per_row(client: TestClient):
+    engine = database.get_engine()
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    batch = {"readings": [_reading(sensor=f"bulk{i % 3}", ts=f"2026-01-02T00:{i // 60:02d}:{i % 60:02d}+00:00")
+                          for i in range(300)]}
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        body = client.post("/sensor-data/batch", json=batch).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert body["inserted"] == 300
+    assert sum(s.lstrip().upper().startswith("INSERT INTO SENSOR_DATA") for s in statements) == 1
+    assert len(statements) < 10
@@ -0,0 +1,43 @@
+"""Integration tests for GET /analytics/percentiles (executor-backed analytics)."""
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+BASE = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def _post(client, sensor, i, temperature):
+    payload = {
+        "sensor_id": sensor, "temperature": temperature, "humidity": 50.0 + i,
+        "ph": 6.5, "light": 100.0 * i, "timestamp": (BASE + timedelta(minutes=i)).isoformat(),
+    }
+    assert client.post("/sensor-data", json=payload).status_code == 200
+
+
+def test_percentiles_window_and_sensor_filter(client: TestClient):
+    temps = [18.0, 19.5, 21.0, 22.5, 30.0, 25.0]
+    for i, t in enumerate(temps):
+        _post(client, "pa" if i % 2 == 0 else "pb", i, t)
+
+    r = client.get("/analytics/percentiles", params={"q": "50,90", "metric": "temperature"})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["count"] == len(temps)
+    assert body["percentiles"]["temperature"]["p50"] == np.percentile(temps, 50)
+    assert body["percentiles"]["temperature"]["p90"] == round(float(np.percentile(temps, 90)), 6)
+
+    window = {"start": (BASE + timedelta(minutes=2)).isoformat(), "end": (BASE + timedelta(minutes=4)).isoformat()}
+    assert client.get("/analytics/percentiles", params=window).json()["count"] == 2
+
+    only_a = client.get("/analytics/percentiles", params={"sensor_id": "pa", "q": "100"}).json()
+    assert only_a["count"] == 3
+    assert only_a["percentiles"]["temperature"]["p100"] == 30.0
+
+
+def test_percentiles_validation_and_unknown_sensor(client: TestClient):
+    assert client.get("/analytics/percentiles", params={"q": "101"}).status_code == 422
+    assert client.get("/analytics/percentiles", params={"metric": "wind"}).status_code == 422
+    assert client.get("/analytics/percentiles", params={"sensor_id": "nope"}).status_code == 404
+    empty = client.get("/analytics/percentiles").json()
+    assert empty["count"] == 0 and empty["percentiles"]["light"] == {}
@@ -0,0 +1,102 @@
+"""Integration tests for the profiling mode: slow-query log, EXPLAIN and cProfile dumps."""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import database
+from services import profiling
+
+# Sin SAVEPOINT de las pruebas: el log debe tener solo las sentencias de la app
+pytestmark = pytest.mark.committed_db
+
+
+@pytest.fixture
+def profiled_client(db_session, monkeypatch):
+    monkeypatch.setattr(database, "DB_PROFILE", True)
+    monkeypatch.setattr(profiling, "SLOW_QUERY_MS", 0.0)  # todo es "lento"
+    engine = database.get_engine()
+    profiling.instrument_engine(engine)
+    profiling.reset()
+    from main import create_app
+
+    yield TestClient(create_app())
+    event.remove(engine, "before_cursor_execute", profiling._before_cursor_execute)
+    event.remove(engine, "after_cursor_execute", profiling._after_cursor_execute)
+    profiling.reset()
+
+
+def test_slow_queries_attributed_to_route_with_plan(profiled_client: TestClient):
+    payload = {"sensor_id": "p1", "temperature": 20.0, "humidity": 50.0, "ph": 6.5, "light": 200}
+    assert profiled_client.post("/sensor-data", json=payload).status_code == 200
+    assert profiled_client.get("/dashboard").status_code == 200
+
+    report = profiled_client.get("/debug/slow-queries").json()
+    assert report["routes"]["GET /dashboard"]["statements"] >= 1
+    assert report["routes"]["POST /sensor-data"]["slow"] >= 1
+    selects = [q for q in report["slow_queries"] if q["route"] == "GET /dashboard"]
+    assert selects and all(q["plan"] for q in selects)
+    assert any("sensor_data" in line for q in selects for line in q["plan"])
+    inserts = [q for q in report["slow_queries"] if q["statement"].lstrip().upper().startswith("INSERT")]
+    assert inserts and all(q["plan"] is None for q in inserts)
+
+
+def test_route_template_used_for_path_params(profiled_client: TestClient):
+    assert profiled_client.get("/debug/profiles/999").status_code == 404
+    assert profiling.current_route() == "-"
+
+
+def test_profile_header_returns_folded_stacks(profiled_client: TestClient):
+    r = profiled_client.get("/analytics", headers={"X-Profile": "1"})
+    assert r.status_code == 200
+    profile_id = r.headers["x-profile-id"]
+
+    listed = profiled_client.get("/debug/profiles").json()
+    assert [p["route"] for p in listed if str(p["id"]) == profile_id] == ["GET /analytics"]
+
+    folded = profiled_client.get(f"/debug/profiles/{profile_id}").text
+    lines = folded.strip().splitlines()
+    assert lines
+    for line in lines:
+        stack, micros = line.rsplit(" ", 1)
+        assert stack and int(micros) > 0
+    assert any("aggregate (readings.py" in line for line in lines)
+
+
+def test_profile_reports_overlapping_requests():
+    profiling.reset()
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        if scope["path"] == "/slow":
+            await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = profiling.ProfilingMiddleware(app)
+
+    async def request(path, profile):
+        headers = [(b"x-profile", b"1")] if profile else []
+        scope = {"type": "http", "method": "GET", "path": path, "headers": headers}
+
+        async def send(message):
+            pass
+        await middleware(scope, None, send)
+
+    async def scenario():
+        # Perfilada sola, luego con otra petición compartiendo el loop
+        await request("/fast", True)
+        profiled = asyncio.ensure_future(request("/slow", True))
+        await asyncio.sleep(0)
+        await request("/fast", False)
+        release.set()
+        await profiled
+
+    asyncio.run(scenario())
+    assert [p["overlapping_requests"] for p in profiling.list_profiles()] == [0, 1]
+    profiling.reset()
+
+
+def test_debug_router_absent_without_profile_flag(client: TestClient):
+    assert client.get("/debug/slow-queries").status_code == 404
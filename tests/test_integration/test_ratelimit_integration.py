@@ -0,0 +1,42 @@
+"""Integration tests for ingest backpressure (429/503) and the /metrics endpoint."""
+from fastapi.testclient import TestClient
+
+from services import ratelimit
+
+PAYLOAD = {"sensor_id": "loop-1", "temperature": 20.0, "humidity": 50.0, "ph": 6.5, "light": 200}
+
+
+def test_tight_loop_sensor_gets_429_with_retry_after(client: TestClient, monkeypatch):
+    monkeypatch.setattr(ratelimit.ingest_limiter, "sensors", ratelimit.TokenBuckets(rate=0.5, burst=2))
+    assert client.post("/sensor-data", json=PAYLOAD).status_code == 200
+    assert client.post("/sensor-data", json=PAYLOAD).status_code == 200
+    r = client.post("/sensor-data", json=PAYLOAD)
+    assert r.status_code == 429
+    assert int(r.headers["retry-after"]) >= 1
+    # Other sensors from the same client are unaffected
+    assert client.post("/sensor-data", json={**PAYLOAD, "sensor_id": "calm-1"}).status_code == 200
+
+    batch = {"readings": [PAYLOAD, {**PAYLOAD, "sensor_id": "calm-2"}]}
+    assert client.post("/sensor-data/batch", json=batch).status_code == 429
+
+    limits = client.get("/metrics").json()["ingest_limits"]
+    assert limits["limited"]["sensor"] == 2
+    assert limits["sensor"]["burst"] == 2
+    assert limits["concurrency"]["in_flight"] == 0
+
+
+def test_zero_rate_gets_429_not_500(client: TestClient, monkeypatch):
+    # SENSOR_RATE_PER_SEC=0: solo la ráfaga; la espera es infinita y se acota en la cabecera
+    monkeypatch.setattr(ratelimit.ingest_limiter, "sensors", ratelimit.TokenBuckets(rate=0.0, burst=1))
+    assert client.post("/sensor-data", json=PAYLOAD).status_code == 200
+    r = client.post("/sensor-data", json=PAYLOAD)
+    assert r.status_code == 429
+    assert r.headers["retry-after"] == str(ratelimit.RETRY_AFTER_MAX_SECONDS)
+
+
+def test_concurrency_limit_sheds_with_503(client: TestClient, monkeypatch):
+    monkeypatch.setattr(ratelimit, "ingest_concurrency", ratelimit.ConcurrencyLimiter(limit=0))
+    monkeypatch.setattr("routers.sensors.ingest_concurrency", ratelimit.ingest_concurrency)
+    r = client.post("/sensor-data", json=PAYLOAD)
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
@@ -0,0 +1,122 @@
+"""Integración: enrutado de lecturas a la réplica (`get_read_db`).
+
+La réplica es un segundo fichero SQLite que el test "replica" a mano copiando
+filas; el escritor es el engine normal de las pruebas.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import database
+from database import Base, read_routing
+from models import Sensor
+
+T0 = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+# El sondeo de retraso lee por otras conexiones del engine: datos confirmados
+pytestmark = pytest.mark.committed_db
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch, db_session):
+    engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(database, "read_engine", engine, raising=False)
+    read_routing.reset()
+    yield engine
+    read_routing.reset()
+    engine.dispose()
+
+
+def _write(bind, temperature, ts):
+    with Session(bind=bind) as s:
+        s.add(Sensor(temperature=temperature, humidity=50.0, ph=6.5, light=300.0, timestamp=ts))
+        s.commit()
+
+
+def test_reads_go_to_replica_when_in_sync(client, db_session, replica):
+    _write(database.get_engine(), 20.0, T0)
+    # Misma lectura "replicada", con otro valor para distinguir de dónde se lee
+    _write(replica, 30.0, T0)
+
+    data = client.get("/dashboard").json()
+    assert data["count"] == 1
+    assert data["metrics"]["temperature"]["avg"] == 30.0
+    assert client.get("/analytics").json()["temperature"]["avg"] == 30.0
+    # Una decisión por sesión (la del handler y la de la agregación compartida)
+    stats = read_routing.stats()
+    assert stats["replica_reads"] >= 2 and stats["writer_fallbacks"] == 0
+
+
+def test_lagging_replica_falls_back_to_writer(client, db_session, replica, monkeypatch):
+    _write(replica, 30.0, T0)
+    _write(database.get_engine(), 20.0, T0 + timedelta(seconds=database.REPLICA_MAX_LAG_SECONDS + 60))
+
+    data = client.get("/dashboard").json()
+    assert data["count"] == 1
+    assert data["metrics"]["temperature"]["avg"] == 20.0
+    stats = client.get("/metrics").json()["read_routing"]
+    assert stats["writer_fallbacks"] == 1
+    assert stats["last_lag_seconds"] > database.REPLICA_MAX_LAG_SECONDS
+
+    # El sondeo se cachea: la réplica se pone al día pero no se vuelve a medir
+    _write(replica, 30.0, T0 + timedelta(seconds=database.REPLICA_MAX_LAG_SECONDS + 60))
+    assert client.get("/dashboard").json()["count"] == 1
+    monkeypatch.setattr(database, "REPLICA_LAG_CHECK_SECONDS", 0)
+    assert client.get("/dashboard").json()["count"] == 2
+
+
+def test_concurrent_requests_share_one_lag_probe(replica, monkeypatch):
+    calls = []
+    started = threading.Event()
+
+    def slow_probe(read_engine, write_engine):
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return 0.0
+
+    monkeypatch.setattr(database, "replica_lag_seconds", slow_probe)
+    writer = database.get_engine()
+    # Primer sondeo: sin retraso conocido, todas esperan al mismo
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(read_routing.replica_usable(replica, writer)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [True] * 8 and len(calls) == 1
+
+    # Sondeo caducado: una petición mide y el resto usa el último valor sin esperar
+    monkeypatch.setattr(database, "REPLICA_LAG_CHECK_SECONDS", 0)
+    started.clear()
+    prober = threading.Thread(target=read_routing.replica_usable, args=(replica, writer))
+    prober.start()
+    assert started.wait(1)
+    t0 = time.monotonic()
+    assert all(read_routing.replica_usable(replica, writer) for _ in range(5))
+    assert time.monotonic() - t0 < 0.1
+    prober.join()
+    assert len(calls) == 2 and read_routing.stats()["lag_probes"] == 2
+
+
+def test_unreachable_replica_falls_back_to_writer(client, db_session, tmp_path, monkeypatch):
+    # Fichero en un directorio inexistente: cada conexión falla
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    monkeypatch.setattr(database, "read_engine", broken, raising=False)
+    read_routing.reset()
+    try:
+        _write(database.get_engine(), 20.0, T0)
+        assert client.get("/dashboard").json()["count"] == 1
+        assert read_routing.stats()["last_lag_seconds"] == float("inf")
+    finally:
+        read_routing.reset()
+
+
+def test_without_replica_reads_use_writer(db_session):
+    assert database.get_read_engine() is database.get_engine()
@@ -0,0 +1,46 @@
+"""Integration tests: recent-window analytics answered from the in-memory rings."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+from services.readings import aggregate, summarize
+from services.ring_buffer import ring_store
+
+
+
+@pytest.fixture(autouse=True)
+def enabled_ring(monkeypatch):
+    # Opt-in en producción (un solo escritor); aquí la API es el único escritor
+    monkeypatch.setattr(ring_store, "enabled", True)
+
+def test_recent_window_served_from_memory(client: TestClient, db_session):
+    now = datetime.now(timezone.utc)
+    ring_store.warm(database.get_sessionmaker(), horizon_seconds=3600)
+    for i, (sensor, temp) in enumerate([("rb-1", 20.0), ("rb-2", 24.0), ("rb-1", 22.0)]):
+        payload = {"sensor_id": sensor, "temperature": temp, "humidity": 50.0, "ph": 6.5,
+                   "light": 100.0 * (i + 1), "timestamp": (now - timedelta(minutes=5 * i)).isoformat()}
+        assert client.post("/sensor-data", json=payload).status_code == 200
+    old = {"sensor_id": "rb-1", "temperature": 5.0, "humidity": 50.0, "ph": 6.5, "light": 1.0,
+           "timestamp": (now - timedelta(hours=3)).isoformat()}
+    assert client.post("/sensor-data", json=old).status_code == 200
+
+    hits = ring_store.stats()["hits"]
+    recent = client.get("/analytics", params={"window_minutes": 15}).json()
+    assert ring_store.stats()["hits"] == hits + 1
+    expected = summarize(aggregate(db_session, now - timedelta(minutes=15)))["metrics"]
+    assert recent == expected
+    assert recent["temperature"] == {"avg": 22.0, "max": 24.0, "min": 20.0}
+
+    only_rb1 = client.get("/analytics", params={"window_minutes": 15, "sensor_id": "rb-1"}).json()
+    assert only_rb1["light"] == {"avg": 200.0, "max": 300.0, "min": 100.0}
+
+    # The 3-hour-old reading is outside the warmed horizon: answered by the database
+    misses = ring_store.stats()["misses"]
+    everything = client.get("/analytics", params={"window_minutes": 240}).json()
+    assert ring_store.stats()["misses"] == misses + 1
+    assert everything["temperature"]["min"] == 5.0
+
+    ring = client.get("/metrics").json()["ring_buffer"]
+    assert ring["readings"] >= 4 and ring["bytes"] <= ring["max_bytes"]
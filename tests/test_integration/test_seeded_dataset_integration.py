@@ -0,0 +1,39 @@
+"""Integration tests over the session-scoped bulk dataset (`seed_dataset` fixture)."""
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+def test_analytics_over_seeded_readings(seeded_client: TestClient, seed_dataset):
+    data = seeded_client.get("/analytics").json()
+    assert data["temperature"]["avg"] == pytest.approx(seed_dataset.temperature_sum / seed_dataset.count, abs=0.051)  # 1 decimal
+    dashboard = seeded_client.get("/dashboard").json()
+    assert dashboard["count"] == seed_dataset.count
+
+    # Una hora de un sensor: ventana + filtro sobre el volumen completo
+    window = {"start": seed_dataset.start.isoformat(),
+              "end": (seed_dataset.start + timedelta(minutes=59)).isoformat(),
+              "sensor_id": seed_dataset.codes[3]}
+    one = seeded_client.get("/analytics", params=window).json()
+    assert one["temperature"]["min"] <= one["temperature"]["avg"] <= one["temperature"]["max"]
+    assert one["temperature"]["avg"] != data["temperature"]["avg"]
+
+
+@pytest.mark.parametrize("run", [1, 2])
+def test_writes_are_rolled_back_between_tests(seeded_client: TestClient, seed_dataset, run):
+    # Si el rollback fallara, la segunda ejecución vería dos lecturas de más
+    payload = {"sensor_id": seed_dataset.codes[0], "temperature": 99.0, "humidity": 50.0, "ph": 6.5,
+               "light": 10.0, "timestamp": (seed_dataset.end + timedelta(minutes=1)).isoformat()}
+    assert seeded_client.post("/sensor-data", json=payload).status_code == 200
+    assert seeded_client.get("/dashboard").json()["count"] == seed_dataset.count + 1
+    latest = seeded_client.get("/analytics", params={"sensor_id": seed_dataset.codes[0]}).json()
+    assert latest["temperature"]["max"] == 99.0
+
+
+@pytest.mark.parametrize("run", [1, 2])
+def test_default_database_starts_empty(client: TestClient, run):
+    assert client.get("/dashboard").json()["count"] == 0
+    payload = {"sensor_id": "rb-1", "temperature": 20.0, "humidity": 50.0, "ph": 6.5, "light": 10.0}
+    assert client.post("/sensor-data", json=payload).status_code == 200
+    assert client.get("/dashboard").json()["count"] == 1
@@ -0,0 +1,70 @@
+"""Integration tests for GET /analytics/sensors (precomputed per-sensor summary)."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+from services.sensor_summary import summary_refresher
+
+BASE = datetime(2026, 4, 1, tzinfo=timezone.utc)
+
+# The refresh runs on its own engine connection: it must see committed rows
+pytestmark = pytest.mark.committed_db
+
+
+def _post(client, sensor, i, temperature, light):
+    payload = {
+        "sensor_id": sensor, "temperature": temperature, "humidity": 60.0, "ph": 6.8,
+        "light": light, "timestamp": (BASE + timedelta(minutes=i)).isoformat(),
+    }
+    assert client.post("/sensor-data", json=payload).status_code == 200
+
+
+@pytest.fixture
+def refresher(db_session, monkeypatch):
+    monkeypatch.setattr(summary_refresher, "max_writes", 3)
+    monkeypatch.setattr(summary_refresher, "max_age", 3600)
+    summary_refresher.refresh(database.get_engine())
+    yield summary_refresher
+
+
+def test_summary_refreshes_after_write_threshold(client: TestClient, refresher):
+    first = client.get("/analytics/sensors").json()
+    assert first["sensors"] == {}
+    assert first["refreshed_at"] is not None
+
+    _post(client, "ms-1", 0, 20.0, 100.0)
+    _post(client, "ms-1", 1, 22.5, 300.0)
+    # Below the write threshold: the summary is served as of the last refresh
+    stale = client.get("/analytics/sensors").json()
+    assert stale["sensors"] == {} and stale["refreshed_at"] == first["refreshed_at"]
+
+    _post(client, "ms-2", 2, 18.0, 50.0)
+    fresh = client.get("/analytics/sensors").json()
+    assert fresh["refreshed_at"] > first["refreshed_at"]
+    assert list(fresh["sensors"]) == ["ms-1", "ms-2"]
+    ms1 = fresh["sensors"]["ms-1"]
+    assert ms1["count"] == 2
+    assert ms1["temperature"] == {"avg": 21.2, "max": 22.5, "min": 20.0}
+    assert ms1["light"] == {"avg": 200.0, "max": 300.0, "min": 100.0}
+    assert fresh["sensors"]["ms-2"]["ph"] == {"avg": 6.8, "max": 6.8, "min": 6.8}
+
+
+def test_summary_includes_compacted_blocks(client: TestClient, db_session, refresher):
+    from models import SensorBlock
+    from services.compaction import compact
+
+    for i, t in enumerate([10.0, 12.0, 14.0]):
+        _post(client, "ms-old", i, t, 10.0 * i)
+    try:
+        compact(db_session, older_than_days=1, now=BASE + timedelta(days=10))
+        refresher.refresh(database.get_engine())
+
+        summary = client.get("/analytics/sensors").json()["sensors"]["ms-old"]
+        assert summary["count"] == 3
+        assert summary["temperature"] == {"avg": 12.0, "max": 14.0, "min": 10.0}
+    finally:
+        # db_session only clears hot rows: drop the blocks this test created
+        db_session.query(SensorBlock).delete()
+        db_session.commit()
@@ -0,0 +1,34 @@
+"""Integration tests for GET /analytics/series (LTTB-downsampled charts data)."""
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+BASE = datetime(2026, 6, 2, tzinfo=timezone.utc)
+
+
+def test_series_is_bounded_by_points(client: TestClient):
+    body = {"readings": [
+        {"sensor_id": sensor, "temperature": 15.0 + (m % 40) / 4, "humidity": 50.0, "ph": 6.5, "light": float(m),
+         "timestamp": (BASE + timedelta(minutes=m)).isoformat()}
+        for m in range(300) for sensor in ("ts-a", "ts-b")
+    ]}
+    assert client.post("/sensor-data/batch", json=body).status_code == 200
+
+    data = client.get("/analytics/series", params={"points": 40, "metric": "light"}).json()
+    assert data["count"] == 600
+    assert sorted(data["series"]) == ["ts-a", "ts-b"]
+    light = data["series"]["ts-a"]["light"]
+    assert len(light["t"]) == 20
+    assert light["v"][0] == 0.0 and light["v"][-1] == 299.0
+    assert light["t"][0] == int(BASE.timestamp() * 1000)
+
+    one = client.get("/analytics/series", params={"sensor_id": "ts-b", "points": 1000}).json()
+    assert list(one["series"]) == ["ts-b"]
+    assert set(one["series"]["ts-b"]) == {"temperature", "humidity", "ph", "light"}
+    assert len(one["series"]["ts-b"]["ph"]["v"]) == 300
+
+
+def test_series_validation(client: TestClient):
+    assert client.get("/analytics/series", params={"points": 2}).status_code == 422
+    assert client.get("/analytics/series", params={"metric": "co2"}).status_code == 422
+    assert client.get("/analytics/series").json() == {"count": 0, "points": 500, "series": {}}
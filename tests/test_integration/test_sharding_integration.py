@@ -0,0 +1,91 @@
+"""Integration tests for sharded storage (SHARD_URLS) with several SQLite files."""
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from models import Sensor, SensorDevice
+from services import sharding
+from services.sensor_summary import summary_refresher
+
+BASE = datetime(2026, 6, 4, tzinfo=timezone.utc)
+CODES = [f"shard-{i}" for i in range(8)]
+
+# La segunda mitad refresca el resumen de la base única con su propio engine
+pytestmark = pytest.mark.committed_db
+
+
+@pytest.fixture
+def shard_set(tmp_path, monkeypatch):
+    shards = sharding.ShardSet([f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(3)])
+    monkeypatch.setattr(sharding, "shards", shards)
+    sharding.init_shards()
+    summary_refresher.reset()
+    try:
+        yield shards
+    finally:
+        summary_refresher.reset()
+        for i in range(len(shards)):
+            shards.engine(i).dispose()
+
+
+def _batch():
+    return {"readings": [
+        {"sensor_id": code, "temperature": 15.0 + i * 0.37 + m % 7, "humidity": 40.0 + (i * m) % 30,
+         "ph": 6.0 + i / 10, "light": float(100 * i + m), "timestamp": (BASE + timedelta(minutes=m)).isoformat()}
+        for m in range(30) for i, code in enumerate(CODES)
+    ] + [{"temperature": 30.0, "humidity": 10.0, "ph": 7.0, "light": 1.0, "timestamp": BASE.isoformat()}]}
+
+
+def _count(session, **filters):
+    return session.execute(select(func.count()).select_from(Sensor).filter_by(**filters)).scalar()
+
+
+def test_ingest_routes_each_sensor_to_its_shard(client: TestClient, db_session, shard_set):
+    r = client.post("/sensor-data/batch", json=_batch())
+    assert r.json()["inserted"] == 241
+    assert _count(db_session) == 0  # el catálogo no guarda lecturas
+
+    catalog = {d.code: d.id for d in db_session.query(SensorDevice).filter(SensorDevice.code.in_(CODES))}
+    for i in range(len(shard_set)):
+        with shard_set.sessionmaker(i)() as s:
+            mine = [c for c in CODES if zlib.crc32(c.encode()) % 3 == i]
+            assert _count(s) == 30 * len(mine) + (1 if i == 0 else 0)
+            for code in mine:
+                assert _count(s, sensor_key=catalog[code]) == 30
+            copies = {d.code: d.id for d in s.query(SensorDevice)}
+            assert copies == {c: catalog[c] for c in mine}
+    assert sum(shard_set.stats()["rows_written"]) == 241
+
+    # Reintento del gateway: duplicados en todos los shards (la lectura sin
+    # sensor no tiene identidad y vuelve a entrar, igual que sin shards)
+    assert client.post("/sensor-data/batch", json=_batch()).json()["inserted"] == 1
+
+
+def test_scatter_gather_matches_single_database(client: TestClient, db_session, shard_set, monkeypatch):
+    client.post("/sensor-data/batch", json=_batch())
+    window = {"start": BASE.isoformat(), "end": (BASE + timedelta(minutes=20)).isoformat()}
+    sharded = {
+        "all": client.get("/analytics").json(),
+        "window": client.get("/analytics", params=window).json(),
+        "dashboard": client.get("/dashboard").json(),
+        "series": client.get("/analytics/series", params={"points": 5000, "metric": "light"}).json(),
+        "sensors": client.get("/analytics/sensors").json()["sensors"],
+    }
+    before = shard_set.stats()["scatter_queries"]
+    one = client.get("/analytics", params={"sensor_id": CODES[3]}).json()
+    assert shard_set.stats()["scatter_queries"] == before + 1
+    assert one["temperature"]["min"] == 15.0 + 3 * 0.37
+    assert client.get("/sensor-data/snapshot").status_code == 501
+
+    # Mismas lecturas en una sola base: mismas respuestas
+    monkeypatch.setattr(sharding, "shards", sharding.ShardSet())
+    summary_refresher.reset()
+    client.post("/sensor-data/batch", json=_batch())
+    assert client.get("/analytics").json() == sharded["all"]
+    assert client.get("/analytics", params=window).json() == sharded["window"]
+    assert client.get("/dashboard").json() == sharded["dashboard"]
+    assert client.get("/analytics/series", params={"points": 5000, "metric": "light"}).json() == sharded["series"]
+    assert client.get("/analytics/sensors").json()["sensors"] == sharded["sensors"]
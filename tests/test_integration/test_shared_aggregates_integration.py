@@ -0,0 +1,78 @@
+"""Integration tests for analytics served from the shared-memory aggregate segment."""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services import cache, shared_aggregates as shm
+from services.readings import aggregate, summarize
+from services.shared_aggregates import SharedAggregates, shared_aggregates
+from services.sharding import session_factories
+
+BASE = datetime(2026, 6, 5, tzinfo=timezone.utc)
+
+pytestmark = pytest.mark.skipif(shm.fcntl is None, reason="requires fcntl")
+
+
+@pytest.fixture
+def segment(db_session, tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_aggregates, "name", f"agrosense-test-{uuid.uuid4().hex[:12]}")
+    monkeypatch.setattr(shared_aggregates, "lock_dir", str(tmp_path))
+    shared_aggregates.start(session_factories)
+    try:
+        yield shared_aggregates
+    finally:
+        shared_aggregates.unlink()
+
+
+def _post(client, readings, **params):
+    body = {"readings": [
+        {"sensor_id": s, "temperature": t, "humidity": 40.0 + i, "ph": 6.5, "light": 100.0 * i,
+         "timestamp": (BASE + timedelta(minutes=i)).isoformat()}
+        for i, (s, t) in enumerate(readings)
+    ], **params}
+    assert client.post("/sensor-data/batch", json=body).status_code == 200
+
+
+def test_analytics_served_from_segment(client: TestClient, db_session, segment):
+    _post(client, [("shm-a", 20.0), ("shm-b", 25.5), ("shm-a", 22.25), ("shm-b", 18.0)])
+    reads = segment.stats()["reads"]
+
+    expected = summarize(aggregate(db_session))
+    assert client.get("/analytics").json() == expected["metrics"]
+    assert client.get("/dashboard").json() == expected
+    one = client.get("/analytics", params={"sensor_id": "shm-b"}).json()
+    assert one["temperature"] == {"avg": 21.8, "max": 25.5, "min": 18.0}
+    sensors = client.get("/analytics/sensors").json()["sensors"]
+    assert sensors["shm-a"]["count"] == 2 and sensors["shm-a"]["temperature"]["max"] == 22.25
+    assert client.get("/dashboard/view").status_code == 200
+    assert segment.stats()["reads"] == reads + 5
+
+    # Una ventana no está en el segmento: va por la BD
+    window = client.get("/analytics", params={"start": (BASE + timedelta(minutes=2)).isoformat()}).json()
+    assert window["temperature"]["min"] == 18.0 and segment.stats()["reads"] == reads + 5
+
+
+def test_overwrites_are_recomputed(client: TestClient, db_session, segment):
+    _post(client, [("shm-c", 10.0), ("shm-c", 30.0)])
+    assert client.get("/analytics").json()["temperature"]["min"] == 10.0
+    rebuilds = segment.stats()["rebuilds"]
+    # La lectura mínima se corrige al alza: el mínimo sale de la BD, no de una suma
+    _post(client, [("shm-c", 15.0)], on_conflict="update")
+    assert client.get("/analytics").json()["temperature"] == {"avg": 22.5, "max": 30.0, "min": 15.0}
+    assert segment.stats()["rebuilds"] == rebuilds + 1
+
+
+def test_generation_is_shared_between_processes(client: TestClient, db_session, segment):
+    other = SharedAggregates(name=segment.name, slots=segment.slots, lock_dir=segment.lock_dir)
+    other.start(session_factories)  # otro worker: se engancha al mismo segmento
+    try:
+        token = cache.data_generation()
+        _post(client, [("shm-d", 12.0)])
+        assert cache.data_generation() != token
+        assert other.token() == segment.token()
+        assert other.totals()["temperature"].count == 1
+    finally:
+        other.close()
+        cache.use_shared_generation(segment)
@@ -0,0 +1,83 @@
+"""Integration tests for GET /sensor-data/snapshot (Parquet / Arrow export)."""
+import io
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+from services import snapshot
+
+BASE = datetime(2026, 5, 1, tzinfo=timezone.utc)
+
+
+def _seed(client, readings):
+    body = {"readings": [
+        {"sensor_id": s, "temperature": t, "humidity": 50.0, "ph": 6.5, "light": 100.0,
+         "timestamp": (BASE + timedelta(minutes=i)).isoformat()}
+        for i, (s, t) in enumerate(readings)
+    ]}
+    assert client.post("/sensor-data/batch", json=body).status_code == 200
+
+
+def test_parquet_snapshot_round_trip(client: TestClient, db_session, monkeypatch):
+    # Grupos de 2 filas para comprobar las estadísticas por grupo
+    monkeypatch.setattr(snapshot, "SNAPSHOT_ROW_GROUP_ROWS", 2)
+    _seed(client, [("snap-a", 20.0), ("snap-b", 21.0), ("snap-a", 22.0), ("snap-b", 23.0), ("snap-a", 24.0)])
+
+    r = client.get("/sensor-data/snapshot")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/vnd.apache.parquet"
+    assert "content-encoding" not in r.headers
+
+    file = pq.ParquetFile(io.BytesIO(r.content))
+    assert file.schema_arrow.field("sensor_id").type == pa.dictionary(pa.int32(), pa.string())
+    assert file.metadata.num_row_groups == 3
+    stats = file.metadata.row_group(0).column(0).statistics
+    assert stats.has_min_max and stats.min == BASE and stats.max == BASE + timedelta(minutes=1)
+
+    table = file.read()
+    assert table.column("temperature").to_pylist() == [20.0, 21.0, 22.0, 23.0, 24.0]
+    assert table.column("sensor_id").to_pylist() == ["snap-a", "snap-b", "snap-a", "snap-b", "snap-a"]
+
+
+def test_arrow_snapshot_filters_by_sensor_and_window(client: TestClient, db_session):
+    _seed(client, [("snap-a", 20.0), ("snap-b", 21.0), ("snap-a", 22.0), ("snap-a", 23.0)])
+
+    r = client.get("/sensor-data/snapshot", params={
+        "format": "arrow", "sensor_id": "snap-a", "start": (BASE + timedelta(minutes=1)).isoformat(),
+    })
+    assert r.status_code == 200
+    assert r.headers["content-disposition"].endswith('.arrow"')
+    table = pa.ipc.open_stream(r.content).read_all()
+    assert table.column("temperature").to_pylist() == [22.0, 23.0]
+    assert set(table.column("sensor_id").to_pylist()) == {"snap-a"}
+
+    assert client.get("/sensor-data/snapshot", params={"sensor_id": "nope"}).status_code == 404
+    assert client.get("/sensor-data/snapshot", params={"format": "csv"}).status_code == 422
+
+
+def test_snapshot_includes_compacted_blocks(client: TestClient, db_session, tmp_path):
+    from models import SensorBlock
+    from services.compaction import compact
+
+    _seed(client, [("snap-old", 10.0), ("snap-old", 12.0)])
+    try:
+        assert compact(db_session, older_than_days=1, now=BASE + timedelta(days=10))["rows"] == 2
+        out = tmp_path / "snap.parquet"
+        rows = snapshot.write_snapshot(db_session, str(out))
+        assert rows == 2
+        assert pq.read_table(out).column("temperature").to_pylist() == [10.0, 12.0]
+    finally:
+        db_session.query(SensorBlock).delete()
+        db_session.commit()
+
+
+def test_snapshot_without_pyarrow_returns_501(client: TestClient, db_session, monkeypatch):
+    def missing():
+        raise snapshot.SnapshotUnavailable("pyarrow is required for snapshot export")
+
+    monkeypatch.setattr(snapshot, "require_pyarrow", missing)
+    assert client.get("/sensor-data/snapshot").status_code == 501
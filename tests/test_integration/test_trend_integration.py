@@ -0,0 +1,63 @@
+"""Integration tests for GET /analytics/trend (incremental per-sensor trend)."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services.trend import trend_store
+
+BASE = datetime(2026, 6, 1, 8, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def enabled_trend(monkeypatch):
+    # Opt-in en producción (un solo escritor); aquí la API es el único escritor
+    monkeypatch.setattr(trend_store, "enabled", True)
+
+
+def _series(sensor, temperature):
+    return {"readings": [
+        {"sensor_id": sensor, "temperature": temperature(m), "humidity": 60.0, "ph": 6.8, "light": 400.0,
+         "timestamp": (BASE + timedelta(minutes=m)).isoformat()}
+        for m in range(0, 60, 5)
+    ]}
+
+
+def test_trend_follows_ingested_readings(client: TestClient):
+    assert client.post("/sensor-data/batch", json=_series("gh-1", lambda m: 20.0 + 0.1 * m)).status_code == 200
+
+    r = client.get("/analytics/trend", params={"sensor_id": "gh-1", "horizon_minutes": 30})
+    assert r.status_code == 200
+    data = r.json()
+    assert data["metric"] == "temperature" and data["samples"] == 12
+    assert data["slope_per_hour"] == 6.0
+    assert data["level"] == 25.5
+    assert data["forecast"] == 28.5
+
+    humidity = client.get("/analytics/trend", params={"sensor_id": "gh-1", "metric": "humidity"}).json()
+    assert humidity["slope_per_hour"] == 0.0 and humidity["mean"] == 60.0
+
+
+def test_trend_validation(client: TestClient):
+    assert client.get("/analytics/trend", params={"sensor_id": "nope"}).status_code == 404
+    assert client.get("/analytics/trend").status_code == 422
+    assert client.get("/analytics/trend", params={"sensor_id": "x", "metric": "co2"}).status_code == 422
+
+
+def test_overwritten_readings_rebuild_the_trend(client: TestClient):
+    assert client.post("/sensor-data/batch", json=_series("gh-2", lambda m: 99.0)).status_code == 200
+    # Corrección de todo el lote: el estado no puede conservar los 99 °C
+    fixed = client.post("/sensor-data/batch", json={**_series("gh-2", lambda m: 20.0 + 0.1 * m),
+                                                    "on_conflict": "update"})
+    assert fixed.json()["inserted"] == 0
+
+    data = client.get("/analytics/trend", params={"sensor_id": "gh-2", "horizon_minutes": 30}).json()
+    assert data["samples"] == 12
+    assert data["slope_per_hour"] == 6.0 and data["forecast"] == 28.5
+    assert trend_store.stats()["rebuilds"] == 1
+
+
+def test_trend_disabled_returns_501(client: TestClient, monkeypatch):
+    monkeypatch.setattr(trend_store, "enabled", False)
+    assert client.post("/sensor-data/batch", json=_series("gh-3", lambda m: 20.0)).status_code == 200
+    assert client.get("/analytics/trend", params={"sensor_id": "gh-3"}).status_code == 501
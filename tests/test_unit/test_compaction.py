@@ -0,0 +1,133 @@
+"""Unit tests for cold-storage compaction (services.columnar / compaction / readings).
+
+Cases:
+- CP-COMP-01: columnar codecs round-trip and compress regular series
+- CP-COMP-02: compaction moves old rows to blocks without changing analytics
+- CP-COMP-03: windowed reads combine hot rows with partially covered blocks
+- CP-COMP-04: late readings are merged into the existing block
+- CP-COMP-05: a replayed reading already in a block replaces it instead of counting twice
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Sensor, SensorBlock
+from services.columnar import decode_floats, decode_timestamps, encode_floats, encode_timestamps
+from services.compaction import compact
+from services.readings import METRICS, aggregate, load_columns, summarize, to_micros
+from services.sensor_registry import SensorRegistry
+
+NOW = datetime(2026, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_columnar_round_trip_and_ratio():
+    values = [round(20.0 + random.uniform(-0.5, 0.5), 2) for _ in range(5000)]
+    raw = [random.random() * 1e3 for _ in range(100)]
+    start = to_micros(NOW)
+    stamps = [start + i * 5_000_000 for i in range(5000)]
+    assert list(decode_floats(encode_floats(values))) == values
+    assert list(decode_floats(encode_floats(raw))) == raw
+    assert list(decode_timestamps(encode_timestamps(stamps))) == stamps
+    # Regular sampling compresses to almost nothing; 2-decimal noise at least 5x vs float64
+    assert len(encode_timestamps(stamps)) < 200
+    assert len(encode_floats(values)) < len(values) * 8 / 5
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    reg = SensorRegistry()
+    keys = reg.resolve_many(session, ["s1", "s2"])
+    rows = []
+    for days_ago in (120, 100, 95, 1):
+        base = NOW - timedelta(days=days_ago)
+        for code, key in keys.items():
+            for i in range(24):
+                rows.append(
+                    Sensor(
+                        sensor_key=key,
+                        temperature=20 + i * 0.1,
+                        humidity=50 + days_ago * 0.01,
+                        ph=6.5,
+                        light=100.0 * (i % 5),
+                        timestamp=base.replace(hour=0) + timedelta(hours=i),
+                    )
+                )
+    session.add_all(rows)
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_compaction_preserves_aggregates(db):
+    before = summarize(aggregate(db))
+    stats = compact(db, older_than_days=90, now=NOW)
+
+    assert stats["rows"] == 3 * 2 * 24
+    assert stats["blocks"] == 3 * 2
+    assert db.scalar(select(func.count(Sensor.id))) == 2 * 24
+    assert db.scalar(select(func.count(SensorBlock.id))) == 6
+
+    after = summarize(aggregate(db))
+    assert after == before
+
+
+def test_windowed_reads_cover_blocks_and_hot_rows(db):
+    window = (NOW - timedelta(days=100, hours=12), NOW)
+    before = summarize(aggregate(db, *window))
+    before_cols = load_columns(db, *window)
+
+    compact(db, older_than_days=90, now=NOW)
+
+    assert summarize(aggregate(db, *window)) == before
+    after_cols = load_columns(db, *window)
+    assert list(after_cols.ts) == list(before_cols.ts)
+    for m in METRICS:
+        assert list(after_cols.metrics[m]) == list(before_cols.metrics[m])
+
+
+def test_late_reading_merged_into_existing_block(db):
+    compact(db, older_than_days=90, now=NOW)
+    key = db.scalar(select(SensorBlock.sensor_key).limit(1))
+    late_ts = (NOW - timedelta(days=120)).replace(hour=0, minute=30)
+    db.add(Sensor(sensor_key=key, temperature=99.0, humidity=1.0, ph=7.0, light=5.0, timestamp=late_ts))
+    db.commit()
+
+    stats = compact(db, older_than_days=90, now=NOW)
+    assert stats == {**stats, "rows": 1, "blocks": 1}
+    block = db.execute(
+        select(SensorBlock).where(SensorBlock.sensor_key == key, SensorBlock.day == late_ts.date())
+    ).scalar_one()
+    assert block.count == 25
+    assert block.temperature_max == 99.0
+    stamps = list(decode_timestamps(block.timestamps))
+    assert stamps == sorted(stamps)
+
+
+def test_replayed_compacted_reading_not_counted_twice(db):
+    compact(db, older_than_days=90, now=NOW)
+    key = db.scalar(select(SensorBlock.sensor_key).limit(1))
+    day = (NOW - timedelta(days=120)).date()
+    before = summarize(aggregate(db))
+    block = db.execute(select(SensorBlock).where(SensorBlock.sensor_key == key, SensorBlock.day == day)).scalar_one()
+    temp_sum = block.temperature_sum
+    # Reenvío tardío del gateway: misma (sensor, timestamp) que una lectura ya compactada
+    replay_ts = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc) + timedelta(hours=3)
+    db.add(Sensor(sensor_key=key, temperature=20.3, humidity=1.0, ph=6.5, light=300.0, timestamp=replay_ts))
+    db.commit()
+
+    compact(db, older_than_days=90, now=NOW)
+    db.refresh(block)
+    assert block.count == 24
+    assert block.temperature_sum == pytest.approx(temp_sum)
+    assert block.humidity_min == 1.0  # gana la fila nueva
+    stamps = list(decode_timestamps(block.timestamps))
+    assert len(set(stamps)) == len(stamps) == 24
+    after = summarize(aggregate(db))
+    assert after["count"] == before["count"]
@@ -0,0 +1,95 @@
+"""Unit tests for the cross-sensor correlation kernel (services.kernels.correlation).
+
+Cases:
+- CP-CORR-01: the vectorized matrix matches a per-pair Pearson over common intervals
+- CP-CORR-02: readings are averaged per interval and aligned across sensors
+- CP-CORR-03: pairs with too little overlap or a constant series are null
+- CP-CORR-04: grids above CORRELATION_MAX_CELLS are rejected with KernelInputError
+"""
+import numpy as np
+import pytest
+
+from services import kernels
+from services.executor import ColumnsView
+from services.kernels import KernelInputError, correlation
+from services.readings import METRICS
+
+MINUTE_US = 60_000_000
+
+
+def _view(ts, keys, **metrics):
+    arrays = {"ts": np.asarray(ts, dtype=np.int64), "sensor_key": np.asarray(keys, dtype=np.int64)}
+    for m in METRICS:
+        arrays[m] = np.asarray(metrics.get(m, np.zeros(len(ts))), dtype=np.float64)
+    return ColumnsView(arrays)
+
+
+def _noop():
+    pass
+
+
+def test_matches_pairwise_pearson():
+    rng = np.random.default_rng(3)
+    n = 3000
+    ts = rng.integers(0, 600 * MINUTE_US, n)
+    keys = rng.integers(1, 4, n)
+    temperature = 20 + np.sin(ts / 3e9) + rng.normal(0, 0.2, n)
+    humidity = 80 - 2 * temperature + rng.normal(0, 0.5, n)
+    raw = {"temperature": temperature, "humidity": humidity}
+    view = _view(ts, keys, **raw)
+
+    out = correlation(view, {"metrics": ["temperature", "humidity"], "resolution_us": 5 * MINUTE_US,
+                             "start_us": 0}, _noop)
+    assert out["keys"] == [1, 2, 3] and out["bins"] == 120
+
+    # Referencia: media por intervalo y Pearson sobre los intervalos comunes de cada par
+    series = []
+    for key in out["keys"]:
+        for metric in out["metrics"]:
+            grid = np.full(out["bins"], np.nan)
+            for b in range(out["bins"]):
+                sel = (keys == key) & (ts // (5 * MINUTE_US) == b)
+                if sel.any():
+                    grid[b] = raw[metric][sel].mean()
+            series.append(grid)
+    for i, a in enumerate(series):
+        for j, b in enumerate(series):
+            common = ~np.isnan(a) & ~np.isnan(b)
+            assert out["overlap"][i][j] == common.sum()
+            expected = np.corrcoef(a[common], b[common])[0, 1]
+            assert out["matrix"][i][j] == pytest.approx(expected, abs=1e-4)
+    assert out["matrix"][0][1] < -0.9  # humedad anticorrelada con temperatura
+
+
+def test_readings_averaged_and_aligned():
+    # Sensor 1 con dos lecturas por intervalo, sensor 2 con una desplazada dentro del intervalo
+    ts = [0, 30, 60, 90, 120, 150, 10, 70, 130]
+    keys = [1, 1, 1, 1, 1, 1, 2, 2, 2]
+    temp = [10, 12, 20, 22, 30, 32, 1, 2, 3]  # medias 11, 21, 31
+    view = _view([t * 1_000_000 for t in ts], keys, temperature=temp)
+    out = correlation(view, {"metrics": ["temperature"], "resolution_us": 60_000_000}, _noop)
+    assert out["bins"] == 3
+    assert out["overlap"] == [[3, 3], [3, 3]]
+    assert out["matrix"] == [[1.0, 1.0], [1.0, 1.0]]
+
+
+def test_sparse_and_flat_series_are_null():
+    ts = [0, 1, 2, 3, 0, 1]
+    keys = [1, 1, 1, 1, 2, 2]
+    view = _view([t * MINUTE_US for t in ts], keys, temperature=[1, 2, 3, 5, 4, 3], ph=[6.5] * 6)
+    out = correlation(view, {"metrics": ["temperature", "ph"], "resolution_us": MINUTE_US}, _noop)
+    # columnas: (1, temperature), (1, ph), (2, temperature), (2, ph)
+    assert out["matrix"][0][0] == 1.0
+    assert out["matrix"][0][1] is None  # ph constante
+    assert out["matrix"][0][2] is None  # solo dos intervalos comunes
+    assert out["overlap"][0][2] == 2
+
+    empty = correlation(_view([], []), {"metrics": ["ph"], "resolution_us": MINUTE_US}, _noop)
+    assert empty["matrix"] == [] and empty["bins"] == 0
+
+
+def test_grid_cap(monkeypatch):
+    monkeypatch.setattr(kernels, "CORRELATION_MAX_CELLS", 100)
+    view = _view([0, 200 * MINUTE_US], [1, 2])
+    with pytest.raises(KernelInputError):
+        correlation(view, {"metrics": list(METRICS), "resolution_us": MINUTE_US}, _noop)
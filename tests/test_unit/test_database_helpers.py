@@ -246,3 +246,41 @@ def test_get_connection_builds_dsn_from_env_vars(monkeypatch):
     conn = mod.get_connection()
     assert isinstance(conn, FakeConn)
     assert conn.dsn == built
+
+
+def test_import_does_not_create_engine():
+    """Importar database.py no debe construir el engine (arranque perezoso)."""
+    mod = load_database_isolated(env={"DATABASE_URL": "sqlite:///:memory:"})
+    assert "engine" not in vars(mod)
+    assert "SessionLocal" not in vars(mod)
+    # First attribute access builds and caches it
+    engine = mod.engine
+    assert vars(mod)["engine"] is engine
+    assert mod.get_sessionmaker().kw["bind"] is engine
+
+
+def test_init_db_skips_create_all_when_schema_current(monkeypatch):
+    import database as real_db
+    from sqlalchemy import create_engine
+
+    engine = create_engine("sqlite:///:memory:")
+    monkeypatch.setattr(real_db, "engine", engine)
+
+    calls = []
+    original = real_db.Base.metadata.create_all
+    monkeypatch.setattr(real_db.Base.metadata, "create_all", lambda **kw: (calls.append(kw), original(**kw)))
+
+    real_db.init_db()
+    assert len(calls) == 1
+
+    # A new process (empty in-memory cache) only reads schema_version
+    real_db._verified_engines.discard(engine)
+    real_db.init_db()
+    assert len(calls) == 1
+
+    # Stale version triggers create_all again
+    real_db._verified_engines.discard(engine)
+    with engine.begin() as conn:
+        conn.execute(real_db.schema_version_table.update().values(version=0))
+    real_db.init_db()
+    assert len(calls) == 2
@@ -0,0 +1,83 @@
+"""Unit tests for the analytics process-pool executor (services.executor).
+
+Cases:
+- CP-EXEC-01: kernels see the shipped columns through shared memory (pool and inline paths)
+- CP-EXEC-02: a timeout raises AnalyticsTimeout and frees the worker via the cancel flag
+"""
+import asyncio
+import time
+from array import array
+
+import numpy as np
+import pytest
+
+from services.executor import AnalyticsExecutor, AnalyticsTimeout
+from services.kernels import percentiles
+from services.readings import METRICS, Columns
+
+
+def _columns(n: int) -> Columns:
+    rng = np.random.default_rng(7)
+    return Columns(
+        ts=array("q", range(n)),
+        sensor_key=array("q", [1 + i % 3 for i in range(n)]),
+        metrics={m: array("d", rng.normal(50, 10, n)) for m in METRICS},
+    )
+
+
+def checksum_kernel(cols, params, check_cancelled):
+    return {
+        "n": len(cols),
+        "ts": int(cols.ts.sum()),
+        "keys": int(cols.sensor_key.sum()),
+        "light": float(cols.metrics["light"].sum()),
+    }
+
+
+def spin_kernel(cols, params, check_cancelled):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        check_cancelled()
+        time.sleep(0.01)
+    return "not cancelled"
+
+
+@pytest.fixture
+def pool():
+    executor = AnalyticsExecutor(workers=1, inline_rows=0)
+    yield executor
+    executor.shutdown()
+
+
+def test_pool_and_inline_results_match(pool):
+    cols = _columns(5000)
+    params = {"q": [50, 99], "metrics": list(METRICS)}
+    remote = asyncio.run(pool.run(percentiles, cols, params))
+    inline = asyncio.run(AnalyticsExecutor(workers=0).run(percentiles, cols, params))
+    assert remote == inline
+    expected = np.percentile(np.asarray(cols.metrics["ph"]), [50, 99])
+    assert remote["percentiles"]["ph"]["p99"] == pytest.approx(expected[1])
+
+    check = asyncio.run(pool.run(checksum_kernel, cols))
+    assert check == {
+        "n": 5000,
+        "ts": sum(cols.ts),
+        "keys": sum(cols.sensor_key),
+        "light": pytest.approx(sum(cols.metrics["light"])),
+    }
+
+
+def test_timeout_cancels_worker(pool):
+    cols = _columns(100)
+    with pytest.raises(AnalyticsTimeout):
+        asyncio.run(pool.run(spin_kernel, cols, timeout=0.5))
+    # The single worker saw the cancel flag and is free for the next job
+    started = time.monotonic()
+    assert asyncio.run(pool.run(checksum_kernel, cols, timeout=10))["n"] == 100
+    assert time.monotonic() - started < 10
+
+
+def test_inline_cancel_flag_stops_kernel():
+    executor = AnalyticsExecutor(workers=0)
+    with pytest.raises(AnalyticsTimeout):
+        asyncio.run(executor.run(spin_kernel, _columns(10), timeout=0.2))
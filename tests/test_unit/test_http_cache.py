@@ -0,0 +1,58 @@
+"""Unit tests for services.http_cache (negotiation and compression middleware)."""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from services.http_cache import CompressionMiddleware, negotiate_encoding
+
+# brotli is optional for the app; these tests exercise the br branch
+pytest.importorskip("brotli")
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        ("gzip, deflate, br", "br"),
+        ("gzip", "gzip"),
+        ("br;q=0, gzip;q=0.5", "gzip"),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+@pytest.fixture
+def json_client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+
+    @app.get("/big")
+    def big():
+        return {"values": list(range(500))}
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_middleware_brotli_json(json_client):
+    r = json_client.get("/big", headers={"Accept-Encoding": "br"})
+    assert r.headers["content-encoding"] == "br"
+    assert "accept-encoding" in r.headers["vary"].lower()
+    assert r.json()["values"][-1] == 499
+
+
+def test_middleware_gzip_json(json_client):
+    r = json_client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.json()["values"][0] == 0
+
+
+def test_middleware_skips_small_bodies(json_client):
+    r = json_client.get("/small", headers={"Accept-Encoding": "br"})
+    assert "content-encoding" not in r.headers
+    assert r.json() == {"ok": True}
@@ -0,0 +1,70 @@
+"""Unit tests for the LTTB downsampling kernel (services.kernels.lttb_series).
+
+Cases:
+- CP-LTTB-01: the vectorized selection matches a straightforward per-bucket LTTB
+- CP-LTTB-02: series are split per sensor, keep endpoints and respect the point budget
+- CP-LTTB-03: windows smaller than the budget are returned unchanged
+"""
+from array import array
+
+import numpy as np
+
+from services.executor import ColumnsView
+from services.kernels import _lttb_indices, lttb_series
+from services.readings import METRICS
+
+
+def _reference(x, y, threshold):
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    a, out = 0, [0]
+    for i in range(threshold - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        if i == threshold - 3:
+            cx, cy = x[-1], y[-1]
+        else:
+            nxt = slice(hi, min(int((i + 2) * every) + 1, n))
+            cx, cy = x[nxt].mean(), y[nxt].mean()
+        areas = [abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a])) for j in range(lo, hi)]
+        a = lo + int(np.argmax(areas))
+        out.append(a)
+    return out + [n - 1]
+
+
+def _view(ts, keys, values):
+    arrays = {"ts": np.asarray(ts, dtype=np.int64), "sensor_key": np.asarray(keys, dtype=np.int64)}
+    for m in METRICS:
+        arrays[m] = np.asarray(values, dtype=np.float64)
+    return ColumnsView(arrays)
+
+
+def test_matches_reference_lttb():
+    rng = np.random.default_rng(3)
+    for n, threshold in [(1000, 50), (137, 10), (10, 9)]:
+        x = np.sort(rng.uniform(0, 100, n))
+        ys = rng.normal(size=(2, n)).cumsum(axis=1)
+        got = _lttb_indices(x, ys, threshold, lambda: None)
+        for k in range(2):
+            assert got[k].tolist() == _reference(x, ys[k], threshold)
+
+
+def test_per_sensor_budget_and_endpoints():
+    n = 2000
+    ts = np.arange(n) * 1_000_000 + 1_700_000_000_000_000
+    keys = np.where(np.arange(n) % 2 == 0, 1, 2)  # dos sensores intercalados
+    values = np.sin(np.arange(n) / 50.0)
+    out = lttb_series(_view(ts, keys, values), {"points": 100, "metrics": ["temperature"]}, lambda: None)
+    assert out["count"] == n
+    assert sorted(out["series"]) == [1, 2]
+    first = out["series"][1]["temperature"]
+    assert len(first["t"]) == len(first["v"]) == 50
+    assert first["t"][0] == ts[0] // 1000 and first["t"][-1] == ts[-2] // 1000
+    assert first["t"] == sorted(first["t"])
+    assert max(first["v"]) > 0.99 and min(first["v"]) < -0.99  # conserva los extremos
+
+
+def test_small_window_unchanged():
+    cols = _view([10_000, 20_000, 30_000], [1, 1, 1], [1.0, 2.0, 3.0])
+    out = lttb_series(cols, {"points": 500, "metrics": ["ph"]}, lambda: None)
+    assert out["series"][1]["ph"] == {"t": [10, 20, 30], "v": [1.0, 2.0, 3.0]}
+    assert lttb_series(_view([], [], []), {"points": 10, "metrics": ["ph"]}, lambda: None) == {"count": 0, "series": {}}
@@ -0,0 +1,128 @@
+"""Unit tests for schema migrations applied by init_db().
+
+Cases:
+- CP-MIG-01: legacy sensor_data.sensor_id (text) is moved to the sensors dimension
+- CP-MIG-02: a fresh database is created at the current version without migrating
+- CP-MIG-03: duplicated (sensor, timestamp) readings are removed before the unique index
+- CP-MIG-04: the baseline `sensor_metrics` view on sensor_id does not block the
+  migration and is recreated on the sensors dimension
+- CP-MIG-05: a v5 database gets the `sensor_data.timestamp` index used by max(timestamp)
+"""
+from sqlalchemy import create_engine, inspect, text
+
+import database as real_db
+
+
+def _use_engine(monkeypatch, url):
+    engine = create_engine(url)
+    monkeypatch.setattr(real_db, "engine", engine)
+    return engine
+
+
+def test_legacy_sensor_id_migrated_to_dimension(monkeypatch, tmp_path):
+    engine = _use_engine(monkeypatch, f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE sensor_data (id INTEGER PRIMARY KEY, sensor_id VARCHAR, temperature FLOAT NOT NULL,"
+            " humidity FLOAT NOT NULL, ph FLOAT NOT NULL, light FLOAT NOT NULL, timestamp DATETIME)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO sensor_data (sensor_id, temperature, humidity, ph, light) VALUES"
+            " ('S-1', 20, 50, 6.5, 200), ('S-2', 21, 51, 6.6, 210), ('S-1', 22, 52, 6.7, 220), (NULL, 23, 53, 6.8, 230)"
+        )
+
+    real_db.init_db()
+
+    columns = {c["name"] for c in inspect(engine).get_columns("sensor_data")}
+    assert "sensor_id" not in columns and "sensor_key" in columns
+    with engine.connect() as conn:
+        codes = conn.execute(text("SELECT code FROM sensors ORDER BY code")).scalars().all()
+        per_code = dict(
+            conn.execute(
+                text("SELECT s.code, COUNT(*) FROM sensor_data d JOIN sensors s ON s.id = d.sensor_key GROUP BY s.code")
+            ).all()
+        )
+        orphans = conn.execute(text("SELECT COUNT(*) FROM sensor_data WHERE sensor_key IS NULL")).scalar()
+        version = conn.execute(text("SELECT version FROM schema_version")).scalar()
+    assert codes == ["S-1", "S-2"]
+    assert per_code == {"S-1": 2, "S-2": 1}
+    assert orphans == 1
+    assert version == real_db.SCHEMA_VERSION
+
+
+def test_fresh_database_created_at_current_version(monkeypatch):
+    engine = _use_engine(monkeypatch, "sqlite:///:memory:")
+    real_db.init_db()
+    insp = inspect(engine)
+    assert {"sensors", "sensor_data", "schema_version"} <= set(insp.get_table_names())
+    assert "sensor_key" in {c["name"] for c in insp.get_columns("sensor_data")}
+
+
+def test_duplicate_readings_removed_before_unique_index(monkeypatch, tmp_path):
+    engine = _use_engine(monkeypatch, f"sqlite:///{tmp_path / 'dups.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE sensors (id INTEGER PRIMARY KEY, code VARCHAR NOT NULL UNIQUE)")
+        conn.exec_driver_sql(
+            "CREATE TABLE sensor_data (id INTEGER PRIMARY KEY, sensor_key INTEGER, temperature FLOAT NOT NULL,"
+            " humidity FLOAT NOT NULL, ph FLOAT NOT NULL, light FLOAT NOT NULL, timestamp DATETIME)"
+        )
+        conn.exec_driver_sql("INSERT INTO sensors (id, code) VALUES (1, 'S-1')")
+        conn.exec_driver_sql(
+            "INSERT INTO sensor_data (sensor_key, temperature, humidity, ph, light, timestamp) VALUES"
+            " (1, 20, 50, 6.5, 200, '2025-01-01 00:00:00'), (1, 21, 50, 6.5, 200, '2025-01-01 00:00:00'),"
+            " (1, 22, 50, 6.5, 200, '2025-01-01 00:05:00'), (1, 23, 50, 6.5, 200, NULL), (1, 24, 50, 6.5, 200, NULL)"
+        )
+        conn.exec_driver_sql("CREATE TABLE schema_version (version INTEGER NOT NULL)")
+        conn.exec_driver_sql("INSERT INTO schema_version VALUES (3)")
+
+    real_db.init_db()
+
+    with engine.connect() as conn:
+        temps = conn.execute(text("SELECT temperature FROM sensor_data ORDER BY id")).scalars().all()
+    assert temps == [20, 22, 23, 24]
+    assert any(ix["name"] == "uq_sensor_reading" and ix["unique"] for ix in inspect(engine).get_indexes("sensor_data"))
+
+
+def test_legacy_metrics_view_recreated_on_dimension(monkeypatch, tmp_path):
+    engine = _use_engine(monkeypatch, f"sqlite:///{tmp_path / 'legacy_view.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE sensor_data (id INTEGER PRIMARY KEY, sensor_id VARCHAR, temperature FLOAT NOT NULL,"
+            " humidity FLOAT NOT NULL, ph FLOAT NOT NULL, light FLOAT NOT NULL, timestamp DATETIME)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO sensor_data (sensor_id, temperature, humidity, ph, light) VALUES"
+            " ('S-1', 20, 50, 6.5, 200), ('S-1', 22, 52, 6.7, 220), ('S-2', 21, 51, 6.6, 210)"
+        )
+        # Vista tal como la creaba el seed original (scripts/seed_data.sql)
+        conn.exec_driver_sql(
+            "CREATE VIEW sensor_metrics AS SELECT sensor_id, ROUND(AVG(temperature), 2) AS avg_temp,"
+            " MAX(temperature) AS max_temp, MIN(temperature) AS min_temp FROM sensor_data GROUP BY sensor_id"
+        )
+
+    real_db.init_db()
+
+    assert "sensor_id" not in {c["name"] for c in inspect(engine).get_columns("sensor_data")}
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT sensor_id, avg_temp, max_light FROM sensor_metrics ORDER BY sensor_id")).all()
+    assert [tuple(r) for r in rows] == [("S-1", 21.0, 220), ("S-2", 21.0, 210)]
+
+
+def test_timestamp_index_added_for_latest_reading(monkeypatch, tmp_path):
+    engine = _use_engine(monkeypatch, f"sqlite:///{tmp_path / 'v5.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE sensors (id INTEGER PRIMARY KEY, code VARCHAR NOT NULL UNIQUE)")
+        conn.exec_driver_sql(
+            "CREATE TABLE sensor_data (id INTEGER PRIMARY KEY, sensor_key INTEGER, temperature FLOAT NOT NULL,"
+            " humidity FLOAT NOT NULL, ph FLOAT NOT NULL, light FLOAT NOT NULL, timestamp DATETIME)"
+        )
+        conn.exec_driver_sql("CREATE UNIQUE INDEX uq_sensor_reading ON sensor_data (sensor_key, timestamp)")
+        conn.exec_driver_sql("CREATE TABLE schema_version (version INTEGER NOT NULL)")
+        conn.exec_driver_sql("INSERT INTO schema_version VALUES (5)")
+
+    real_db.init_db()
+
+    assert "ix_sensor_data_timestamp" in {ix["name"] for ix in inspect(engine).get_indexes("sensor_data")}
+    with engine.connect() as conn:
+        plan = " ".join(str(r[-1]) for r in conn.exec_driver_sql("EXPLAIN QUERY PLAN SELECT max(timestamp) FROM sensor_data"))
+    assert "ix_sensor_data_timestamp" in plan
@@ -0,0 +1,86 @@
+"""Unit tests for ingest rate limiting (services.ratelimit).
+
+Cases:
+- CP-RL-01: buckets refill at the configured rate and report the wait time
+- CP-RL-02: a request is all-or-nothing across the client and sensor buckets
+- CP-RL-03: idle buckets are evicted without changing behaviour; the key cap holds
+- CP-RL-04: the concurrency limiter sheds load beyond its limit
+- CP-RL-05: a zero rate gives an infinite wait, capped in the Retry-After header
+"""
+import math
+
+import pytest
+
+from services.ratelimit import (
+    RETRY_AFTER_MAX_SECONDS,
+    ConcurrencyLimiter,
+    IngestLimiter,
+    Overloaded,
+    RateLimited,
+    TokenBuckets,
+    retry_after_header,
+)
+
+
+def test_bucket_refill_and_wait_time():
+    buckets = TokenBuckets(rate=2.0, burst=3.0)
+    for _ in range(3):
+        assert buckets.wait_time("s1", now=0.0) == 0.0
+        buckets.consume("s1", now=0.0)
+    assert buckets.wait_time("s1", now=0.0) == pytest.approx(0.5)
+    assert buckets.wait_time("s1", now=0.25) == pytest.approx(0.25)
+    assert buckets.available("s1", now=10.0) == 3.0  # capped at burst
+    assert buckets.wait_time("other", now=0.0) == 0.0
+
+
+def test_limiter_is_atomic_across_scopes():
+    limiter = IngestLimiter(enabled=True, sensor_rate=1.0, sensor_burst=1.0, client_rate=1.0, client_burst=5.0)
+    limiter.check("10.0.0.1", ["a"], now=0.0)
+    with pytest.raises(RateLimited) as info:
+        limiter.check("10.0.0.1", ["b", "a"], now=0.0)
+    assert info.value.scope == "sensor"
+    assert info.value.retry_after == pytest.approx(1.0)
+    # The rejected request consumed nothing: "b" and the client still have tokens
+    assert limiter.sensors.available("b", now=0.0) == 1.0
+    assert limiter.clients.available("10.0.0.1", now=0.0) == 4.0
+    limiter.check("10.0.0.1", ["b", None], now=0.0)
+    stats = limiter.stats()
+    assert stats["allowed"] == 2 and stats["limited"] == {"sensor": 1, "client": 0}
+
+    IngestLimiter(enabled=False, sensor_burst=0.0).check("x", ["a"] * 3, now=0.0)
+
+
+def test_idle_buckets_evicted_and_key_cap():
+    buckets = TokenBuckets(rate=1.0, burst=2.0, max_keys=3)
+    for key in ("a", "b", "c"):
+        buckets.consume(key, now=0.0)
+    buckets.consume("a", now=1.5)
+    assert buckets.sweep(now=1.5) == 2  # b and c are full again; a is not
+    assert len(buckets) == 1
+    assert buckets.available("b", now=1.5) == 2.0
+
+    for key in ("d", "e", "f"):  # reuses freed slots, then evicts the oldest at the cap
+        buckets.consume(key, now=1.6)
+    assert len(buckets) <= 3
+    assert len(buckets._tokens) == 3
+
+
+def test_concurrency_limiter_sheds():
+    limiter = ConcurrencyLimiter(limit=2)
+    limiter.acquire()
+    limiter.acquire()
+    with pytest.raises(Overloaded):
+        limiter.acquire()
+    limiter.release()
+    limiter.acquire()
+    assert limiter.stats() == {"limit": 2, "in_flight": 2, "peak": 2, "shed": 1}
+
+
+def test_zero_rate_retry_after_is_capped():
+    limiter = IngestLimiter(enabled=True, sensor_rate=0.0, sensor_burst=1.0, client_rate=10.0, client_burst=10.0)
+    limiter.check("c", ["s1"], now=0.0)
+    with pytest.raises(RateLimited) as exc:
+        limiter.check("c", ["s1"], now=100.0)
+    assert exc.value.retry_after == math.inf
+    assert retry_after_header(exc.value.retry_after) == {"Retry-After": str(RETRY_AFTER_MAX_SECONDS)}
+    assert retry_after_header(0.2) == {"Retry-After": "1"}
@@ -0,0 +1,100 @@
+"""Unit tests for the in-memory recent-readings rings (services.ring_buffer).
+
+Cases:
+- CP-RING-01: a warmed store answers covered windows exactly like the database
+- CP-RING-02: capacity eviction raises the coverage floor; older windows fall back
+- CP-RING-03: the memory cap drops whole rings of the least recently written sensor
+- CP-RING-04: upserts replace values in place instead of adding readings
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Sensor
+from services.readings import METRICS, aggregate, load_columns, summarize, to_micros
+from services.ring_buffer import RingStore, SensorRing
+from services.sensor_registry import SensorRegistry
+
+NOW = datetime(2026, 7, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def factory():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    make = sessionmaker(bind=engine)
+    session = make()
+    keys = SensorRegistry().resolve_many(session, ["r1", "r2"])
+    for minutes_ago in range(0, 180, 3):
+        for code, key in keys.items():
+            session.add(Sensor(
+                sensor_key=key, temperature=15 + minutes_ago / 10, humidity=40.0 + key,
+                ph=6.0 + (minutes_ago % 7) / 10, light=float(minutes_ago),
+                timestamp=NOW - timedelta(minutes=minutes_ago, seconds=30),
+            ))
+    session.add(Sensor(temperature=99.0, humidity=1.0, ph=7.0, light=5.0, timestamp=NOW - timedelta(minutes=1)))
+    session.commit()
+    session.close()
+    return make
+
+
+def test_warm_store_matches_database(factory):
+    store = RingStore(enabled=True, capacity=1000)
+    loaded = store.warm(factory, horizon_seconds=3600, now=NOW)
+    assert loaded == 2 * 20 + 1
+
+    db = factory()
+    for minutes in (15, 60):
+        start = NOW - timedelta(minutes=minutes)
+        assert summarize(store.aggregate(start)) == summarize(aggregate(db, start))
+        cols, expected = store.columns(start), load_columns(db, start)
+        assert list(cols.ts) == list(expected.ts)
+        assert list(cols.metrics["light"]) == list(expected.metrics["light"])
+    key = SensorRegistry().resolve(db, "r2")
+    start = NOW - timedelta(minutes=30)
+    assert summarize(store.aggregate(start, NOW, key)) == summarize(aggregate(db, start, NOW, key))
+
+    # Before the warm horizon, or without a start, the store declines
+    assert store.aggregate(NOW - timedelta(hours=2)) is None
+    assert store.aggregate(None) is None
+    assert store.stats()["hits"] == 5 and store.stats()["misses"] == 2
+    assert RingStore(enabled=True).aggregate(start) is None  # never warmed
+
+
+def test_capacity_eviction_raises_floor(factory):
+    store = RingStore(enabled=True, capacity=10)
+    store.warm(factory, horizon_seconds=3600, now=NOW)  # 20 readings/sensor -> 10 evicted each
+    assert store.aggregate(NOW - timedelta(minutes=59)) is None
+    recent = NOW - timedelta(minutes=20)
+    db = factory()
+    assert summarize(store.aggregate(recent)) == summarize(aggregate(db, recent))
+
+
+def test_memory_cap_drops_least_recent_ring():
+    ring_bytes = SensorRing(8).nbytes
+    store = RingStore(enabled=True, capacity=8, max_bytes=2 * ring_bytes)
+    store.covered_since = to_micros(NOW - timedelta(hours=1))
+    base = to_micros(NOW)
+    store.add(1, base, (1.0, 1.0, 1.0, 1.0))
+    store.add(2, base + 1, (2.0, 2.0, 2.0, 2.0))
+    store.add(3, base + 2, (3.0, 3.0, 3.0, 3.0))
+    stats = store.stats()
+    assert stats["sensors"] == 2 and stats["bytes"] <= stats["max_bytes"]
+    # Sensor 1 was dropped: windows touching its data are no longer covered
+    assert store.aggregate(NOW - timedelta(minutes=1)) is None
+    assert store.aggregate(NOW - timedelta(minutes=1), sensor_key=3) is not None
+    assert store.aggregate(NOW + timedelta(microseconds=1)) is not None
+
+
+def test_replace_updates_in_place():
+    store = RingStore(enabled=True, capacity=4)
+    store.covered_since = to_micros(NOW - timedelta(hours=1))
+    ts = to_micros(NOW)
+    store.add(1, ts, (20.0, 50.0, 6.5, 100.0))
+    store.add(1, ts, (25.0, 55.0, 7.0, 300.0), replace=True)
+    partials = store.aggregate(NOW - timedelta(minutes=1))
+    assert partials["temperature"].count == 1
+    assert [partials[m].total for m in METRICS] == [25.0, 55.0, 7.0, 300.0]
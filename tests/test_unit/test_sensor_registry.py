@@ -0,0 +1,52 @@
+"""Unit tests for services.sensor_registry (code <-> integer key cache)."""
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from services.sensor_registry import SensorRegistry
+
+
+def _session():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return sessionmaker(bind=engine)(), statements
+
+
+def test_resolve_creates_and_caches():
+    db, statements = _session()
+    reg = SensorRegistry()
+    first = reg.resolve(db, "S-1")
+    assert isinstance(first, int)
+    issued = len(statements)
+    # Cached: no further queries
+    assert reg.resolve(db, "S-1") == first
+    assert len(statements) == issued
+    assert reg.resolve(db, None) is None
+
+
+def test_resolve_many_and_reverse_lookup():
+    db, _ = _session()
+    reg = SensorRegistry()
+    keys = reg.resolve_many(db, ["a", "b", "a", None])
+    assert set(keys) == {"a", "b"} and keys["a"] != keys["b"]
+
+    # A fresh registry (another worker) finds the existing rows instead of duplicating
+    other = SensorRegistry()
+    assert other.resolve_many(db, ["a", "b"]) == keys
+    assert other.codes_for(db, keys.values()) == {v: k for k, v in keys.items()}
+
+
+def test_new_keys_cached_only_after_commit():
+    db, _ = _session()
+    reg = SensorRegistry()
+    key = reg.resolve(db, "S-new")
+    # Otra petición no debe ver una clave que aún puede deshacerse
+    assert reg._ids == {} and reg.resolve(db, "S-new") == key
+    db.rollback()
+    assert reg._ids == {}
+
+    key = reg.resolve(db, "S-new")
+    db.commit()
+    assert reg._ids == {"S-new": key} and reg._codes == {key: "S-new"}
@@ -0,0 +1,131 @@
+"""Unit tests for the gateway store-and-forward spool (sensor_simulator).
+
+Cases:
+- CP-COV-03a: the spool is FIFO, persistent across reopen and acks by sequence;
+  its spool id survives a reopen and changes when the file is recreated
+- CP-COV-03b: an outage keeps every reading; the backlog replays in order, once each
+- CP-COV-03c: 429 honours Retry-After; a rejected reading is isolated to the dead letter
+- CP-COV-03d: 409 (key reused with another body) re-keys the batch without backoff;
+  a second 409 dead-letters it and the spool keeps draining
+"""
+import requests
+
+from sensor_simulator import Spool, SpoolSender, generate_data
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None, text=""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+
+
+class FakeSession:
+    """Records delivered batches; `script` yields a response or exception per call."""
+
+    def __init__(self, script=None):
+        self.script = list(script or [])
+        self.delivered = []
+        self.keys = []
+
+    def post(self, url, json, timeout):
+        step = self.script.pop(0) if self.script else FakeResponse()
+        if isinstance(step, Exception):
+            raise step
+        if callable(step):
+            step = step(json)
+        if step.status_code == 200:
+            self.delivered.extend(json["readings"])
+            self.keys.append(json["idempotency_key"])
+        return step
+
+
+def _readings(n):
+    return [{**generate_data(), "light": float(i)} for i in range(n)]
+
+
+def test_spool_fifo_and_persistence(tmp_path):
+    path = str(tmp_path / "spool.db")
+    spool = Spool(path)
+    seqs = [spool.append(r) for r in _readings(5)]
+    assert seqs == sorted(seqs)
+    spool.ack(seqs[1])
+    spool.close()
+
+    reopened = Spool(path)
+    pending = reopened.peek(10)
+    assert [seq for seq, _ in pending] == seqs[2:]
+    assert [r["light"] for _, r in pending] == [2.0, 3.0, 4.0]
+    assert reopened.append(generate_data()) > seqs[-1]  # seq never reused
+    assert reopened.spool_id == spool.spool_id
+    reopened.close()
+
+    # Fichero borrado: seq vuelve a 1, pero con otro id las claves no se repiten
+    (tmp_path / "spool.db").unlink()
+    recreated = Spool(path)
+    assert recreated.append(generate_data()) == 1
+    assert recreated.spool_id != spool.spool_id
+    recreated.close()
+
+
+def test_outage_then_replay_in_order_without_loss(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    readings = _readings(25)
+    for r in readings:
+        spool.append(r)
+    waits = []
+    outage = [requests.ConnectionError("down")] * 3
+    session = FakeSession(outage)
+    sender = SpoolSender(spool, "http://api", "gw-1", batch_size=10, session=session, sleep=waits.append)
+
+    assert sender.drain() == 25
+    assert len(spool) == 0
+    assert session.delivered == readings  # order preserved, nothing lost or repeated
+    assert len(waits) == 3 and all(w <= 0.5 * 2 ** i for i, w in enumerate(waits))
+    sid = spool.spool_id
+    assert session.keys == [f"gw-1:{sid}:1-10", f"gw-1:{sid}:11-20", f"gw-1:{sid}:21-25"]
+    assert sender.failures == 0
+
+
+def test_retry_after_and_dead_letter(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    readings = _readings(4)
+    readings[2]["temperature"] = "not-a-number"
+    for r in readings:
+        spool.append(r)
+
+    def validate(body):
+        ok = all(isinstance(r["temperature"], float) for r in body["readings"])
+        return FakeResponse(200 if ok else 422, text="invalid temperature")
+
+    waits = []
+    session = FakeSession([FakeResponse(429, {"Retry-After": "7"})] + [validate] * 10)
+    sender = SpoolSender(spool, "http://api", "gw-2", batch_size=4, session=session, sleep=waits.append)
+
+    assert sender.drain() == 3
+    assert waits == [7.0]
+    assert session.delivered == [readings[0], readings[1], readings[3]]
+    assert len(spool) == 0
+    dead = spool._conn.execute("SELECT seq, error FROM dead_letter").fetchall()
+    assert dead == [(3, "invalid temperature")]
+
+
+def test_conflict_rekeys_then_dead_letters(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    readings = _readings(6)
+    for r in readings:
+        spool.append(r)
+    conflict = FakeResponse(409, text="idempotency_key reused")
+    waits = []
+    # Lote 1-3: 409 y acepta la clave nueva; lote 4-6: 409 dos veces
+    session = FakeSession([FakeResponse(503), conflict, FakeResponse(), conflict, conflict])
+    sender = SpoolSender(spool, "http://api", "gw-3", batch_size=3, session=session, sleep=waits.append)
+
+    assert sender.drain() == 3
+    assert len(waits) == 1  # solo el 503; el 409 no espera
+    assert session.delivered == readings[:3]
+    sid = spool.spool_id
+    assert session.keys[0].startswith(f"gw-3:{sid}:1-3:") and session.keys[0] != f"gw-3:{sid}:1-3"
+    assert len(spool) == 0 and sender.failures == 0
+    dead = spool._conn.execute("SELECT seq, error FROM dead_letter ORDER BY seq").fetchall()
+    assert dead == [(seq, "idempotency_key reused") for seq in (4, 5, 6)]
@@ -0,0 +1,148 @@
+"""Unit tests for the shared-memory aggregate segment (services.shared_aggregates).
+
+Cases:
+- CP-SHM-01: start() rebuilds per-sensor count/sum/min/max from the database and
+  add_many() keeps them equal to a fresh aggregate
+- CP-SHM-02: keys beyond the slot count disable global totals but not per-sensor reads
+- CP-SHM-03: stale sensors are not served until rebuild_stale() recomputes them
+- CP-SHM-04: a writer in another process is seen by readers here without torn reads,
+  together with the shared generation counter (seqlock and flock read modes)
+"""
+import multiprocessing
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from models import Sensor
+from services import shared_aggregates as shm
+from services.readings import METRICS, aggregate, to_micros
+from services.sensor_registry import SensorRegistry
+
+pytestmark = pytest.mark.skipif(shm.fcntl is None, reason="requires fcntl")
+
+NOW = datetime(2026, 7, 2, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def make_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def segment(tmp_path, make_session):
+    seg = shm.SharedAggregates(name=f"agrosense-test-{uuid.uuid4().hex[:12]}", slots=8, lock_dir=str(tmp_path))
+    seg.start(lambda: [make_session])
+    try:
+        yield seg
+    finally:
+        seg.unlink()
+
+
+def _add(session, key, minutes, temperature):
+    session.add(Sensor(sensor_key=key, temperature=temperature, humidity=50.0 + minutes, ph=6.5, light=10.0 * minutes,
+                       timestamp=NOW + timedelta(minutes=minutes)))
+
+
+def _rows(key, values):
+    return [(key, to_micros(NOW) + i, (t, 50.0, 6.5, 100.0)) for i, t in enumerate(values)]
+
+
+def _assert_matches(got, expected):
+    for m in METRICS:
+        assert got[m].count == expected[m].count
+        assert got[m].total == pytest.approx(expected[m].total)
+        assert (got[m].minimum, got[m].maximum) == (expected[m].minimum, expected[m].maximum)
+
+
+def test_rebuild_and_incremental_updates(tmp_path, make_session):
+    session = make_session()
+    registry = SensorRegistry()
+    a, b = registry.resolve(session, "shm-a"), registry.resolve(session, "shm-b")
+    for minutes in range(10):
+        _add(session, a, minutes, 20.0 + minutes)
+        _add(session, b, minutes, 30.0 - minutes)
+    _add(session, None, 0, 99.0)
+    session.commit()
+
+    seg = shm.SharedAggregates(name=f"agrosense-test-{uuid.uuid4().hex[:12]}", slots=8, lock_dir=str(tmp_path))
+    seg.start(lambda: [make_session])
+    try:
+        _assert_matches(seg.totals(), aggregate(session))
+        _assert_matches(seg.totals(a), aggregate(session, sensor_key=a))
+        assert set(seg.per_sensor()) == {a, b}
+
+        seg.add_many(_rows(a, [5.0, 45.0]) + _rows(None, [1.0]))
+        got = seg.totals(a)
+        assert got["temperature"].count == 12
+        assert (got["temperature"].minimum, got["temperature"].maximum) == (5.0, 45.0)
+        assert seg.totals()["temperature"].count == 24
+        assert seg.totals(7)["temperature"].count == 0
+        assert seg.stats()["reads"] == 6
+    finally:
+        seg.unlink()
+
+
+def test_overflow_keys(segment):
+    segment.add_many(_rows(3, [20.0]) + _rows(8, [21.0]))
+    assert segment.totals() is None
+    assert segment.per_sensor() is None
+    assert segment.totals(3)["temperature"].count == 1
+    assert segment.totals(8) is None
+    assert segment.stats()["overflow"] == 1
+
+
+def test_stale_sensor_until_rebuilt(segment, make_session):
+    session = make_session()
+    key = SensorRegistry().resolve(session, "shm-stale")
+    _add(session, key, 0, 10.0)
+    session.commit()
+    segment.add_many(_rows(key, [10.0]))
+    # La lectura se corrige en la BD: la suma en memoria ya no vale
+    session.query(Sensor).update({Sensor.temperature: 12.5})
+    session.commit()
+    segment.mark_stale([key])
+    assert segment.totals() is None and segment.totals(key) is None
+    segment.rebuild_stale()
+    assert segment.totals(key)["temperature"].total == 12.5
+    assert segment.stats()["fallbacks"] == 2
+
+
+def _writer(name, lock_dir, batches):
+    seg = shm.SharedAggregates(name=name, slots=8, lock_dir=lock_dir)
+    seg.start(lambda: [])
+    for i in range(batches):
+        seg.add_many([(1 + i % 3, i, (1.0, 1.0, 1.0, 1.0))] * 7)
+        seg.bump()
+    seg.close()
+
+
+@pytest.mark.parametrize("locked_reads", [False, True], ids=["seqlock", "flock"])
+def test_cross_process_writer(segment, locked_reads):
+    # flock: el modo por defecto fuera de x86-64
+    segment.locked_reads = locked_reads
+    token = segment.token()
+    ctx = multiprocessing.get_context("fork")
+    child = ctx.Process(target=_writer, args=(segment.name, segment.lock_dir, 300))
+    child.start()
+    seen = 0
+    while child.is_alive() or seen == 0:
+        totals = segment.totals()
+        if totals is None:
+            continue
+        t = totals["temperature"]
+        # Una copia a medias tendría count y sum de escrituras distintas
+        assert t.total == t.count
+        assert t.count % 7 == 0
+        seen += 1
+    child.join()
+    assert child.exitcode == 0
+    assert segment.totals()["light"].count == 2100
+    assert segment.token() != token
+    assert segment.token().endswith(".300")
@@ -0,0 +1,94 @@
+"""Unit tests for single-flight request coalescing (services.singleflight).
+
+Cases:
+- CP-SF-01: concurrent calls with the same key share one execution
+- CP-SF-02: an error reaches every waiter and is not remembered
+- CP-SF-03: cancelling the caller that started the work does not affect the others
+- CP-SF-04: different keys (e.g. a newer data generation) run separately
+"""
+import asyncio
+import threading
+
+import pytest
+
+from services.singleflight import SingleFlight
+
+
+def _blocking(release: threading.Event, calls: list, result):
+    def fn():
+        calls.append(1)
+        assert release.wait(5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fn
+
+
+async def _settle():
+    # Deja que las tareas lleguen a esperar el cálculo
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_calls_share_one_execution():
+    sf, calls, release = SingleFlight(), [], threading.Event()
+
+    async def main():
+        fn = _blocking(release, calls, {"count": 3})
+        waiters = [asyncio.create_task(sf.do(("k", 1), fn)) for _ in range(10)]
+        await _settle()
+        release.set()
+        return await asyncio.gather(*waiters)
+
+    results = asyncio.run(main())
+    assert calls == [1]
+    assert all(r is results[0] for r in results)
+    assert sf.stats() == {"in_flight": 0, "executions": 1, "coalesced": 9, "errors": 0}
+
+
+def test_errors_propagate_and_are_not_cached():
+    sf, calls, release = SingleFlight(), [], threading.Event()
+
+    async def main():
+        fn = _blocking(release, calls, RuntimeError("db down"))
+        waiters = [asyncio.create_task(sf.do("k", fn)) for _ in range(3)]
+        await _settle()
+        release.set()
+        outcomes = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(o, RuntimeError) for o in outcomes)
+        # La siguiente llamada vuelve a ejecutar
+        return await sf.do("k", lambda: "ok")
+
+    assert asyncio.run(main()) == "ok"
+    assert calls == [1]
+    assert sf.stats()["errors"] == 1 and sf.stats()["executions"] == 2
+
+
+def test_leader_cancellation_is_isolated():
+    sf, calls, release = SingleFlight(), [], threading.Event()
+
+    async def main():
+        fn = _blocking(release, calls, 42)
+        leader = asyncio.create_task(sf.do("k", fn))
+        await _settle()
+        follower = asyncio.create_task(sf.do("k", fn))
+        await _settle()
+        leader.cancel()
+        await _settle()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == 42
+    assert calls == [1]
+
+
+def test_distinct_keys_run_separately():
+    sf = SingleFlight()
+
+    async def main():
+        return await asyncio.gather(sf.do(("dashboard", 1), lambda: "old"), sf.do(("dashboard", 2), lambda: "new"))
+
+    assert asyncio.run(main()) == ["old", "new"]
+    assert sf.stats()["coalesced"] == 0
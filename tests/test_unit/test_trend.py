@@ -0,0 +1,103 @@
+"""Unit tests for the incremental per-sensor trend (services.trend).
+
+Cases:
+- CP-TREND-01: a perfectly linear series gives its exact slope, level and forecast
+- CP-TREND-02: incremental state matches a direct weighted least-squares fit,
+  including out-of-order readings
+- CP-TREND-03: old readings decay; the trend follows the recent regime
+- CP-TREND-04: backfill from the database rebuilds the same state as ingest
+"""
+import math
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from models import Sensor
+from services.readings import METRICS, to_micros
+from services.sensor_registry import SensorRegistry
+from services.trend import TrendStore
+
+NOW = datetime(2026, 7, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _values(temperature):
+    return (temperature, 50.0, 6.5, 300.0)
+
+
+def test_linear_series_exact():
+    store = TrendStore(half_life_seconds=3600, enabled=True)
+    for minutes in range(0, 121, 10):
+        ts = NOW + timedelta(minutes=minutes)
+        store.add(1, to_micros(ts), _values(20.0 + 0.05 * minutes))  # +3 °C/h
+
+    out = store.trend(1, "temperature", horizon_hours=0.5)
+    assert out["samples"] == 13
+    assert out["slope_per_hour"] == pytest.approx(3.0)
+    assert out["level"] == pytest.approx(26.0)
+    assert out["forecast"] == pytest.approx(27.5)
+    assert out["last_reading"] == (NOW + timedelta(minutes=120)).isoformat()
+    flat = store.trend(1, "humidity")
+    assert flat["slope_per_hour"] == pytest.approx(0.0) and flat["mean"] == pytest.approx(50.0)
+
+
+def test_matches_weighted_least_squares():
+    rng = np.random.default_rng(7)
+    hours = np.sort(rng.uniform(0, 5, 200))
+    temps = 18 + 0.8 * hours + rng.normal(0, 0.5, len(hours))
+    order = rng.permutation(len(hours))  # llegan desordenadas
+    store = TrendStore(half_life_seconds=1800, enabled=True)
+    for i in order:
+        store.add(7, to_micros(NOW + timedelta(hours=float(hours[i]))), _values(float(temps[i])))
+
+    decay = math.log(2) / 0.5
+    w = np.exp(-decay * (hours.max() - hours))
+    t = hours - hours.max()
+    slope, intercept = np.polyfit(t, temps, 1, w=np.sqrt(w))
+    out = store.trend(7, "temperature", horizon_hours=1)
+    assert out["slope_per_hour"] == pytest.approx(slope, abs=1e-3)
+    assert out["level"] == pytest.approx(intercept, abs=1e-3)
+    assert out["mean"] == pytest.approx(np.average(temps, weights=w), abs=1e-3)
+    assert out["effective_samples"] == pytest.approx(w.sum(), abs=0.01)
+
+
+def test_old_regime_decays():
+    store = TrendStore(half_life_seconds=600, enabled=True)
+    # Una hora enfriándose y después una hora calentándose
+    for minutes in range(0, 60, 2):
+        store.add(1, to_micros(NOW + timedelta(minutes=minutes)), _values(30.0 - 0.1 * minutes))
+    for minutes in range(60, 120, 2):
+        store.add(1, to_micros(NOW + timedelta(minutes=minutes)), _values(24.0 + 0.1 * (minutes - 60)))
+    out = store.trend(1, "temperature")
+    assert out["slope_per_hour"] > 5.0
+    assert store.trend(2, "temperature")["samples"] == 0
+
+
+def test_backfill_matches_ingest():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    make = sessionmaker(bind=engine)
+    session = make()
+    key = SensorRegistry().resolve(session, "tb-1")
+    live = TrendStore(half_life_seconds=3600, enabled=True)
+    for minutes in range(0, 240, 5):
+        ts = NOW - timedelta(minutes=minutes)
+        temp = 21.0 + math.sin(minutes / 30)
+        session.add(Sensor(sensor_key=key, temperature=temp, humidity=50.0, ph=6.5, light=300.0, timestamp=ts))
+        live.add(key, to_micros(ts), _values(temp))
+    session.add(Sensor(temperature=99.0, humidity=1.0, ph=7.0, light=5.0, timestamp=NOW))
+    session.commit()
+    session.close()
+
+    rebuilt = TrendStore(half_life_seconds=3600, enabled=True)
+    assert rebuilt.backfill(make, now=NOW) == 49
+    for metric in METRICS:
+        expected = live.trend(key, metric)
+        got = rebuilt.trend(key, metric)
+        assert got["samples"] == expected["samples"]
+        for field in ("mean", "slope_per_hour", "forecast"):
+            assert got[field] == pytest.approx(expected[field], abs=1e-3)
+    assert rebuilt.stats()["sensors"] == 1